@@ -1,3 +1,23 @@
-# ruff: noqa: F401
-from .agent import Agent
-from .model import Cookie, CookieJar, Score
+# The attributes are imported from their modules on first access, so that the
+# tools not calling an LLM don't import the langchain stack.
+from .registry import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    {
+        "Agent": ".agent",
+        "BatchBackend": ".batch",
+        "BatchJob": ".batch",
+        "LocalBatchBackend": ".batch",
+        "OpenAIBatchBackend": ".batch",
+        "get_batch_backend": ".batch",
+        "Cookie": ".model",
+        "CookieJar": ".model",
+        "Score": ".model",
+        "pool_stats": ".pool",
+        "SingleFlight": ".singleflight",
+        "single_flight_stats": ".singleflight",
+        "UsageTracker": ".usage",
+        "usage_tracker": ".usage",
+    },
+)
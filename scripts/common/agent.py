@@ -1,18 +1,41 @@
-import os
+import asyncio
+import hashlib
+import json
 import sqlite3
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Any, List, Type
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple, Type
 
-from langchain.globals import set_llm_cache
-from langchain_community.cache import SQLiteCache
-from langchain_community.chat_models import ChatTongyi
+from langchain.globals import get_llm_cache, set_llm_cache
+from langchain_core.exceptions import OutputParserException
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.load import dumps
+from langchain_core.messages import (
+    AIMessage,
+    HumanMessage,
+    SystemMessage,
+    convert_to_openai_messages,
+)
 from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.outputs import ChatGeneration
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai.chat_models import ChatOpenAI
+from langchain_core.runnables import RunnableConfig
 from loguru import logger
-from pydantic import BaseModel, Field, SecretStr
+from pydantic import BaseModel, Field
+
+from .batch import BATCH_STATUS_COMPLETED, BatchBackend, BatchJob
+from .hedge import Hedger, get_latency_window
+from .metrics import metrics
+from .output import JsonRepairOutputParser, get_response_format
+from .pool import (
+    get_chain,
+    get_model,
+    pool_monitor,
+)
+from .providers import providers
+from .singleflight import get_single_flight
+from .usage import get_cached_tokens, usage_tracker
 
 langchain_cache_dir = None
 
@@ -31,6 +54,29 @@ class Agent(BaseModel):
     batch_size: int = Field(
         default=50, description="The batch size for the language model invocation."
     )
+    metadata: dict = Field(
+        default={},
+        description="The metadata attached to every invocation, e.g. 'lang', 'jar' and 'stage', used for usage accounting.",
+    )
+    structured_output: bool = Field(
+        default=False,
+        description="Use the native structured output of the provider, i.e. a JSON schema or the JSON mode, instead of relying on the prompt only.",
+    )
+    prompt_layout: str = Field(
+        default="default",
+        description="'prefix_cache' keeps the system message byte-identical across the calls for the prompt caching of the providers.",
+    )
+    hedge: str = Field(
+        default="",
+        description="If set, calls slower than `hedge_percentile` are hedged: 'fallback' sends the same request to the fallback model, 'base' to another base model call; the first valid result wins.",
+    )
+    hedge_percentile: float = Field(
+        default=95.0,
+        description="The latency percentile of the recent base model calls after which a call is hedged.",
+    )
+    hedge_min_delay: float = Field(
+        default=2.0, description="The minimum delay in seconds before hedging."
+    )
 
     chain: Any = None
 
@@ -40,6 +86,20 @@ class Agent(BaseModel):
     ) -> None:
         super().__init__(**data)
 
+    def get_prefix(self, parser: PydanticOutputParser) -> str:
+        """The system message, static for a given prompt and schema."""
+        return (
+            self.prompt
+            + "\n"
+            + "Return only the JSON format result. The format should be as follows:"
+            + "\n"
+            + parser.get_format_instructions()
+        )
+
+    def get_prefix_fingerprint(self) -> str:
+        prefix = self.get_prefix(self.get_parser())
+        return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
     def get_prompt(self):
         return ChatPromptTemplate.from_messages(
             [
@@ -56,40 +116,106 @@ class Agent(BaseModel):
             ]
         )
 
+    def get_prompt_template(self, parser: PydanticOutputParser) -> ChatPromptTemplate:
+        if self.prompt_layout == "prefix_cache":
+            # The system message is not a template, so it stays byte-identical
+            # across the calls, and the variable content comes after it: the
+            # providers serve the repeated prefix from their prompt cache.
+            # With a prompt without variables, the messages are the same as
+            # the default ones: the layout only guarantees it.
+            return ChatPromptTemplate.from_messages(
+                [
+                    SystemMessage(content=self.get_prefix(parser)),
+                    ("user", "{content}"),
+                    MessagesPlaceholder("last_output", optional=True),
+                ]
+            )
+        return self.get_prompt().partial(
+            format_instructions=parser.get_format_instructions()
+        )
+
+    def get_chain_key(self) -> tuple:
+        return (
+            self.prompt,
+            self.cls,
+            self.base_model,
+            self.fallback_model,
+            self.structured_output,
+            self.prompt_layout,
+        )
+
+    def get_parser(self) -> PydanticOutputParser:
+        return JsonRepairOutputParser(pydantic_object=self.cls)
+
+    def get_model_kwargs(self, model_name: str) -> dict:
+        """The invocation kwargs of the model, i.e. the `response_format` of the
+        provider for the structured output."""
+        if not self.structured_output:
+            return {}
+        response_format = get_response_format(model_name, self.cls)
+        return {"response_format": response_format} if response_format else {}
+
+    def get_chat_model(self, model_name: str):
+        model = get_model(model_name)
+        kwargs = self.get_model_kwargs(model_name)
+        if kwargs:
+            model = model.bind(**kwargs)
+        return model.with_config(metadata={"model": model_name})
+
     def get_chain(self):
         if not self.chain:
-            # llm = load_model(model_name=self.base_model).with_fallbacks(
-            #     [load_model(model_name=self.fallback_model)]
-            # )
-            parser = PydanticOutputParser(pydantic_object=self.cls)
-            prompt_template = self.get_prompt().partial(
-                format_instructions=parser.get_format_instructions()
-            )
-            model_base = load_model(model_name=self.base_model)
-            model_fallback = load_model(model_name=self.fallback_model)
+            # the chains are shared by all agents with the same key
+            self.chain = get_chain(self.get_chain_key(), self.create_chain)
+        return self.chain
 
-            self.chain = (prompt_template | model_base | parser).with_fallbacks(
-                [
-                    (
-                        # retry once more with the base model
-                        self.exception_to_messages
-                        | prompt_template
-                        | model_base
-                        | parser
-                    ),
-                    (
-                        # retry once more with the fallback model
-                        self.chain_logger | prompt_template | model_fallback | parser
-                    ),
-                ],
-                exception_key="exception",
+    def get_hedge_chain(self):
+        model_name = (
+            self.fallback_model if self.hedge == "fallback" else self.base_model
+        )
+        return get_chain(
+            self.get_chain_key() + ("hedge", model_name),
+            lambda: self.create_hedge_chain(model_name),
+        )
+
+    def create_hedge_chain(self, model_name: str):
+        parser = self.get_parser()
+        prompt_template = self.get_prompt_template(parser)
+        return prompt_template | self.get_chat_model(model_name) | parser
+
+    def create_chain(self):
+        # llm = load_model(model_name=self.base_model).with_fallbacks(
+        #     [load_model(model_name=self.fallback_model)]
+        # )
+        parser = self.get_parser()
+        prompt_template = self.get_prompt_template(parser)
+        model_base = self.get_chat_model(self.base_model)
+        model_fallback = self.get_chat_model(self.fallback_model)
+        if self.prompt_layout == "prefix_cache":
+            logger.debug(
+                f"Agent({self.base_model}): prompt prefix {self.get_prefix_fingerprint()}"
             )
-        return self.chain
 
-    def exception_to_messages(self, inputs: dict) -> dict:
+        return (prompt_template | model_base | parser).with_fallbacks(
+            [
+                (
+                    # retry once more with the base model
+                    self.exception_to_messages | prompt_template | model_base | parser
+                ),
+                (
+                    # retry once more with the fallback model
+                    self.chain_logger | prompt_template | model_fallback | parser
+                ),
+            ],
+            exception_key="exception",
+        )
+
+    def exception_to_messages(self, inputs: dict, config: RunnableConfig) -> dict:
         logger.warning(
             f"Agent({self.base_model}) error: {inputs['exception']} for input: {inputs['content']}"
         )
+        metadata = {**config.get("metadata", {}), "model": self.base_model}
+        if isinstance(inputs["exception"], OutputParserException):
+            usage_tracker.record(metadata, "parse_failures")
         if "DataInspectionFailed" in str(inputs["exception"]):
             # should not retried for certain errors
             raise inputs["exception"]
@@ -104,25 +230,304 @@ class Agent(BaseModel):
             ),
         ]
         inputs["last_output"] = messages
+        usage_tracker.record(metadata, "retries")
         return inputs
 
-    def chain_logger(self, inputs: dict) -> dict:
+    def chain_logger(self, inputs: dict, config: RunnableConfig) -> dict:
         logger.debug(f"Try fallback model ({self.fallback_model})")
+        metadata = {**config.get("metadata", {}), "model": self.base_model}
+        if isinstance(inputs.get("exception"), OutputParserException):
+            usage_tracker.record(metadata, "parse_failures")
+        usage_tracker.record(metadata, "fallbacks")
         return inputs
 
+    def get_hedger(self) -> Optional[Hedger]:
+        if not self.hedge:
+            return None
+        return Hedger(
+            get_latency_window(self.base_model),
+            percentile=self.hedge_percentile,
+            min_delay=self.hedge_min_delay,
+            # the primary and the secondary call of every call in flight
+            max_workers=2 * self.batch_size,
+        )
+
+    def record_hedge(self, hedged: bool, won: bool):
+        metadata = {**self.metadata, "model": self.base_model}
+        if hedged:
+            usage_tracker.record(metadata, "hedges")
+        if won:
+            usage_tracker.record(metadata, "hedge_wins")
+
+    def record_item(self, result: Any):
+        metrics.inc(
+            "agent_items",
+            stage=self.metadata.get("stage", ""),
+            status="error" if isinstance(result, Exception) else "ok",
+        )
+
+    def get_config(self) -> RunnableConfig:
+        return {"callbacks": [usage_tracker, pool_monitor], "metadata": self.metadata}
+
     def process(self, contents: List[str]) -> List:
-        inputs = [{"content": content} for content in contents]
-        results = []
-        # process the inputs
-        # logger.debug(f"Agent.process(): {len(inputs)} contents")
-        for i in range(0, len(inputs), self.batch_size):
-            batch_inputs = inputs[i : i + self.batch_size]
-            batch_results = self.get_chain().batch(batch_inputs, return_exceptions=True)
-            print("." * len(batch_results), end="", flush=True)
-            results.extend(batch_results)
-        # return the results
+        results = [None] * len(contents)
+        for i, result in self.process_stream(contents):
+            results[i] = result
         return results
 
+    def process_stream(self, contents: Iterable[str]) -> Iterator[Tuple[int, Any]]:
+        """Yields (index, result) as the calls complete, in completion order.
+
+        At most `batch_size` calls are in flight, and the contents are consumed
+        lazily, so only the in-flight inputs are held in memory. Like
+        `batch(..., return_exceptions=True)`, a failed call yields its exception.
+        """
+        chain = self.get_chain()
+        config = self.get_config()
+        hedger = self.get_hedger()
+        hedge_chain = self.get_hedge_chain() if hedger else None
+        flight = get_single_flight("agent")
+
+        def call(inputs: dict):
+            if not hedger:
+                return chain.invoke(inputs, config=config)
+            result, hedged, won = hedger.invoke(
+                lambda: chain.invoke(inputs, config=config),
+                lambda: hedge_chain.invoke(inputs, config=config),
+            )
+            self.record_hedge(hedged, won)
+            return result
+
+        def invoke(content: str):
+            inputs = {"content": content}
+            try:
+                # the same content requested by another agent at the same time,
+                # e.g. a quote in two jars, is only sent once
+                result, shared = flight.do(
+                    (self.get_chain_key(), content), lambda: call(inputs)
+                )
+                if shared:
+                    usage_tracker.record(
+                        {**self.metadata, "model": self.base_model}, "coalesced"
+                    )
+                return result
+            except Exception as e:
+                return e
+
+        contents = iter(contents)
+        try:
+            with ThreadPoolExecutor(max_workers=self.batch_size) as executor:
+                pending = {}
+                index = 0
+                for content in contents:
+                    pending[executor.submit(invoke, content)] = index
+                    index += 1
+                    if len(pending) >= self.batch_size:
+                        break
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        i = pending.pop(future)
+                        result = future.result()
+                        self.record_item(result)
+                        yield i, result
+                        # keep the window full
+                        for content in contents:
+                            pending[executor.submit(invoke, content)] = index
+                            index += 1
+                            break
+        finally:
+            if hedger:
+                hedger.shutdown()
+
+    async def aprocess_stream(
+        self, contents: Iterable[str]
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """The async version of `process_stream`."""
+        chain = self.get_chain()
+        config = self.get_config()
+        hedger = self.get_hedger()
+        hedge_chain = self.get_hedge_chain() if hedger else None
+        flight = get_single_flight("agent")
+
+        async def call(inputs: dict):
+            if not hedger:
+                return await chain.ainvoke(inputs, config=config)
+            result, hedged, won = await hedger.ainvoke(
+                lambda: chain.ainvoke(inputs, config=config),
+                lambda: hedge_chain.ainvoke(inputs, config=config),
+            )
+            self.record_hedge(hedged, won)
+            return result
+
+        async def invoke(i: int, content: str):
+            inputs = {"content": content}
+            try:
+                result, shared = await flight.ado(
+                    (self.get_chain_key(), content), lambda: call(inputs)
+                )
+                if shared:
+                    usage_tracker.record(
+                        {**self.metadata, "model": self.base_model}, "coalesced"
+                    )
+                return i, result
+            except Exception as e:
+                return i, e
+
+        contents = iter(contents)
+        pending = set()
+        for i, content in enumerate(contents):
+            pending.add(asyncio.create_task(invoke(i, content)))
+            if len(pending) >= self.batch_size:
+                break
+        index = len(pending)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                i, result = task.result()
+                self.record_item(result)
+                yield i, result
+                for content in contents:
+                    pending.add(asyncio.create_task(invoke(index, content)))
+                    index += 1
+                    break
+
+    def submit_batch_file(self, contents: List[str], backend: BatchBackend) -> BatchJob:
+        """Submits the contents to a provider batch API instead of interactive
+        calls; the cached responses are not submitted again. The batch is
+        collected by `collect_batch_file` once the backend is done with it."""
+        parser = self.get_parser()
+        prompt_template = self.get_prompt_template(parser)
+        model = get_model(self.base_model)
+        model_kwargs = self.get_model_kwargs(self.base_model)
+        llm_string = model._get_llm_string(**model_kwargs)
+        llm_cache = get_llm_cache()
+        metadata = {**self.metadata, "model": self.base_model}
+
+        job = BatchJob(
+            contents=contents,
+            results=[None] * len(contents),
+            poll_interval=backend.poll_interval,
+        )
+        requests = []
+        for i, content in enumerate(contents):
+            messages = prompt_template.format_messages(content=content)
+            prompt = dumps(messages)
+            cached = llm_cache.lookup(prompt, llm_string) if llm_cache else None
+            if cached:
+                try:
+                    job.results[i] = parser.parse(cached[0].text)
+                    usage_tracker.record(metadata, "calls")
+                    usage_tracker.record(metadata, "cache_hits")
+                    continue
+                except Exception:
+                    pass
+            if hasattr(model, "_get_request_payload"):
+                body = model._get_request_payload(messages, **model_kwargs)
+            else:
+                body = {
+                    "model": self.base_model.split(":", 1)[1],
+                    "messages": convert_to_openai_messages(messages),
+                    **model_kwargs,
+                }
+            job.prompts[str(i)] = prompt
+            requests.append(
+                {
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                }
+            )
+
+        if requests:
+            batch_dir = Path(backend.work_dir)
+            batch_dir.mkdir(parents=True, exist_ok=True)
+            job.name = uuid.uuid4().hex
+            request_file = batch_dir / f"{job.name}.requests.jsonl"
+            with open(request_file, "w", encoding="utf-8") as f:
+                for request in requests:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+            job.batch_id = backend.submit(str(request_file))
+            logger.info(
+                f"Agent({self.base_model}): submitted batch {job.batch_id} with {len(requests)} requests"
+            )
+        return job
+
+    def collect_batch_file(
+        self, job: BatchJob, backend: BatchBackend, status: str
+    ) -> List:
+        """The results of a batch submitted by `submit_batch_file`, given its
+        final `status`. The batch responses are written into the llm cache,
+        and the requests failed in the batch are processed interactively with
+        the usual retry and fallback chain."""
+        parser = self.get_parser()
+        model = get_model(self.base_model)
+        llm_string = model._get_llm_string(**self.get_model_kwargs(self.base_model))
+        llm_cache = get_llm_cache()
+        metadata = {**self.metadata, "model": self.base_model}
+        results = list(job.results)
+
+        if job.batch_id and status == BATCH_STATUS_COMPLETED:
+            result_file = Path(backend.work_dir) / f"{job.name}.results.jsonl"
+            backend.download(job.batch_id, str(result_file))
+            with open(result_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    response = item.get("response") or {}
+                    if item.get("error") or response.get("status_code") != 200:
+                        continue
+                    body = response["body"]
+                    usage = body.get("usage") or {}
+                    usage_tracker.record(metadata, "calls")
+                    usage_tracker.record(
+                        metadata, "prompt_tokens", usage.get("prompt_tokens", 0)
+                    )
+                    usage_tracker.record(
+                        metadata,
+                        "completion_tokens",
+                        usage.get("completion_tokens", 0),
+                    )
+                    usage_tracker.record(
+                        metadata, "cached_tokens", get_cached_tokens(usage)
+                    )
+                    text = body["choices"][0]["message"]["content"]
+                    try:
+                        results[int(item["custom_id"])] = parser.parse(text)
+                    except Exception:
+                        usage_tracker.record(metadata, "parse_failures")
+                        continue
+                    if llm_cache:
+                        llm_cache.update(
+                            job.prompts[item["custom_id"]],
+                            llm_string,
+                            [ChatGeneration(message=AIMessage(content=text))],
+                        )
+        elif job.batch_id:
+            logger.error(f"Agent({self.base_model}): batch {job.batch_id} {status}")
+
+        failed = [i for i, result in enumerate(results) if result is None]
+        if failed:
+            logger.debug(
+                f"Agent({self.base_model}): {len(failed)} batch requests failed, processing interactively"
+            )
+            retried = self.process([job.contents[i] for i in failed])
+            for i, result in zip(failed, retried):
+                results[i] = result
+        return results
+
+    def process_by_batch_file(self, contents: List[str], backend: BatchBackend) -> List:
+        """Process the contents through a provider batch API, waiting in place
+        for the batch, see `submit_batch_file` and `collect_batch_file`."""
+        job = self.submit_batch_file(contents, backend)
+        status = backend.wait(job.batch_id) if job.batch_id else BATCH_STATUS_COMPLETED
+        return self.collect_batch_file(job, backend, status)
+
     @staticmethod
     def init_cache(cache_dir: str = None):
         global langchain_cache_dir
@@ -133,11 +538,15 @@ class Agent(BaseModel):
         else:
             langchain_cache_dir = str(Path(cache_dir) / "langchain.db")
         logger.debug(f"Langchain cache: {langchain_cache_dir}")
+        from langchain_community.cache import SQLiteCache
+
         set_llm_cache(SQLiteCache(database_path=langchain_cache_dir))
 
     @staticmethod
     def remove_from_cache(pattern: str):
         global langchain_cache_dir
+        if not langchain_cache_dir:
+            return
         with sqlite3.connect(langchain_cache_dir) as conn:
             try:
                 c = conn.cursor()
@@ -160,32 +569,5 @@ class Agent(BaseModel):
 
 
 def load_model(model_name: str = "openai:gpt-4o") -> BaseChatModel:
-    provider, model_name = model_name.split(":")
-    # logger.info(f"model: {provider} : {model_name}")
-    m: BaseChatModel
-    if provider == "openai":
-        # extra_kwargs = self.__get_extra_kwargs()
-        # model_name = "gpt-4o-mini"
-        m = ChatOpenAI(model=model_name)
-    elif provider == "tongyi":
-        import dashscope  # type: ignore # noqa: F401
-
-        # model_name = "qwen-plus"
-        m = ChatTongyi(model=model_name, api_key=None)
-    elif provider == "moonshot":
-        m = ChatOpenAI(
-            model=model_name,
-            api_key=SecretStr(os.environ.get("MOONSHOT_API_KEY") or ""),
-            base_url="https://api.moonshot.cn/v1",
-        )
-        # https://github.com/langchain-ai/langchain/issues/27058
-        # m = MoonshotChat(model=model_name)
-    elif provider == "deepseek":
-        m = ChatOpenAI(
-            model=model_name,
-            api_key=SecretStr(os.environ.get("DEEPSEEK_API_KEY") or ""),
-            base_url="https://api.deepseek.com",
-        )
-    # elif provider == "anthropic":
-    #     m = ChatAnthropic(model_name=model_name, timeout=60, stop=None)
-    return m
+    provider, model_name = model_name.split(":", 1)
+    return providers.get(provider)(model_name)
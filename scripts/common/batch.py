@@ -0,0 +1,210 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
+BATCH_STATUS_COMPLETED = "completed"
+BATCH_STATUS_IN_PROGRESS = "in_progress"
+BATCH_STATUS_FAILED = "failed"
+
+
+class BatchJob(BaseModel):
+    """A batch submitted by `Agent.submit_batch_file`, to collect with
+    `Agent.collect_batch_file` once its backend is done with it."""
+
+    batch_id: str = Field(
+        default="", description="The batch id, empty if nothing was submitted."
+    )
+    name: str = Field(default="", description="The name of the request file.")
+    contents: List[str] = Field(default=[], description="The contents to process.")
+    results: List[Any] = Field(
+        default=[], description="The cached results, None for the submitted ones."
+    )
+    prompts: Dict[str, str] = Field(
+        default={}, description="The serialized prompts, by request id."
+    )
+    poll_interval: float = Field(
+        default=60, description="The poll interval of the backend in seconds."
+    )
+
+
+class BatchBackend(BaseModel):
+    """Submits a JSONL file of chat completion requests (OpenAI batch format) and
+    returns a JSONL file of responses once the provider has processed it."""
+
+    work_dir: str = Field(
+        default=".cache/batches",
+        description="The directory for the request and result files.",
+    )
+    poll_interval: float = Field(
+        default=60, description="The interval between status polls in seconds."
+    )
+
+    def submit(self, request_file: str) -> str:
+        raise NotImplementedError
+
+    def poll(self, batch_id: str) -> str:
+        raise NotImplementedError
+
+    def download(self, batch_id: str, result_file: str):
+        raise NotImplementedError
+
+    def wait(self, batch_id: str) -> str:
+        """Polls the batch until it is no longer in progress, returns its status."""
+        while (status := self.poll(batch_id)) == BATCH_STATUS_IN_PROGRESS:
+            time.sleep(self.poll_interval)
+        return status
+
+
+class LocalBatchBackend(BatchBackend):
+    """Simulates a provider batch API on the local file system, processing the
+    requests in a background thread with the model given by `model_name`."""
+
+    model_name: str = Field(
+        default="openai:gpt-4o-mini",
+        description="The model processing the requests. format: 'provider:model_name'",
+    )
+    poll_interval: float = Field(default=0.1)
+    max_workers: int = Field(default=8, description="The number of request workers.")
+
+    def get_batch_dir(self, batch_id: str) -> Path:
+        return Path(self.work_dir) / "local" / batch_id
+
+    def set_status(self, batch_id: str, status: str):
+        status_file = self.get_batch_dir(batch_id) / "status"
+        status_file.write_text(status, encoding="utf-8")
+
+    def submit(self, request_file: str) -> str:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch_dir = self.get_batch_dir(batch_id)
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(request_file, batch_dir / "requests.jsonl")
+        self.set_status(batch_id, BATCH_STATUS_IN_PROGRESS)
+        threading.Thread(target=self.run, args=(batch_id,), daemon=True).start()
+        return batch_id
+
+    def process_request(self, request: dict) -> dict:
+        from langchain_core.messages import convert_to_messages
+
+        from .pool import get_model
+
+        try:
+            model = get_model(self.model_name)
+            message = model.invoke(convert_to_messages(request["body"]["messages"]))
+            body = {
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": message.content},
+                        "finish_reason": "stop",
+                    }
+                ]
+            }
+            return {
+                "id": f"response_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": body},
+                "error": None,
+            }
+        except Exception as e:
+            return {
+                "id": f"response_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": None,
+                "error": {"code": type(e).__name__, "message": str(e)},
+            }
+
+    def run(self, batch_id: str):
+        batch_dir = self.get_batch_dir(batch_id)
+        try:
+            with open(batch_dir / "requests.jsonl", "r", encoding="utf-8") as f:
+                requests = [json.loads(line) for line in f if line.strip()]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                responses = list(executor.map(self.process_request, requests))
+            with open(batch_dir / "results.jsonl", "w", encoding="utf-8") as f:
+                for response in responses:
+                    f.write(json.dumps(response, ensure_ascii=False) + "\n")
+            self.set_status(batch_id, BATCH_STATUS_COMPLETED)
+        except Exception as e:
+            logger.error(f"LocalBatchBackend: batch {batch_id} failed: {e}")
+            self.set_status(batch_id, BATCH_STATUS_FAILED)
+
+    def poll(self, batch_id: str) -> str:
+        status_file = self.get_batch_dir(batch_id) / "status"
+        return status_file.read_text(encoding="utf-8").strip()
+
+    def download(self, batch_id: str, result_file: str):
+        shutil.copyfile(self.get_batch_dir(batch_id) / "results.jsonl", result_file)
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """The OpenAI batch API, also offered by OpenAI compatible providers."""
+
+    base_url: Optional[str] = Field(default=None, description="The API base URL.")
+    api_key_env: str = Field(
+        default="OPENAI_API_KEY", description="The environment variable of the API key."
+    )
+
+    def get_client(self):
+        import openai
+
+        return openai.OpenAI(
+            api_key=os.environ.get(self.api_key_env), base_url=self.base_url
+        )
+
+    def submit(self, request_file: str) -> str:
+        client = self.get_client()
+        with open(request_file, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> str:
+        batch = self.get_client().batches.retrieve(batch_id)
+        match batch.status:
+            case "completed":
+                return BATCH_STATUS_COMPLETED
+            case "failed" | "expired" | "cancelled":
+                return BATCH_STATUS_FAILED
+            case _:
+                return BATCH_STATUS_IN_PROGRESS
+
+    def download(self, batch_id: str, result_file: str):
+        client = self.get_client()
+        batch = client.batches.retrieve(batch_id)
+        with open(result_file, "wb") as f:
+            if batch.output_file_id:
+                f.write(client.files.content(batch.output_file_id).content)
+            if batch.error_file_id:
+                f.write(client.files.content(batch.error_file_id).content)
+
+
+def get_batch_backend(name: str, model_name: str, work_dir: str) -> BatchBackend:
+    provider = model_name.split(":")[0]
+    match name, provider:
+        case "local", _:
+            return LocalBatchBackend(model_name=model_name, work_dir=work_dir)
+        case "openai", "openai":
+            return OpenAIBatchBackend(work_dir=work_dir)
+        case "openai", "tongyi":
+            return OpenAIBatchBackend(
+                work_dir=work_dir,
+                base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                api_key_env="DASHSCOPE_API_KEY",
+            )
+        case _:
+            raise ValueError(
+                f"Batch backend '{name}' is not available for model '{model_name}'"
+            )
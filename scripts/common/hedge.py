@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# The recent latencies per model, shared by all the hedgers of the process.
+lock = threading.Lock()
+windows: Dict[str, "LatencyWindow"] = {}
+
+
+class LatencyWindow:
+    """A rolling window of the latest call latencies of a model."""
+
+    def __init__(self, size: int = 200):
+        self.lock = threading.Lock()
+        self.latencies: deque = deque(maxlen=size)
+
+    def add(self, latency: float):
+        with self.lock:
+            self.latencies.append(latency)
+
+    def __len__(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * p / 100))
+        return latencies[index]
+
+
+def get_latency_window(model_name: str) -> LatencyWindow:
+    with lock:
+        if model_name not in windows:
+            windows[model_name] = LatencyWindow()
+        return windows[model_name]
+
+
+class Hedger:
+    """Hedges slow calls: when the primary call is still running after the
+    `percentile` latency of the recent primary calls, the secondary call is
+    issued as well, and the first successful result wins.
+
+    No hedge is issued until `min_samples` latencies are known, and never
+    before `min_delay` seconds, so cache hits can't make the threshold too
+    eager. A running thread can't be interrupted, so in `invoke` the losing
+    call is cancelled only if it hasn't started yet, otherwise its result is
+    dropped; in `ainvoke` the losing task is cancelled.
+    """
+
+    def __init__(
+        self,
+        window: LatencyWindow,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        min_delay: float = 2.0,
+        max_workers: int = 100,
+    ):
+        self.window = window
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedge"
+        )
+
+    def get_delay(self) -> Optional[float]:
+        if len(self.window) < self.min_samples:
+            return None
+        return max(self.min_delay, self.window.percentile(self.percentile) or 0.0)
+
+    def track(self, future: Future, start: float):
+        def done_callback(f: Future):
+            if not f.cancelled() and f.exception() is None:
+                self.window.add(time.perf_counter() - start)
+
+        future.add_done_callback(done_callback)
+
+    def invoke(
+        self, primary: Callable[[], Any], secondary: Callable[[], Any]
+    ) -> Tuple[Any, bool, bool]:
+        """Returns (result, hedged, won), `won` if the result is the secondary's."""
+        delay = self.get_delay()
+        if delay is None:
+            start = time.perf_counter()
+            result = primary()
+            self.window.add(time.perf_counter() - start)
+            return result, False, False
+
+        first = self.executor.submit(primary)
+        self.track(first, time.perf_counter())
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result(), False, False
+
+        second = self.executor.submit(secondary)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                return future.result(), True, future is second
+        raise error
+
+    async def ainvoke(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        secondary: Callable[[], Awaitable[Any]],
+    ) -> Tuple[Any, bool, bool]:
+        """The async version of `invoke`."""
+        delay = self.get_delay()
+        start = time.perf_counter()
+        first = asyncio.ensure_future(primary())
+
+        def done_callback(task: asyncio.Future):
+            if not task.cancelled() and task.exception() is None:
+                self.window.add(time.perf_counter() - start)
+
+        first.add_done_callback(done_callback)
+        if delay is None:
+            return await first, False, False
+        done, _ = await asyncio.wait([first], timeout=delay)
+        if done:
+            return first.result(), False, False
+
+        second = asyncio.ensure_future(secondary())
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                return task.result(), True, task is second
+        raise error
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,329 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    owner TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    key: str
+    payload: dict
+    status: str
+    attempts: int = 0
+    max_attempts: int = 3
+    owner: Optional[str] = None
+    lease_until: Optional[float] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+    @staticmethod
+    def from_row(row: sqlite3.Row) -> "Job":
+        data = dict(row)
+        data["payload"] = json.loads(data["payload"])
+        data["result"] = json.loads(data["result"]) if data["result"] else None
+        data.pop("updated_at", None)
+        return Job(**data)
+
+
+def get_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class JobQueue:
+    """A durable queue of jobs in a SQLite file, shared by the processes of
+    this machine or of others mounting the same file system.
+
+    A worker leases a job for `lease_seconds`, and extends the lease with
+    heartbeats while it runs. If the worker dies, the lease expires and the
+    job is leased again by another worker, up to `max_attempts` times; a job
+    failing with an exception is retried the same way.
+
+    The rollback journal is used instead of WAL, which doesn't work on network
+    file systems.
+    """
+
+    def __init__(self, filename: str, lease_seconds: float = 300):
+        self.filename = filename
+        self.lease_seconds = lease_seconds
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per operation, so the queue can be used from any thread
+        db = sqlite3.connect(self.filename, timeout=60, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.connect() as db:
+            # takes the write lock now, so two workers can't lease the same job
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def put(self, kind: str, key: str, payload: dict, max_attempts: int = 3) -> int:
+        """Adds the job, or resets the job with the same key, unless it is
+        leased by a worker."""
+        with self.transaction() as db:
+            db.execute(
+                """
+                INSERT INTO jobs (kind, key, payload, status, max_attempts, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    kind = excluded.kind,
+                    payload = excluded.payload,
+                    status = excluded.status,
+                    attempts = 0,
+                    max_attempts = excluded.max_attempts,
+                    owner = NULL,
+                    lease_until = NULL,
+                    result = NULL,
+                    error = NULL,
+                    updated_at = excluded.updated_at
+                WHERE jobs.status != ?
+                """,
+                (
+                    kind,
+                    key,
+                    json.dumps(payload, ensure_ascii=False),
+                    STATUS_PENDING,
+                    max_attempts,
+                    time.time(),
+                    STATUS_LEASED,
+                ),
+            )
+            row = db.execute("SELECT id FROM jobs WHERE key = ?", (key,)).fetchone()
+            return row["id"]
+
+    def lease(self, owner: str, kinds: Optional[List[str]] = None) -> Optional[Job]:
+        """Leases the oldest pending job, or a job whose lease expired."""
+        now = time.time()
+        query = (
+            "SELECT * FROM jobs WHERE (status = ? OR (status = ? AND lease_until < ?))"
+        )
+        params: List[Any] = [STATUS_PENDING, STATUS_LEASED, now]
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        with self.transaction() as db:
+            for row in db.execute(query + " ORDER BY id", params).fetchall():
+                if row["attempts"] >= row["max_attempts"]:
+                    # the workers leasing it died every time
+                    db.execute(
+                        "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                        (STATUS_FAILED, "lease expired", now, row["id"]),
+                    )
+                    continue
+                db.execute(
+                    """
+                    UPDATE jobs SET status = ?, owner = ?, lease_until = ?,
+                        attempts = attempts + 1, updated_at = ?
+                    WHERE id = ?
+                    """,
+                    (STATUS_LEASED, owner, now + self.lease_seconds, now, row["id"]),
+                )
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE id = ?", (row["id"],)
+                ).fetchone()
+                return Job.from_row(row)
+        return None
+
+    def heartbeat(self, job: Job) -> bool:
+        """Extends the lease of the job, False if the worker lost it."""
+        with self.transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                (
+                    time.time() + self.lease_seconds,
+                    time.time(),
+                    job.id,
+                    job.owner,
+                    STATUS_LEASED,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job: Job, result: Any = None) -> bool:
+        with self.transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                (
+                    STATUS_DONE,
+                    json.dumps(result, ensure_ascii=False),
+                    time.time(),
+                    job.id,
+                    job.owner,
+                    STATUS_LEASED,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Releases the job for a retry, or fails it after `max_attempts`."""
+        with self.transaction() as db:
+            cursor = db.execute(
+                """
+                UPDATE jobs SET
+                    status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END,
+                    owner = NULL, lease_until = NULL, error = ?, updated_at = ?
+                WHERE id = ? AND owner = ? AND status = ?
+                """,
+                (
+                    STATUS_PENDING,
+                    STATUS_FAILED,
+                    error,
+                    time.time(),
+                    job.id,
+                    job.owner,
+                    STATUS_LEASED,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def get(self, key: str) -> Optional[Job]:
+        with self.connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE key = ?", (key,)).fetchone()
+            return Job.from_row(row) if row else None
+
+    def jobs(self, kind: str = "", status: str = "") -> List[Job]:
+        query, params = "SELECT * FROM jobs WHERE 1 = 1", []
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        with self.connect() as db:
+            return [
+                Job.from_row(row) for row in db.execute(query + " ORDER BY id", params)
+            ]
+
+    def counts(self) -> Dict[str, int]:
+        with self.connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            return {status: count for status, count in rows}
+
+    def wait(
+        self, keys: List[str], poll: float = 5.0, on_poll: Optional[Callable] = None
+    ):
+        """Waits until the jobs are done or failed."""
+        while True:
+            with self.connect() as db:
+                row = db.execute(
+                    f"SELECT COUNT(*) FROM jobs WHERE key IN ({', '.join('?' * len(keys))}) AND status IN (?, ?)",
+                    [*keys, STATUS_PENDING, STATUS_LEASED],
+                ).fetchone()
+            if not row[0]:
+                return
+            if on_poll:
+                on_poll(row[0])
+            time.sleep(poll)
+
+
+class Worker:
+    """Leases the jobs of the queue and runs them with the handler of their
+    kind, `handler(payload) -> result`, until the queue is drained."""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[[dict], Any]],
+        owner: str = "",
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.owner = owner or get_owner()
+        self.processed = 0
+        self.failed = 0
+
+    def keep_alive(self, job: Job, done: threading.Event):
+        while not done.wait(self.queue.lease_seconds / 3):
+            if not self.queue.heartbeat(job):
+                logger.warning(f"Worker: lost the lease of job {job.key}")
+                return
+
+    def run_job(self, job: Job):
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self.keep_alive, args=(job, done), name="heartbeat", daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = self.handlers[job.kind](job.payload)
+        except Exception as e:
+            logger.error(f"Worker: job {job.key} failed (attempt {job.attempts}): {e}")
+            logger.exception(e)
+            self.failed += 1
+            self.queue.fail(job, f"{type(e).__name__}: {e}")
+            return
+        finally:
+            done.set()
+            heartbeat.join()
+        self.processed += 1
+        self.queue.complete(job, result)
+
+    def run(self, wait: bool = False, poll: float = 5.0):
+        """Runs the jobs until none is pending or leased, or forever if `wait`.
+
+        While the other workers hold leases, it keeps polling, to take over
+        their jobs if they die.
+        """
+        logger.info(f"Worker {self.owner}: started on {self.queue.filename}")
+        while True:
+            job = self.queue.lease(self.owner, list(self.handlers))
+            if job is None:
+                counts = self.queue.counts()
+                if (
+                    not wait
+                    and not counts.get(STATUS_PENDING)
+                    and not counts.get(STATUS_LEASED)
+                ):
+                    break
+                time.sleep(poll)
+                continue
+            self.run_job(job)
+        logger.info(
+            f"Worker {self.owner}: {self.processed} jobs done, {self.failed} failed"
+        )
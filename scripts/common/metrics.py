@@ -0,0 +1,326 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    math.inf,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def to_labels(labels: dict) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metric:
+    """A metric with a value per label set, e.g. `jar_cookies{lang="en"}`."""
+
+    type = ""
+
+    def __init__(self, name: str, help: str = ""):
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, object] = {}
+
+    def snapshot(self) -> List[dict]:
+        return [
+            {"labels": dict(labels), "value": value}
+            for labels, value in self.values.items()
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, labels: Labels, value: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + value
+
+    def merge(self, labels: Labels, value: float):
+        self.inc(labels, value)
+
+
+class Gauge(Metric):
+    """A value which goes up and down. The gauges of the processes are merged
+    with `merge`: "sum", e.g. the in-flight calls, or "max", e.g. a peak."""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str = "", merge: str = "sum"):
+        super().__init__(name, help)
+        self.merge_mode = merge
+
+    def set(self, labels: Labels, value: float):
+        self.values[labels] = value
+
+    def max(self, labels: Labels, value: float):
+        self.values[labels] = max(self.values.get(labels, value), value)
+
+    def merge(self, labels: Labels, value: float):
+        if self.merge_mode == "max":
+            self.max(labels, value)
+        else:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def empty(self) -> dict:
+        return {"count": 0, "sum": 0.0, "buckets": [0] * len(self.buckets)}
+
+    def observe(self, labels: Labels, value: float):
+        data = self.values.setdefault(labels, self.empty())
+        data["count"] += 1
+        data["sum"] += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                data["buckets"][i] += 1
+                break
+
+    def merge(self, labels: Labels, value: dict):
+        data = self.values.setdefault(labels, self.empty())
+        data["count"] += value["count"]
+        data["sum"] += value["sum"]
+        for i, count in enumerate(value["buckets"]):
+            data["buckets"][i] += count
+
+    def quantile(self, labels: Labels, q: float) -> float:
+        """The upper bound of the bucket holding the quantile `q`."""
+        data = self.values.get(labels)
+        if not data or not data["count"]:
+            return 0.0
+        rank = q * data["count"]
+        seen = 0
+        for bound, count in zip(self.buckets, data["buckets"]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class Registry:
+    """The metrics of a run: counters, gauges and histograms with labels.
+
+    All the updates go through the registry lock, so the metrics can be
+    updated from any thread. The processes of a run send their `snapshot()`
+    to the parent, which `merge()`s them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+        self.started_at = time.time()
+
+    def get(self, cls, name: str, help: str = "", **kwargs) -> Metric:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        with self.lock:
+            self.get(Counter, name, help).inc(to_labels(labels), value)
+
+    def set(
+        self, name: str, value: float, help: str = "", merge: str = "sum", **labels
+    ):
+        with self.lock:
+            self.get(Gauge, name, help, merge=merge).set(to_labels(labels), value)
+
+    def set_max(self, name: str, value: float, help: str = "", **labels):
+        """Sets the gauge to the value if higher, e.g. a peak: merged with max."""
+        with self.lock:
+            self.get(Gauge, name, help, merge="max").max(to_labels(labels), value)
+
+    def observe(self, name: str, value: float, help: str = "", **labels):
+        with self.lock:
+            self.get(Histogram, name, help).observe(to_labels(labels), value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Records the wall time into the `<name>_seconds` histogram, and the
+        CPU time of the thread into the `<name>_cpu_seconds` counter."""
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, **labels)
+            self.inc(f"{name}_cpu_seconds", time.thread_time() - cpu_start, **labels)
+
+    def value(self, name: str, default: float = 0, **labels):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                return default
+            return metric.values.get(to_labels(labels), default)
+
+    def values(self, name: str) -> List[Tuple[dict, object]]:
+        """All the (labels, value) of the metric."""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                return []
+            return [(dict(labels), value) for labels, value in metric.values.items()]
+
+    def total(self, name: str, **labels) -> float:
+        """The sum of the values of the metric matching the labels."""
+        total = 0
+        for metric_labels, value in self.values(name):
+            if all(metric_labels.get(k) == str(v) for k, v in labels.items()):
+                total += value["sum"] if isinstance(value, dict) else value
+        return total
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                name: {
+                    "type": metric.type,
+                    "help": metric.help,
+                    **(
+                        {"buckets": list(metric.buckets)}
+                        if isinstance(metric, Histogram)
+                        else {}
+                    ),
+                    **(
+                        {"merge": metric.merge_mode}
+                        if isinstance(metric, Gauge)
+                        else {}
+                    ),
+                    "values": json.loads(json.dumps(metric.snapshot())),
+                }
+                for name, metric in self.metrics.items()
+            }
+
+    def merge(self, snapshot: dict):
+        classes = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+        with self.lock:
+            for name, data in snapshot.items():
+                kwargs = {}
+                if data["type"] == "histogram":
+                    kwargs["buckets"] = data["buckets"]
+                if data["type"] == "gauge":
+                    kwargs["merge"] = data.get("merge", "sum")
+                metric = self.get(classes[data["type"]], name, data["help"], **kwargs)
+                for item in data["values"]:
+                    metric.merge(to_labels(item["labels"]), item["value"])
+
+    def reset(self):
+        with self.lock:
+            self.metrics = {}
+            self.started_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "started_at": self.started_at,
+            "duration": time.time() - self.started_at,
+            "metrics": self.snapshot(),
+        }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, data in self.snapshot().items():
+            if data["help"]:
+                lines.append(f"# HELP {name} {data['help']}")
+            lines.append(f"# TYPE {name} {data['type']}")
+            for item in data["values"]:
+                labels = item["labels"]
+                value = item["value"]
+                if data["type"] != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(data["buckets"], value["buckets"]):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else f"{bound}"
+                    lines.append(
+                        f"{name}_bucket{format_labels({**labels, 'le': le})} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{format_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, json_file: str, prometheus_file: Optional[str] = None):
+        Path(json_file).parent.mkdir(parents=True, exist_ok=True)
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+        if prometheus_file:
+            Path(prometheus_file).write_text(self.to_prometheus(), encoding="utf-8")
+        logger.debug(f"Metrics: {json_file}")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    items = ",".join(f'{key}="{escape(str(value))}"' for key, value in labels.items())
+    return "{" + items + "}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class ProgressReporter:
+    """Logs a line of progress from the metrics every `interval` seconds,
+    instead of printing dots from every worker."""
+
+    def __init__(self, registry: Registry, interval: float = 30.0):
+        self.registry = registry
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def report(self):
+        r = self.registry
+        stages = sorted({labels["stage"] for labels, _ in r.values("stage_items")})
+        done = ", ".join(
+            f"{stage} {int(r.total('stage_items', stage=stage))}" for stage in stages
+        )
+        http = r.total("http_requests")
+        cached = r.total("http_requests", cached="True")
+        logger.info(
+            f"Progress: jars [{done}], "
+            f"LLM calls {int(r.total('llm_calls'))} ({int(r.total('llm_calls', status='error'))} errors), "
+            f"HTTP requests {int(http)} ({cached / http * 100 if http else 0:.0f}% cached)"
+        )
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="progress", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+
+metrics = Registry()
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from typing import Any, List, Optional
+from urllib.parse import parse_qsl
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field, PrivateAttr
+
+
+class MockServerError(Exception):
+    """A simulated `500 Internal Server Error` of the provider."""
+
+
+class MockRateLimitError(Exception):
+    """A simulated `429 Too Many Requests` of the provider."""
+
+    status_code = 429
+
+
+def generate_value(schema: dict, defs: dict, name: str, source: dict, seed: bytes):
+    """Generate a value for the JSON schema, derived deterministically from
+    `seed`, echoing the string fields present in `source`."""
+    if "$ref" in schema:
+        schema = defs.get(schema["$ref"].split("/")[-1], {})
+    for key in ("allOf", "anyOf", "oneOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            return generate_value(
+                options[0] if options else {}, defs, name, source, seed
+            )
+
+    digest = hashlib.sha256(seed + name.encode("utf-8")).digest()
+    match schema.get("type", "object" if "properties" in schema else "string"):
+        case "object":
+            value = source.get(name) if isinstance(source.get(name), dict) else source
+            return {
+                key: generate_value(prop, defs, key, value or {}, seed + name.encode())
+                for key, prop in schema.get("properties", {}).items()
+            }
+        case "number":
+            # one decimal between 0 and 10, like the scores
+            return int.from_bytes(digest[:4], "big") % 101 / 10
+        case "integer":
+            return int.from_bytes(digest[:4], "big") % 11
+        case "boolean":
+            return digest[0] % 2 == 0
+        case "array":
+            return []
+        case _:
+            if isinstance(source.get(name), str):
+                return source[name]
+            return f"mock {name} {digest[:4].hex()}"
+
+
+class MockChatModel(BaseChatModel):
+    """Deterministic offline chat model for benchmarks and tests.
+
+    It answers with JSON valid against the schema found in the format
+    instructions of the system message, derived from the user content, and can
+    simulate latency, provider errors, rate limiting and malformed output.
+    The options are given in the model name, e.g.
+    `mock:qwen?latency=lognormal:-1,0.5&error_rate=0.01&rate_limit_rate=0.02&malformed_rate=0.05&seed=1&cache=0`
+    """
+
+    model_name: str = Field(default="mock", description="The mock model name.")
+    latency: str = Field(
+        default="fixed:0",
+        description="The latency distribution in seconds: 'fixed:x', 'uniform:a,b', 'normal:mu,sigma' or 'lognormal:mu,sigma'",
+    )
+    error_rate: float = Field(default=0.0, description="The rate of server errors.")
+    rate_limit_rate: float = Field(default=0.0, description="The rate of 429 errors.")
+    malformed_rate: float = Field(default=0.0, description="The rate of broken JSON.")
+    seed: int = Field(default=0, description="The seed of the simulation.")
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _prefixes: set = PrivateAttr(default_factory=set)
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    @staticmethod
+    def from_name(model_name: str) -> "MockChatModel":
+        name, _, query = model_name.partition("?")
+        options = dict(parse_qsl(query))
+        if "cache" in options:
+            options["cache"] = options["cache"] not in ("0", "false", "no")
+        return MockChatModel(model_name=name, **options)
+
+    def get_latency(self, rng: random.Random) -> float:
+        kind, _, params = self.latency.partition(":")
+        args = [float(arg) for arg in params.split(",") if arg]
+        match kind:
+            case "fixed":
+                return args[0] if args else 0.0
+            case "uniform":
+                return rng.uniform(*args)
+            case "normal":
+                return max(0.0, rng.gauss(*args))
+            case "lognormal":
+                return rng.lognormvariate(*args)
+            case _:
+                raise ValueError(f"MockChatModel: invalid latency: {self.latency}")
+
+    def get_schema(self, messages: List[BaseMessage]) -> dict:
+        for message in messages:
+            if isinstance(message, SystemMessage):
+                m = re.search(r"```\s*(\{.*\})\s*```", str(message.content), re.DOTALL)
+                if m:
+                    return json.loads(m.group(1))
+        return {}
+
+    def simulate(self, messages: List[BaseMessage], json_mode: bool = False) -> tuple:
+        """Returns (latency, result), the result is the error to raise or the text.
+
+        In JSON mode, i.e. with a `response_format`, the output is always valid
+        JSON like with the providers."""
+        prompt = "\n".join(f"{m.type}: {m.content}" for m in messages)
+        seed = hashlib.sha256(
+            f"{self.seed}:{self.model_name}:{prompt}".encode()
+        ).digest()
+        rng = random.Random(seed)
+        latency = self.get_latency(rng)
+
+        dice = rng.random()
+        if dice < self.rate_limit_rate:
+            return latency, MockRateLimitError("Error code: 429 - rate limit exceeded")
+        if dice < self.rate_limit_rate + self.error_rate:
+            return latency, MockServerError("Error code: 500 - internal server error")
+
+        content = next(
+            (str(m.content) for m in messages if isinstance(m, HumanMessage)), ""
+        )
+        try:
+            source = json.loads(content)
+        except ValueError:
+            source = None
+        if not isinstance(source, dict):
+            source = {"content": content, "quote": content}
+        schema = self.get_schema(messages)
+        value = generate_value(schema, schema.get("$defs", {}), "", source, seed)
+        text = json.dumps(value, ensure_ascii=False)
+        if not json_mode and rng.random() < self.malformed_rate:
+            if rng.random() < 0.5:
+                # wrapped in a markdown fence with a trailing comma, repairable
+                text = f"Here is the result:\n```json\n{text[:-1]},}}\n```"
+            else:
+                # cut in the middle, like a truncated response
+                text = "Here is the result: " + text[: len(text) // 2]
+        return latency, text
+
+    def get_cached_tokens(self, messages: List[BaseMessage]) -> int:
+        """Simulates the prompt cache of the providers: the system message is
+        served from the cache if it was seen before."""
+        if not messages or not isinstance(messages[0], SystemMessage):
+            return 0
+        prefix = hashlib.sha256(str(messages[0].content).encode("utf-8")).digest()
+        with self._lock:
+            if prefix not in self._prefixes:
+                self._prefixes.add(prefix)
+                return 0
+        return len(str(messages[0].content)) // 4
+
+    def create_result(self, messages: List[BaseMessage], text: str) -> ChatResult:
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = len(text) // 4
+        cached_tokens = self.get_cached_tokens(messages)
+        usage = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "input_token_details": {"cache_read": cached_tokens},
+        }
+        message = AIMessage(content=text, usage_metadata=usage)
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={
+                "model_name": self.model_name,
+                "token_usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                },
+            },
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        latency, result = self.simulate(messages, "response_format" in kwargs)
+        time.sleep(latency)
+        if isinstance(result, Exception):
+            raise result
+        return self.create_result(messages, result)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        latency, result = self.simulate(messages, "response_format" in kwargs)
+        await asyncio.sleep(latency)
+        if isinstance(result, Exception):
+            raise result
+        return self.create_result(messages, result)
@@ -118,6 +118,10 @@ class CookieJar(BaseModel):
         default="tongyi:qwen-turbo-latest",
         description="The language model name.",
     )
+    model_name_fallback: str = Field(
+        default="openai:gpt-4o",
+        description="The fallback language model name.",
+    )
     limit: int = Field(
         default=10000,
         description="The limit of number of cookies to extract.",
@@ -0,0 +1,67 @@
+import json
+import re
+from typing import Any, List, Optional, Type
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.outputs import Generation
+from pydantic import BaseModel
+
+# The providers supporting a JSON schema for the response, the others only
+# support the JSON mode, i.e. the response is a valid JSON object.
+JSON_SCHEMA_PROVIDERS = ("openai",)
+JSON_MODE_PROVIDERS = ("deepseek", "moonshot", "tongyi")
+
+
+def get_response_format(model_name: str, cls: Type[BaseModel]) -> Optional[dict]:
+    """The `response_format` of the provider for the structured output of `cls`,
+    or None if the provider doesn't support any."""
+    provider = model_name.split(":", 1)[0]
+    if provider in JSON_SCHEMA_PROVIDERS:
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": cls.__name__,
+                "schema": cls.model_json_schema(),
+                # the strict mode requires all the fields to be required
+                "strict": False,
+            },
+        }
+    if provider in JSON_MODE_PROVIDERS or provider == "mock":
+        return {"type": "json_object"}
+    return None
+
+
+def repair_json(text: str) -> str:
+    """Repairs the common syntax mistakes of the models in a JSON object: the
+    surrounding text or markdown fences, and trailing commas."""
+    m = re.search(r"```(?:json)?\s*(.*?)\s*```", text, re.DOTALL)
+    if m:
+        text = m.group(1)
+    start, end = text.find("{"), text.rfind("}")
+    if start >= 0 and end > start:
+        text = text[start : end + 1]
+    # trailing commas, outside of the strings
+    return re.sub(
+        r'("(?:\\.|[^"\\])*")|,\s*([}\]])', lambda m: m.group(1) or m.group(2), text
+    )
+
+
+class JsonRepairOutputParser(PydanticOutputParser):
+    """A `PydanticOutputParser` trying to repair the JSON syntax before failing,
+    so that only the semantic failures, e.g. a missing field, cost another call
+    of the model."""
+
+    def parse_result(self, result: List[Generation], *, partial: bool = False) -> Any:
+        try:
+            return super().parse_result(result, partial=partial)
+        except OutputParserException as e:
+            text = result[0].text
+            repaired = repair_json(text)
+            if repaired == text:
+                raise e
+            try:
+                json.loads(repaired)
+            except ValueError:
+                raise e
+            return super().parse_result([Generation(text=repaired)], partial=partial)
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import weakref
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+
+# Process-wide registry of the model clients, chains and HTTP connection pools,
+# shared by all the agents and `process_jar` threads.
+lock = threading.RLock()
+models: Dict[str, BaseChatModel] = {}
+chains: Dict[Hashable, Any] = {}
+http_clients: Dict[str, httpx.Client] = {}
+http_async_clients: Dict[str, "LoopAsyncClient"] = {}
+# the connection pools of the async clients, by event loop then endpoint
+loop_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+counters = {
+    "models_created": 0,
+    "models_reused": 0,
+    "chains_created": 0,
+    "chains_reused": 0,
+}
+
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+def get_http_client(base_url: Optional[str]) -> httpx.Client:
+    """The HTTP client shared by all models of the same endpoint."""
+    key = base_url or ""
+    with lock:
+        if key not in http_clients:
+            http_clients[key] = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        return http_clients[key]
+
+
+def create_http_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+
+def get_loop_http_client(key: str) -> httpx.AsyncClient:
+    """The async client of the endpoint in the running event loop."""
+    loop = asyncio.get_running_loop()
+    with lock:
+        clients = loop_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = create_http_async_client()
+        return clients[key]
+
+
+class LoopAsyncClient(httpx.AsyncClient):
+    """The async client given to the models, which outlive the event loops:
+    the connections of an httpx pool are bound to the loop which opened them,
+    e.g. of an `asyncio.run`, so the requests are sent through a pool of the
+    running loop."""
+
+    def __init__(self, key: str):
+        super().__init__(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        self.key = key
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        return await get_loop_http_client(self.key).send(request, **kwargs)
+
+
+def get_http_async_client(base_url: Optional[str]) -> httpx.AsyncClient:
+    """The async client shared by all models of the same endpoint."""
+    key = base_url or ""
+    with lock:
+        if key not in http_async_clients:
+            http_async_clients[key] = LoopAsyncClient(key)
+        return http_async_clients[key]
+
+
+def get_model(model_name: str) -> BaseChatModel:
+    from .agent import load_model
+
+    with lock:
+        if model_name in models:
+            counters["models_reused"] += 1
+        else:
+            models[model_name] = load_model(model_name=model_name)
+            counters["models_created"] += 1
+        return models[model_name]
+
+
+def get_chain(key: Hashable, factory: Callable[[], Any]) -> Any:
+    """Returns the chain cached by key, or the chain created by factory."""
+    with lock:
+        if key in chains:
+            counters["chains_reused"] += 1
+        else:
+            chains[key] = factory()
+            counters["chains_created"] += 1
+        return chains[key]
+
+
+class PoolMonitor(BaseCallbackHandler):
+    """Tracks the in-flight calls per model."""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.runs: Dict[UUID, str] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.in_flight_peak: Dict[str, int] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        model = (metadata or {}).get("model", "")
+        with self.lock:
+            self.runs[run_id] = model
+            self.in_flight[model] = self.in_flight.get(model, 0) + 1
+            self.in_flight_peak[model] = max(
+                self.in_flight_peak.get(model, 0), self.in_flight[model]
+            )
+
+    def on_end(self, run_id: UUID):
+        with self.lock:
+            model = self.runs.pop(run_id, None)
+            if model is not None:
+                self.in_flight[model] -= 1
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        self.on_end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self.on_end(run_id)
+
+
+pool_monitor = PoolMonitor()
+
+
+def get_connection_count(client: Any) -> int:
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return len(getattr(pool, "connections", []))
+
+
+def pool_stats() -> dict:
+    with lock:
+        return {
+            **counters,
+            "models": sorted(models.keys()),
+            "in_flight_peak": dict(pool_monitor.in_flight_peak),
+            "http_connections": {
+                base_url or "default": get_connection_count(client)
+                for base_url, client in http_clients.items()
+            },
+            "http_max_connections": HTTP_LIMITS.max_connections,
+        }
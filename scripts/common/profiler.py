@@ -0,0 +1,188 @@
+import cProfile
+import io
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from loguru import logger
+
+# The frames on top of the idle threads: the stage workers waiting for an item,
+# and the executor workers waiting for a task.
+IDLE_FRAMES = {"threading:wait", "thread:_worker"}
+
+
+def get_frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{Path(code.co_filename).stem}:{code.co_name}"
+
+
+class Profiler:
+    """Profiles the stages of the jars with two profilers:
+
+    - a deterministic one, cProfile, for each `profile()` block, dumped into
+      `<output_dir>/<name>.prof` and aggregated into the top-N report;
+    - a sampling one, which collects the stacks of all the threads every
+      `interval` seconds, under the labels of the running `section()`s, e.g.
+      `score;en;wikiquote;Scorer;...`, for flamegraph.pl or speedscope.
+
+    It does nothing until `enable()` is called, so the blocks can stay in the
+    pipeline code.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.output_dir: Optional[Path] = None
+        self.lock = threading.Lock()
+        self.labels: Dict[int, List[str]] = {}
+        self.samples: Counter = Counter()
+        self.stats: Optional[pstats.Stats] = None
+        self.profiles = 0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.output_dir is not None
+
+    def enable(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.sample, name="profiler", daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    labels = self.labels.get(ident)
+                    if not labels:
+                        if get_frame_name(frame) in IDLE_FRAMES:
+                            continue
+                        # e.g. the LLM calls of a scorer, in the executor threads
+                        labels = [re.sub(r"[-_]?\d+$", "", names.get(ident, "thread"))]
+                    stack = []
+                    while frame is not None:
+                        stack.append(get_frame_name(frame))
+                        frame = frame.f_back
+                    self.samples[";".join(labels + stack[::-1])] += 1
+
+    @contextmanager
+    def section(self, *labels: str) -> Iterator[None]:
+        """Labels the samples of the current thread, e.g. with the transformer."""
+        if not self.enabled:
+            yield
+            return
+        ident = threading.get_ident()
+        with self.lock:
+            stack = self.labels.setdefault(ident, [])
+            stack.extend(labels)
+        try:
+            yield
+        finally:
+            with self.lock:
+                del stack[len(stack) - len(labels) :]
+                if not stack:
+                    del self.labels[ident]
+
+    def stream(self, items: Iterable, *labels: str) -> Iterator:
+        """Labels the samples taken while the next item is pulled, e.g. from
+        the stream of a transformer."""
+        iterator = iter(items)
+        while True:
+            with self.section(*labels):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @contextmanager
+    def profile(self, name: str, *labels: str) -> Iterator[None]:
+        """Profiles the block with cProfile into `<name>.prof`, and labels its
+        samples."""
+        if not self.enabled:
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # since python 3.12, only one cProfile can be active at a time,
+            # the block is still sampled
+            profile = None
+        try:
+            with self.section(*labels):
+                yield
+        finally:
+            if profile:
+                profile.disable()
+                self.add(name, profile)
+
+    def add(self, name: str, profile: cProfile.Profile):
+        filename = self.output_dir / f"{name}.prof"
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(str(filename))
+        with self.lock:
+            self.profiles += 1
+            if self.stats is None:
+                self.stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                self.stats.add(profile)
+
+    def get_top_samples(self, top: int) -> List[tuple]:
+        """The functions with the most samples on top of the stack."""
+        counts = Counter()
+        with self.lock:
+            for stack, count in self.samples.items():
+                counts[stack.rsplit(";", 1)[-1]] += count
+        return counts.most_common(top)
+
+    def save(self, top: int = 30):
+        """Writes the collapsed stacks and the top-N report."""
+        if not self.enabled:
+            return
+        with self.lock:
+            samples = sorted(self.samples.items())
+        collapsed_file = self.output_dir / "samples.collapsed"
+        with open(collapsed_file, "w", encoding="utf-8") as f:
+            for stack, count in samples:
+                f.write(f"{stack} {count}\n")
+
+        total = sum(count for _, count in samples)
+        report = io.StringIO()
+        report.write(
+            f"# Sampled every {self.interval * 1000:.0f} ms: {total} samples\n\n"
+        )
+        report.write("  samples       %  function\n")
+        for function, count in self.get_top_samples(top):
+            report.write(f"{count:9} {count / total * 100:6.1f}%  {function}\n")
+        if self.stats:
+            report.write(f"\n# cProfile of {self.profiles} blocks\n")
+            self.stats.stream = report
+            for sort in ("tottime", "cumulative"):
+                self.stats.sort_stats(sort).print_stats(top)
+        report_file = self.output_dir / "top.txt"
+        report_file.write_text(report.getvalue(), encoding="utf-8")
+        logger.info(f"Profiles: {report_file}, {collapsed_file}")
+
+
+profiler = Profiler()
@@ -0,0 +1,67 @@
+import os
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from pydantic import SecretStr
+
+from .pool import get_http_async_client, get_http_client
+from .registry import Registry
+
+# The chat model clients are imported by the providers used: langchain_openai
+# and langchain_community are slow to import.
+
+
+def load_openai(model_name: str) -> BaseChatModel:
+    from langchain_openai.chat_models import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model_name,
+        http_client=get_http_client(None),
+        http_async_client=get_http_async_client(None),
+    )
+
+
+def load_tongyi(model_name: str) -> BaseChatModel:
+    import dashscope  # type: ignore # noqa: F401
+    from langchain_community.chat_models import ChatTongyi
+
+    return ChatTongyi(model=model_name, api_key=None)
+
+
+def load_openai_compatible(model_name: str, base_url: str, api_key_env: str):
+    from langchain_openai.chat_models import ChatOpenAI
+
+    return ChatOpenAI(
+        model=model_name,
+        api_key=SecretStr(os.environ.get(api_key_env) or ""),
+        base_url=base_url,
+        http_client=get_http_client(base_url),
+        http_async_client=get_http_async_client(base_url),
+    )
+
+
+def load_moonshot(model_name: str) -> BaseChatModel:
+    # https://github.com/langchain-ai/langchain/issues/27058
+    # m = MoonshotChat(model=model_name)
+    return load_openai_compatible(
+        model_name, "https://api.moonshot.cn/v1", "MOONSHOT_API_KEY"
+    )
+
+
+def load_deepseek(model_name: str) -> BaseChatModel:
+    return load_openai_compatible(
+        model_name, "https://api.deepseek.com", "DEEPSEEK_API_KEY"
+    )
+
+
+# the `provider` of the model names `provider:model`
+providers = Registry(
+    "provider",
+    {
+        "openai": "common.providers:load_openai",
+        "tongyi": "common.providers:load_tongyi",
+        "moonshot": "common.providers:load_moonshot",
+        "deepseek": "common.providers:load_deepseek",
+        "mock": "common.mock:MockChatModel.from_name",
+        # "anthropic": ChatAnthropic(model_name=model_name, timeout=60, stop=None)
+    },
+)
@@ -0,0 +1,201 @@
+import json
+import sys
+from typing import Iterable, List, Optional, Union
+
+from .model import Cookie, Score, ScoreEntry
+
+DIMENSIONS = ("popularity", "quality", "sentiment", "clarity")
+
+
+def intern(text: str) -> str:
+    # the same author, source or page link is shared by many cookies
+    return sys.intern(text) if text else ""
+
+
+class ScoreRecord:
+    """The `Score` of a cookie as plain floats, the explanations in a tuple:
+    (explaination, popularity, quality, sentiment, clarity)."""
+
+    __slots__ = (
+        "overall",
+        "popularity",
+        "quality",
+        "sentiment",
+        "clarity",
+        "explanations",
+    )
+
+    def __init__(
+        self,
+        overall: float = 0.0,
+        popularity: float = 0.0,
+        quality: float = 0.0,
+        sentiment: float = 0.0,
+        clarity: float = 0.0,
+        explanations: tuple = ("", "", "", "", ""),
+    ):
+        self.overall = overall
+        self.popularity = popularity
+        self.quality = quality
+        self.sentiment = sentiment
+        self.clarity = clarity
+        self.explanations = explanations
+
+    @staticmethod
+    def from_score(score: Score) -> "ScoreRecord":
+        entries = [getattr(score, dim) for dim in DIMENSIONS]
+        return ScoreRecord(
+            float(score.overall),
+            *(float(entry.score) for entry in entries),
+            explanations=(
+                score.explaination,
+                *(entry.explanation for entry in entries),
+            ),
+        )
+
+    @staticmethod
+    def from_dict(data: dict) -> "ScoreRecord":
+        entries = [data.get(dim) or {} for dim in DIMENSIONS]
+        return ScoreRecord(
+            float(data.get("overall", 0)),
+            *(float(entry.get("score", 0)) for entry in entries),
+            explanations=(
+                data.get("explaination", ""),
+                *(entry.get("explanation", "") for entry in entries),
+            ),
+        )
+
+    def to_dict(self) -> dict:
+        """The fields of `Score.model_dump`, in the same order."""
+        explaination, *explanations = self.explanations
+        return {
+            "explaination": explaination,
+            **{
+                dim: {"score": getattr(self, dim), "explanation": explanation}
+                for dim, explanation in zip(DIMENSIONS, explanations)
+            },
+            "overall": self.overall,
+        }
+
+    def to_score(self) -> Score:
+        explaination, *explanations = self.explanations
+        return Score(
+            explaination=explaination,
+            overall=self.overall,
+            **{
+                dim: ScoreEntry(score=getattr(self, dim), explanation=explanation)
+                for dim, explanation in zip(DIMENSIONS, explanations)
+            },
+        )
+
+
+class CookieRecord:
+    """The compact form of a `Cookie` inside the pipeline.
+
+    A slotted object with interned attribution strings and a `ScoreRecord`,
+    instead of a pydantic model with five nested models. It has the fields of
+    `Cookie`, so the transformers work on both; it is converted back to a
+    `Cookie` at the I/O boundaries, e.g. the JSONL files and the LLM prompts.
+    """
+
+    __slots__ = ("title", "author", "content", "source", "link", "score")
+
+    def __init__(
+        self,
+        title: str = "",
+        author: str = "",
+        content: str = "",
+        source: str = "",
+        link: str = "",
+        score: Optional[ScoreRecord] = None,
+    ):
+        self.title = intern(title)
+        self.author = intern(author)
+        self.content = content
+        self.source = intern(source)
+        self.link = intern(link)
+        self.score = score
+
+    __str__ = Cookie.__str__
+
+    @staticmethod
+    def from_cookie(cookie: Cookie) -> "CookieRecord":
+        return CookieRecord(
+            cookie.title,
+            cookie.author,
+            cookie.content,
+            cookie.source,
+            cookie.link,
+            ScoreRecord.from_score(cookie.score) if cookie.score else None,
+        )
+
+    @staticmethod
+    def from_dict(data: dict) -> "CookieRecord":
+        score = data.get("score")
+        return CookieRecord(
+            data.get("title", ""),
+            data.get("author", ""),
+            data.get("content", ""),
+            data.get("source", ""),
+            data.get("link", ""),
+            ScoreRecord.from_dict(score) if score else None,
+        )
+
+    @staticmethod
+    def from_json(text: str) -> "CookieRecord":
+        """Parses a line of JSONL, without the pydantic validation."""
+        return CookieRecord.from_dict(json.loads(text))
+
+    def to_dict(self) -> dict:
+        """The fields of `Cookie.model_dump`, in the same order."""
+        return {
+            "title": self.title,
+            "author": self.author,
+            "content": self.content,
+            "source": self.source,
+            "link": self.link,
+            "score": self.score.to_dict() if self.score else None,
+        }
+
+    def to_cookie(self) -> Cookie:
+        return Cookie(
+            title=self.title,
+            author=self.author,
+            content=self.content,
+            source=self.source,
+            link=self.link,
+            score=self.score.to_score() if self.score else None,
+        )
+
+
+class LazyRecord:
+    """A cookie decoded from JSON, but not built into a `CookieRecord` yet.
+
+    Ranking only reads `overall`, so a large input is ranked without building
+    the records of the cookies it drops.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    @property
+    def overall(self) -> float:
+        score = self.data.get("score")
+        return float(score.get("overall", 0)) if score else 0.0
+
+    def to_record(self) -> CookieRecord:
+        return CookieRecord.from_dict(self.data)
+
+
+def to_records(cookies: Iterable[Cookie]) -> List[CookieRecord]:
+    return [CookieRecord.from_cookie(cookie) for cookie in cookies]
+
+
+def to_cookie(item: Union[Cookie, CookieRecord]) -> Cookie:
+    return item.to_cookie() if isinstance(item, CookieRecord) else item
+
+
+def to_cookies(items: Iterable[Union[Cookie, CookieRecord]]) -> List[Cookie]:
+    return [to_cookie(item) for item in items]
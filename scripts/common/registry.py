@@ -0,0 +1,82 @@
+import importlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def resolve(path: str) -> Any:
+    """Imports `module:attribute`, e.g. `common.mock:MockChatModel.from_name`."""
+    module_name, _, attributes = path.partition(":")
+    target = importlib.import_module(module_name)
+    for attribute in attributes.split(".") if attributes else []:
+        target = getattr(target, attribute)
+    return target
+
+
+class Registry:
+    """Maps names to implementations imported on first use, given as
+    `module:attribute` paths, so that importing the registry doesn't import
+    the implementations and their dependencies.
+
+    A dotted name resolves to its longest registered prefix, e.g. the
+    extractor `crawler.wikiquote.en` to `crawler.wikiquote`.
+    """
+
+    def __init__(self, kind: str, entries: Optional[Dict[str, str]] = None):
+        self.kind = kind
+        self.entries: Dict[str, str] = dict(entries or {})
+        self.loaded: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, path: str):
+        with self.lock:
+            self.entries[name] = path
+            self.loaded.pop(name, None)
+
+    def find(self, name: str) -> str:
+        """The registered name matching `name`."""
+        parts = name.split(".")
+        while parts:
+            key = ".".join(parts)
+            if key in self.entries:
+                return key
+            parts.pop()
+        raise NotImplementedError(f"Unknown {self.kind}: {name}")
+
+    def get_path(self, name: str) -> str:
+        return self.entries[self.find(name)]
+
+    def get(self, name: str) -> Any:
+        key = self.find(name)
+        with self.lock:
+            if key not in self.loaded:
+                self.loaded[key] = resolve(self.entries[key])
+            return self.loaded[key]
+
+    def names(self) -> List[str]:
+        return sorted(self.entries)
+
+    def __contains__(self, name: str) -> bool:
+        try:
+            self.find(name)
+        except NotImplementedError:
+            return False
+        return True
+
+
+def attach(
+    package: str, attributes: Dict[str, str]
+) -> Tuple[Callable[[str], Any], Callable[[], List[str]], List[str]]:
+    """The `__getattr__`, `__dir__` and `__all__` of a package whose
+    attributes are imported from its submodules on first access (PEP 562),
+    given as `{attribute: submodule}`."""
+
+    def __getattr__(name: str) -> Any:
+        if name not in attributes:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        module = importlib.import_module(attributes[name], package)
+        return getattr(module, name)
+
+    def __dir__() -> List[str]:
+        return sorted(attributes)
+
+    return __getattr__, __dir__, sorted(attributes)
@@ -0,0 +1,255 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from loguru import logger
+
+from .metrics import metrics
+
+# Tells the workers of a stage to exit.
+STOP = object()
+
+
+class Deferred:
+    """Returned by the function of a stage to run `item` through the stage
+    again after `delay` seconds, e.g. to poll a provider batch, without
+    holding a worker of the stage in the meantime."""
+
+    def __init__(self, item: Any, delay: float):
+        self.item = item
+        self.delay = delay
+
+
+class Sequencer:
+    """Lets the items of a group through a step in the order they were added,
+    e.g. the jars of a language through the deduplication, so that the result
+    doesn't depend on which item reached the step first. An item not yet
+    allowed is deferred by the stage, see `Deferred`."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending: Dict[Hashable, List[Hashable]] = {}
+
+    def add(self, group: Hashable, key: Hashable):
+        with self.lock:
+            self.pending.setdefault(group, []).append(key)
+
+    def is_next(self, group: Hashable, key: Hashable) -> bool:
+        with self.lock:
+            keys = self.pending.get(group)
+            return not keys or keys[0] == key
+
+    def done(self, group: Hashable, key: Hashable):
+        """The item passed the step, or will never reach it."""
+        with self.lock:
+            keys = self.pending.get(group, [])
+            if key in keys:
+                keys.remove(key)
+
+
+def run_deferred(fn: Callable[[Any], Any], item: Any) -> Any:
+    """Runs `fn` on `item` outside of a scheduler, waiting in place for the
+    deferred items."""
+    result = fn(item)
+    while isinstance(result, Deferred):
+        time.sleep(result.delay)
+        result = fn(result.item)
+    return result
+
+
+class Stage:
+    """A step of the pipeline, run by its own pool of `workers` threads.
+
+    `fn` takes an item and returns the item for the next stage, or None to
+    drop it. The queue in front of the stage holds at most `queue_size` items,
+    so a slow stage blocks the stages before it instead of piling up items.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: int = 0,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size or 2 * workers)
+        self.lock = threading.Lock()
+        # the deferred items waiting for their delay, and the total so far
+        self.idle = threading.Condition(self.lock)
+        self.waiting = 0
+        self.deferrals = 0
+        self.stats = {
+            "processed": 0,
+            "dropped": 0,
+            "failed": 0,
+            "deferred": 0,
+            "busy": 0.0,
+            "queue_peak": 0,
+        }
+
+    def put(self, item: Any):
+        self.queue.put(item)
+        size = self.queue.qsize()
+        with self.lock:
+            self.stats["queue_peak"] = max(self.stats["queue_peak"], size)
+        metrics.set("stage_queue_depth", size, merge="max", stage=self.name)
+        metrics.set_max("stage_queue_peak", size, stage=self.name)
+
+    def count(self, counter: str, value: float = 1):
+        with self.lock:
+            self.stats[counter] += value
+        if counter != "busy":
+            metrics.inc("stage_items", value, stage=self.name, status=counter)
+
+    def defer(self, deferred: Deferred):
+        """Puts the item back into the queue after its delay."""
+        with self.lock:
+            self.waiting += 1
+            self.deferrals += 1
+        self.count("deferred")
+
+        def resume():
+            self.put(deferred.item)
+            with self.idle:
+                self.waiting -= 1
+                self.idle.notify_all()
+
+        timer = threading.Timer(deferred.delay, resume)
+        timer.daemon = True
+        timer.start()
+
+    def join(self):
+        """Waits for the items of the stage, the deferred ones included."""
+        while True:
+            with self.idle:
+                while self.waiting:
+                    self.idle.wait()
+                deferrals = self.deferrals
+            # the deferred items are back in the queue; an item deferred again
+            # is counted before it is done
+            self.queue.join()
+            with self.lock:
+                if self.deferrals == deferrals:
+                    return
+
+
+class Scheduler:
+    """Runs the items through the stages, the stages overlap: while an item is
+    in a stage, the next items are in the stages before it.
+
+    An item deferred by a stage (see `Deferred`) frees its worker until it
+    is run through the stage again.
+
+    `on_exit(item)` is called once for every item leaving the pipeline,
+    whether it passed the last stage, was dropped or failed, with the item as
+    the failing stage received it.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        on_exit: Optional[Callable[[Any], None]] = None,
+    ):
+        self.stages = stages
+        self.on_exit = on_exit
+        self.threads: List[threading.Thread] = []
+        self.started_at = 0.0
+        self.elapsed = 0.0
+
+    def work(self, index: int):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage.queue.get()
+            try:
+                if item is STOP:
+                    return
+                metrics.set(
+                    "stage_queue_depth",
+                    stage.queue.qsize(),
+                    merge="max",
+                    stage=stage.name,
+                )
+                start = time.perf_counter()
+                try:
+                    with metrics.timer("stage", stage=stage.name):
+                        result = stage.fn(item)
+                except Exception as e:
+                    stage.count("failed")
+                    logger.error(f"Scheduler: stage '{stage.name}' failed: {e}")
+                    logger.exception(e)
+                    self.exit(item)
+                    continue
+                finally:
+                    stage.count("busy", time.perf_counter() - start)
+                if isinstance(result, Deferred):
+                    stage.defer(result)
+                    continue
+                stage.count("processed")
+                if result is None:
+                    stage.count("dropped")
+                    self.exit(item)
+                elif next_stage:
+                    next_stage.put(result)
+                else:
+                    self.exit(result)
+            finally:
+                stage.queue.task_done()
+
+    def exit(self, item: Any):
+        if self.on_exit:
+            try:
+                self.on_exit(item)
+            except Exception as e:
+                logger.exception(e)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for i, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self.work, args=(i,), name=f"{stage.name}-{n}", daemon=True
+                )
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, item: Any):
+        self.stages[0].put(item)
+
+    def join(self):
+        """Waits for the submitted items, then stops the workers."""
+        # the items only move forward, so once a stage is drained, no item
+        # will enter it anymore
+        for stage in self.stages:
+            stage.join()
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(STOP)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def run(self, items: Iterable[Any]):
+        self.start()
+        try:
+            for item in items:
+                self.submit(item)
+        finally:
+            self.join()
+
+    def get_stats(self) -> List[dict]:
+        return [
+            {
+                "stage": stage.name,
+                "workers": stage.workers,
+                **stage.stats,
+                "cpu": metrics.total("stage_cpu_seconds", stage=stage.name),
+                "elapsed": self.elapsed,
+            }
+            for stage in self.stages
+        ]
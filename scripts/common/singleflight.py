@@ -0,0 +1,102 @@
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+lock = threading.Lock()
+flights: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """Coalesces the concurrent calls with the same key: the first caller runs
+    the call, the others wait for it and share its result, or its exception.
+
+    A call is only shared while it is in flight, the callers arriving after it
+    completed run it again, usually served by a cache by then. With
+    `copy_result`, the waiting callers get a deep copy of the result, so it can
+    be modified safely.
+
+    `ado` is the asyncio version: the waiting callers await the result without
+    blocking their event loop, and only the calls of the same loop are shared.
+    """
+
+    def __init__(self, name: str, copy_result: bool = True):
+        self.name = name
+        self.copy_result = copy_result
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, Future] = {}
+        self.async_calls: Dict[Hashable, asyncio.Future] = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Returns (result, shared), `shared` if the result is of another call."""
+        with self.lock:
+            self.counters["calls"] += 1
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            result = future.result()
+            return (copy.deepcopy(result) if self.copy_result else result), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    async def ado(
+        self, key: Hashable, fn: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """The async version of `do`."""
+        loop = asyncio.get_running_loop()
+        key = (loop, key)
+        with self.lock:
+            self.counters["calls"] += 1
+            future = self.async_calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.async_calls[key] = loop.create_future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            # a cancelled waiter doesn't cancel the shared call
+            result = await asyncio.shield(future)
+            return (copy.deepcopy(result) if self.copy_result else result), True
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # retrieved, even if no call was waiting for it
+            future.exception()
+            raise
+        finally:
+            with self.lock:
+                del self.async_calls[key]
+
+
+def get_single_flight(name: str, copy_result: bool = True) -> SingleFlight:
+    with lock:
+        if name not in flights:
+            flights[name] = SingleFlight(name, copy_result=copy_result)
+        return flights[name]
+
+
+def single_flight_stats() -> Dict[str, dict]:
+    with lock:
+        return {name: dict(flight.counters) for name, flight in flights.items()}
@@ -0,0 +1,37 @@
+import time
+
+from common.hedge import Hedger, LatencyWindow
+
+
+def get_hedger() -> Hedger:
+    window = LatencyWindow()
+    for _ in range(20):
+        window.add(0.01)
+    return Hedger(window, min_delay=0.05)
+
+
+def test_hedge_slow_call():
+    def primary():
+        time.sleep(1)
+        return "primary"
+
+    hedger = get_hedger()
+    start = time.perf_counter()
+    assert hedger.invoke(primary, lambda: "secondary") == ("secondary", True, True)
+    assert time.perf_counter() - start < 0.5
+    hedger.shutdown()
+
+
+def test_hedge_takes_the_valid_result():
+    def primary():
+        time.sleep(0.2)
+        return "primary"
+
+    def secondary():
+        raise ValueError("invalid output")
+
+    hedger = get_hedger()
+    assert hedger.invoke(primary, secondary) == ("primary", True, False)
+    # fast calls are not hedged
+    assert hedger.invoke(lambda: "primary", secondary) == ("primary", False, False)
+    hedger.shutdown()
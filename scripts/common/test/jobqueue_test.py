@@ -0,0 +1,77 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.jobqueue import (
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_LEASED,
+    STATUS_PENDING,
+    JobQueue,
+    Worker,
+)
+
+
+def test_job_queue_leases_and_retries(tmp_path):
+    queue = JobQueue(str(tmp_path / "queue.db"), lease_seconds=0.2)
+    queue.put("jar", "jar:en/a", {"name": "a"}, max_attempts=2)
+    queue.put("jar", "jar:en/b", {"name": "b"}, max_attempts=2)
+
+    first = queue.lease("w1")
+    assert first.key == "jar:en/a" and first.attempts == 1
+    second = queue.lease("w2")
+    assert second.key == "jar:en/b"
+    assert queue.lease("w3") is None
+
+    # a failed job is retried, up to max_attempts
+    assert queue.fail(second, "broken")
+    assert queue.get("jar:en/b").status == STATUS_PENDING
+    second = queue.lease("w2")
+    assert second.attempts == 2
+    assert queue.fail(second, "broken again")
+    assert queue.get("jar:en/b").status == STATUS_FAILED
+
+    # the lease of a dead worker expires, and the job is leased again
+    time.sleep(0.3)
+    retry = queue.lease("w3")
+    assert retry.key == "jar:en/a" and retry.owner == "w3"
+    assert not queue.complete(first, {"tier2": 1})
+    assert not queue.heartbeat(first)
+    assert queue.complete(retry, {"tier2": 2})
+    assert queue.get("jar:en/a").result == {"tier2": 2}
+    assert queue.counts() == {STATUS_DONE: 1, STATUS_FAILED: 1}
+
+    # enqueued again for a new run
+    queue.put("jar", "jar:en/a", {"name": "a"})
+    assert queue.get("jar:en/a").status == STATUS_PENDING
+
+
+def test_workers_drain_the_queue(tmp_path):
+    filename = str(tmp_path / "queue.db")
+    queue = JobQueue(filename, lease_seconds=1)
+    keys = [f"jar:en/{i}" for i in range(20)]
+    for i, key in enumerate(keys):
+        queue.put("jar", key, {"i": i})
+    calls = []
+
+    def handler(payload: dict):
+        calls.append(payload["i"])
+        if payload["i"] == 3 and calls.count(3) == 1:
+            raise ValueError("flaky")
+        time.sleep(0.01)
+        return {"square": payload["i"] ** 2}
+
+    workers = [
+        Worker(JobQueue(filename, lease_seconds=1), {"jar": handler}, owner=f"w{n}")
+        for n in range(4)
+    ]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for worker in workers:
+            executor.submit(worker.run, poll=0.05)
+    queue.wait(keys, poll=0.05)
+
+    jobs = queue.jobs("jar")
+    assert all(job.status == STATUS_DONE for job in jobs)
+    assert [job.result["square"] for job in jobs] == [i**2 for i in range(20)]
+    assert sorted(calls) == sorted(list(range(20)) + [3])
+    assert sum(worker.processed for worker in workers) == 20
+    assert not queue.jobs(status=STATUS_LEASED)
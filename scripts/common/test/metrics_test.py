@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from common.metrics import Registry
+
+
+def test_registry_counts_from_threads():
+    registry = Registry()
+
+    def work(i: int):
+        for _ in range(100):
+            registry.inc("items", stage="parse", status="ok" if i % 2 else "failed")
+            registry.observe("latency_seconds", 0.2, model="mock")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(work, range(8)))
+
+    assert registry.value("items", stage="parse", status="ok") == 400
+    assert registry.total("items", stage="parse") == 800
+    latency = registry.value("latency_seconds", model="mock")
+    assert latency["count"] == 800
+    assert (
+        registry.metrics["latency_seconds"].quantile((("model", "mock"),), 0.95) == 0.25
+    )
+
+
+def test_registry_merges_snapshots():
+    first, second = Registry(), Registry()
+    for registry in (first, second):
+        registry.inc("http_requests", cached=True)
+        registry.observe("stage_seconds", 1.5, stage="score")
+        with registry.timer("stage", stage="load"):
+            pass
+    second.set("tier1_cookies", 500, lang="en")
+    first.set("in_flight", 2, model="mock")
+    second.set("in_flight", 3, model="mock")
+    first.set_max("stage_queue_peak", 4, stage="score")
+    second.set_max("stage_queue_peak", 7, stage="score")
+
+    first.merge(second.snapshot())
+    assert first.value("http_requests", cached=True) == 2
+    assert first.value("stage_seconds", stage="score")["sum"] == 3.0
+    assert first.value("stage_seconds", stage="load")["count"] == 2
+    assert first.value("tier1_cookies", lang="en") == 500
+    # the gauges are summed, the peaks take the max
+    assert first.value("in_flight", model="mock") == 5
+    assert first.value("stage_queue_peak", stage="score") == 7
+    merged = Registry()
+    merged.merge(first.snapshot())
+    merged.merge(second.snapshot())
+    assert merged.value("stage_queue_peak", stage="score") == 7
+
+    text = first.to_prometheus()
+    assert "# TYPE http_requests counter" in text
+    assert 'http_requests{cached="True"} 2' in text
+    assert 'stage_seconds_bucket{stage="score",le="2.5"} 2' in text
+    assert 'stage_seconds_bucket{stage="score",le="+Inf"} 2' in text
+    assert 'stage_seconds_count{stage="score"} 2' in text
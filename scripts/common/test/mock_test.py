@@ -0,0 +1,59 @@
+import pytest
+from common import Agent, Cookie
+from common.agent import load_model
+from common.mock import MockChatModel, MockRateLimitError
+from langchain_core.messages import HumanMessage
+
+
+def test_mock_model_options():
+    model = load_model("mock:fast?latency=uniform:0,0.01&error_rate=0.1&seed=3&cache=0")
+    assert isinstance(model, MockChatModel)
+    assert model.model_name == "fast"
+    assert model.latency == "uniform:0,0.01"
+    assert model.error_rate == 0.1
+    assert model.seed == 3
+    assert model.cache is False
+
+
+def test_mock_model_rate_limit():
+    model = MockChatModel(rate_limit_rate=1.0, cache=False)
+    with pytest.raises(MockRateLimitError) as error:
+        model.invoke([HumanMessage(content="hello")])
+    assert error.value.status_code == 429
+
+
+def test_mock_agent_is_deterministic():
+    def score(contents):
+        agent = Agent(
+            prompt="Score the content.",
+            cls=Cookie,
+            base_model="mock:base?cache=0",
+            fallback_model="mock:fallback?cache=0",
+            batch_size=4,
+        )
+        return agent.process(contents)
+
+    contents = [
+        Cookie(content=f"content {i}", author="author").model_dump_json()
+        for i in range(10)
+    ]
+    results = score(contents)
+    assert results == score(contents)
+    for i, result in enumerate(results):
+        assert isinstance(result, Cookie)
+        # string fields are echoed from the input
+        assert result.content == f"content {i}"
+        assert result.author == "author"
+        assert 0 <= result.score.popularity.score <= 10
+
+
+def test_mock_agent_falls_back_on_malformed_output():
+    agent = Agent(
+        prompt="Score the content.",
+        cls=Cookie,
+        base_model="mock:base?malformed_rate=1&cache=0",
+        fallback_model="mock:fallback?cache=0",
+    )
+    results = agent.process([Cookie(content="content").model_dump_json()])
+    assert isinstance(results[0], Cookie)
+    assert results[0].content == "content"
@@ -0,0 +1,42 @@
+import json
+
+from common import Agent, Cookie, usage_tracker
+from common.output import JsonRepairOutputParser, get_response_format, repair_json
+
+
+def test_repair_json():
+    text = 'Here is the result:\n```json\n{"content": "a, b}", "tags": [1, 2,],}\n```'
+    assert json.loads(repair_json(text)) == {"content": "a, b}", "tags": [1, 2]}
+    # the valid JSON is not changed
+    assert repair_json('{"a": ",}"}') == '{"a": ",}"}'
+
+
+def test_repair_parser():
+    parser = JsonRepairOutputParser(pydantic_object=Cookie)
+    cookie = parser.parse('Sure! {"content": "content", "author": "author",}')
+    assert cookie.content == "content"
+
+
+def test_response_format():
+    assert get_response_format("openai:gpt-4o", Cookie)["type"] == "json_schema"
+    assert get_response_format("deepseek:deepseek-chat", Cookie) == {
+        "type": "json_object"
+    }
+
+
+def test_structured_output_avoids_retries():
+    agent = Agent(
+        prompt="Score the content.",
+        cls=Cookie,
+        base_model="mock:structured?malformed_rate=1&cache=0",
+        fallback_model="mock:structured-fallback?cache=0",
+        structured_output=True,
+    )
+    results = agent.process([Cookie(content="content").model_dump_json()])
+    assert isinstance(results[0], Cookie)
+    retries = sum(
+        entry["retries"] + entry["fallbacks"]
+        for entry in usage_tracker.aggregate("model")
+        if entry["model"].startswith("mock:structured")
+    )
+    assert retries == 0
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+from common import Agent, Cookie, pool, pool_stats
+from langchain_openai.chat_models import ChatOpenAI
+
+
+def make_agent() -> Agent:
+    return Agent(
+        prompt="Score the content.",
+        cls=Cookie,
+        base_model="mock:pool?cache=0",
+        fallback_model="mock:pool-fallback?cache=0",
+        batch_size=4,
+    )
+
+
+def test_agents_share_the_chain_and_the_model():
+    first, second = make_agent(), make_agent()
+    chain = first.get_chain()
+    reused = pool_stats()["chains_reused"]
+    assert second.get_chain() is chain
+    assert pool_stats()["chains_reused"] == reused + 1
+    assert pool.get_model("mock:pool?cache=0") is pool.get_model("mock:pool?cache=0")
+    # another key, another chain
+    other = Agent(**{**make_agent().model_dump(), "prompt": "Score it."})
+    assert other.get_chain() is not chain
+
+    second.process([Cookie(content=f"content {i}").model_dump_json() for i in range(8)])
+    stats = pool_stats()
+    assert "mock:pool?cache=0" in stats["models"]
+    assert 1 <= stats["in_flight_peak"]["mock:pool?cache=0"] <= 4
+    assert stats["http_max_connections"] == pool.HTTP_LIMITS.max_connections
+
+
+def test_models_of_an_endpoint_share_the_http_clients():
+    assert pool.get_http_client(None) is pool.get_http_client(None)
+    assert pool.get_http_client("http://a") is not pool.get_http_client(None)
+    assert pool.get_http_async_client("http://a") is pool.get_http_async_client(
+        "http://a"
+    )
+
+
+def test_async_clients_are_bound_to_the_running_loop(monkeypatch):
+    created = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            json={
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "gpt-4o-mini",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "pong"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 1,
+                    "completion_tokens": 1,
+                    "total_tokens": 2,
+                },
+            },
+        )
+
+    def create():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(pool, "create_http_async_client", create)
+    model = ChatOpenAI(
+        model="gpt-4o-mini",
+        api_key="key",
+        base_url="http://loop.test/v1",
+        http_async_client=pool.get_http_async_client("http://loop.test/v1"),
+    )
+
+    async def call():
+        first = await model.ainvoke("ping")
+        second = await model.ainvoke("ping")
+        return first.content + second.content
+
+    # the same model in two event loops, one pool per loop
+    assert asyncio.run(call()) == "pongpong"
+    assert asyncio.run(call()) == "pongpong"
+    assert len(created) == 2
@@ -0,0 +1,35 @@
+import time
+
+from common.profiler import Profiler
+
+
+def busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+def test_profiler_writes_profiles_and_collapsed_stacks(tmp_path):
+    profiler = Profiler(interval=0.001)
+    with profiler.profile("en/jar.score", "score"):
+        busy(0.01)
+    # disabled: nothing is recorded
+    assert profiler.profiles == 0
+
+    profiler.enable(str(tmp_path))
+    with profiler.profile("en/jar.score", "score", "en", "jar"):
+        with profiler.section("Scorer"):
+            busy(0.2)
+    profiler.disable()
+    profiler.save(top=10)
+
+    assert (tmp_path / "en" / "jar.score.prof").exists()
+    stacks = (tmp_path / "samples.collapsed").read_text().splitlines()
+    assert any(
+        line.startswith("score;en;jar;Scorer;") and "profiler_test:busy" in line
+        for line in stacks
+    )
+    report = (tmp_path / "top.txt").read_text()
+    assert "cProfile of 1 blocks" in report
+    assert "busy" in report
+    assert not profiler.labels
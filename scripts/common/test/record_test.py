@@ -0,0 +1,54 @@
+from common import Cookie, Score
+from common.model import ScoreEntry
+from common.record import CookieRecord, to_cookies, to_records
+from transform import Deduplicator, FilterByRank, FilterByScore
+
+
+def make_cookie(content: str, overall: float) -> Cookie:
+    return Cookie(
+        title="Notebook",
+        author="Mark Twain",
+        content=content,
+        source="wikiquote",
+        link="https://en.wikiquote.org/wiki/Mark_Twain",
+        score=Score(
+            explaination="meaning",
+            popularity=ScoreEntry(score=7, explanation="popular"),
+            quality=ScoreEntry(score=6, explanation="good"),
+            sentiment=ScoreEntry(score=5, explanation="neutral"),
+            clarity=ScoreEntry(score=8, explanation="clear"),
+            overall=overall,
+        ),
+    )
+
+
+def test_record_round_trip():
+    cookies = [
+        make_cookie("The secret of getting ahead is getting started.", 7.5),
+        Cookie(content="no score, no attribution"),
+    ]
+    records = to_records(cookies)
+    assert to_cookies(records) == cookies
+    assert [str(record) for record in records] == [str(cookie) for cookie in cookies]
+
+    # parsed from the JSONL without pydantic
+    parsed = [CookieRecord.from_json(cookie.model_dump_json()) for cookie in cookies]
+    assert to_cookies(parsed) == cookies
+    # the attribution strings are shared
+    assert parsed[0].author is records[0].author
+
+
+def test_transformers_take_records():
+    cookies = [
+        make_cookie("Whenever you find yourself on the side of the majority.", 6.0),
+        make_cookie("Whenever you find yourself on the side of the majority!", 9.0),
+        make_cookie("Courage is resistance to fear, mastery of fear.", 8.0),
+        make_cookie("Kindness is the language which the deaf can hear.", 4.0),
+    ]
+    expected = FilterByRank(top=2).transform(
+        FilterByScore(score=5).transform(Deduplicator().transform(cookies))
+    )
+    records = FilterByRank(top=2).transform(
+        FilterByScore(score=5).transform(Deduplicator().transform(to_records(cookies)))
+    )
+    assert to_cookies(records) == expected
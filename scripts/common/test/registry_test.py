@@ -0,0 +1,65 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from common.providers import providers
+from common.registry import Registry
+from extract import extractors
+from transform import transformers
+
+SCRIPTS_DIR = Path(__file__).parent.parent.parent
+
+# the modules only needed to crawl or to call an LLM
+HEAVY_MODULES = [
+    "bs4",
+    "html5lib",
+    "langchain",
+    "langchain_community",
+    "langchain_core",
+    "langchain_openai",
+    "opencc",
+    "requests_cache",
+]
+
+
+def test_registry_resolves_on_first_use():
+    sys.modules.pop("colorsys", None)
+    registry = Registry("converter", {"color": "colorsys:rgb_to_hsv"})
+    registry.register("color.yiq", "colorsys:rgb_to_yiq")
+    assert "colorsys" not in sys.modules
+
+    assert registry.get("color.hsv.v2").__name__ == "rgb_to_hsv"
+    assert registry.get("color.yiq").__name__ == "rgb_to_yiq"
+    assert "color.hls" in registry and "hls" not in registry
+    with pytest.raises(NotImplementedError, match="Unknown converter: hls"):
+        registry.get("hls")
+
+
+def test_registries():
+    assert extractors.get_path("crawler.wikiquote.en") == (
+        "extract.wikiquote:WikiQuoteCrawler"
+    )
+    assert extractors.get("crawler.gushiwen.mingju.0").__name__ == "GushiwenCrawler"
+    assert transformers.get("FilterByRank")(top=3).top == 3
+    assert providers.get("mock").__qualname__ == "MockChatModel.from_name"
+
+
+def test_main_imports_within_budget():
+    # a fresh interpreter, as for `main.py --stats`
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=SCRIPTS_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    assert output[1] == "[]"
+    assert float(output[0]) < 1.0
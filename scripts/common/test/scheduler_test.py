@@ -0,0 +1,77 @@
+import threading
+import time
+
+from common.scheduler import Deferred, Scheduler, Stage, run_deferred
+
+
+def test_scheduler_runs_the_stages():
+    exited = []
+
+    def parse(item):
+        if item == 3:
+            return None
+        if item == 4:
+            raise ValueError("broken item")
+        return item * 10
+
+    def load(item):
+        time.sleep(0.01)
+        return item + 1
+
+    stages = [
+        Stage("parse", parse, workers=2),
+        Stage("load", load, workers=3, queue_size=1),
+    ]
+    lock = threading.Lock()
+
+    def on_exit(item):
+        with lock:
+            exited.append(item)
+
+    scheduler = Scheduler(stages, on_exit=on_exit)
+    scheduler.run(range(6))
+
+    # dropped and failed items exit with the input of their stage
+    assert sorted(exited) == [1, 3, 4, 11, 21, 51]
+    parse_stats, load_stats = scheduler.get_stats()
+    assert parse_stats["processed"] == 5
+    assert parse_stats["dropped"] == 1
+    assert parse_stats["failed"] == 1
+    assert load_stats["processed"] == 4
+    assert load_stats["queue_peak"] <= 1
+    assert not scheduler.threads
+
+
+def test_deferred_items_free_the_worker():
+    polls = {}
+    lock = threading.Lock()
+
+    def poll(item):
+        with lock:
+            polls[item] = polls.get(item, 0) + 1
+            count = polls[item]
+        # done at the third poll
+        return item if count == 3 else Deferred(item, 0.1)
+
+    exited = []
+    stages = [Stage("poll", poll, workers=1), Stage("load", lambda item: item + 1)]
+    scheduler = Scheduler(stages, on_exit=exited.append)
+    scheduler.run(range(4))
+
+    assert sorted(exited) == [1, 2, 3, 4]
+    poll_stats, _ = scheduler.get_stats()
+    assert poll_stats["processed"] == 4
+    assert poll_stats["deferred"] == 8
+    # the 4 items wait together, not one after the other on the single worker
+    assert scheduler.elapsed < 0.6
+
+
+def test_run_deferred():
+    calls = []
+
+    def fn(item):
+        calls.append(item)
+        return Deferred(item + 1, 0) if item < 3 else item * 10
+
+    assert run_deferred(fn, 0) == 30
+    assert calls == [0, 1, 2, 3]
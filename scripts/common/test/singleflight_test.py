@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from common.singleflight import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flight = SingleFlight("test")
+    calls = []
+    started = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"value": 1}
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(flight.do, "key", fetch)
+        started.wait()
+        others = [executor.submit(flight.do, "key", fetch) for _ in range(3)]
+        results = [first.result()] + [f.result() for f in others]
+
+    assert len(calls) == 1
+    assert [shared for _, shared in results] == [False, True, True, True]
+    assert all(result == {"value": 1} for result, _ in results)
+    # the waiting callers get their own copy
+    assert results[1][0] is not results[0][0]
+    assert flight.counters == {"calls": 4, "coalesced": 3}
+
+    # completed calls are not shared
+    assert flight.do("key", fetch) == ({"value": 1}, False)
+    assert len(calls) == 2
+
+
+def test_single_flight_shares_exceptions():
+    flight = SingleFlight("test")
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("failed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(flight.do, "key", fail)
+        started.wait()
+        second = executor.submit(flight.do, "key", fail)
+        for future in (first, second):
+            with pytest.raises(ValueError, match="failed"):
+                future.result()
+
+
+def test_single_flight_coalesces_concurrent_async_calls():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return {"value": 1}
+
+    async def fail():
+        await asyncio.sleep(0.1)
+        raise ValueError("failed")
+
+    async def run():
+        results = await asyncio.gather(*[flight.ado("key", fetch) for _ in range(3)])
+        # a cancelled waiter doesn't cancel the call of the others
+        leader = asyncio.ensure_future(flight.ado("key", fetch))
+        waiter = asyncio.ensure_future(flight.ado("key", fetch))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        results.append(await leader)
+        errors = await asyncio.gather(
+            flight.ado("error", fail), flight.ado("error", fail), return_exceptions=True
+        )
+        return results, errors
+
+    results, errors = asyncio.run(run())
+    assert len(calls) == 2
+    assert [shared for _, shared in results] == [False, True, True, False]
+    assert all(result == {"value": 1} for result, _ in results)
+    assert results[1][0] is not results[0][0]
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert not flight.async_calls
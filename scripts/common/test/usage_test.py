@@ -0,0 +1,134 @@
+import math
+from uuid import uuid4
+
+import pytest
+from common import Agent, Cookie, usage_tracker
+from common.usage import UsageTracker
+from langchain.globals import set_llm_cache
+from langchain_core.caches import InMemoryCache
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+
+def make_result(prompt_tokens: int, completion_tokens: int, cached: bool = False):
+    message = AIMessage(
+        content="{}",
+        usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    )
+    return LLMResult(
+        generations=[[ChatGeneration(message=message)]],
+        # the responses of the llm cache come without `llm_output`
+        llm_output=None if cached else {"token_usage": {}},
+    )
+
+
+def call(tracker: UsageTracker, metadata: dict, result=None, error=None):
+    run_id = uuid4()
+    tracker.on_chat_model_start({}, [[]], run_id=run_id, metadata=metadata)
+    if error:
+        tracker.on_llm_error(error, run_id=run_id)
+    else:
+        tracker.on_llm_end(result, run_id=run_id)
+
+
+def test_usage_tracker_aggregates_by_jar_lang_and_model():
+    tracker = UsageTracker()
+    mini = {"lang": "en", "jar": "a", "model": "openai:gpt-4o-mini"}
+    call(tracker, mini, make_result(1_000_000, 100_000))
+    call(tracker, mini, make_result(1_000_000, 100_000, cached=True))
+    call(tracker, {**mini, "jar": "b"}, make_result(2_000_000, 0))
+    call(tracker, {**mini, "lang": "zh"}, error=ValueError("500"))
+    call(tracker, {**mini, "model": "openai:gpt-4o"}, make_result(0, 1_000_000))
+
+    entry = tracker.entries[("en", "a", "openai:gpt-4o-mini")]
+    assert entry["calls"] == 2
+    assert entry["cache_hits"] == 1
+    # the cache hits don't count tokens
+    assert entry["prompt_tokens"] == 1_000_000
+    assert entry["completion_tokens"] == 100_000
+    assert tracker.entries[("zh", "a", "openai:gpt-4o-mini")]["errors"] == 1
+
+    by_lang = {row["lang"]: row for row in tracker.aggregate("lang")}
+    assert by_lang["en"]["calls"] == 4
+    assert by_lang["en"]["prompt_tokens"] == 3_000_000
+    assert by_lang["zh"]["calls"] == 1
+    assert by_lang["zh"]["cost"] == 0
+
+    by_model = {row["model"]: row for row in tracker.aggregate("model")}
+    assert math.isclose(by_model["openai:gpt-4o-mini"]["cost"], 3 * 0.15 + 0.1 * 0.6)
+    assert math.isclose(by_model["openai:gpt-4o"]["cost"], 10.0)
+    # sorted by cost
+    assert [row["model"] for row in tracker.aggregate("model")][0] == "openai:gpt-4o"
+    assert tracker.to_dict()["total"]["calls"] == 5
+
+
+def test_usage_tracker_cost_of_cached_tokens():
+    entry = {
+        "model": "openai:gpt-4o-mini",
+        "prompt_tokens": 1_000_000,
+        "cached_tokens": 400_000,
+        "completion_tokens": 0,
+    }
+    # the cached prompt tokens are billed at half price by openai
+    assert math.isclose(UsageTracker.get_cost(entry), 0.6 * 0.15 + 0.4 * 0.075)
+    assert UsageTracker.get_cost({**entry, "model": "mock:unknown"}) == 0
+
+
+def get_entry(jar: str, model: str) -> dict:
+    return usage_tracker.entries[("en", jar, model)]
+
+
+def test_usage_tracker_counts_retries_and_fallbacks():
+    base = "mock:usage-base?error_rate=1&cache=0"
+    fallback = "mock:usage-fallback?cache=0"
+    agent = Agent(
+        prompt="Score the content.",
+        cls=Cookie,
+        base_model=base,
+        fallback_model=fallback,
+        metadata={"lang": "en", "jar": "usage-retries"},
+    )
+    results = agent.process([Cookie(content="content").model_dump_json()])
+    assert isinstance(results[0], Cookie)
+
+    entry = get_entry("usage-retries", base)
+    # the first call and its retry fail, then the fallback model answers
+    assert entry["calls"] == 2
+    assert entry["errors"] == 2
+    assert entry["retries"] == 1
+    assert entry["fallbacks"] == 1
+    entry = get_entry("usage-retries", fallback)
+    assert entry["calls"] == 1
+    assert entry["errors"] == 0
+    assert entry["prompt_tokens"] > 0
+
+
+@pytest.fixture
+def llm_cache():
+    set_llm_cache(InMemoryCache())
+    yield
+    set_llm_cache(None)
+
+
+def test_usage_tracker_detects_cache_hits(llm_cache):
+    model = "mock:usage-cache"
+    agent = Agent(
+        prompt="Score the content.",
+        cls=Cookie,
+        base_model=model,
+        fallback_model="mock:usage-cache-fallback",
+        metadata={"lang": "en", "jar": "usage-cache"},
+    )
+    content = Cookie(content="cached content").model_dump_json()
+    agent.process([content])
+    tokens = get_entry("usage-cache", model)["prompt_tokens"]
+    agent.process([content])
+
+    entry = get_entry("usage-cache", model)
+    assert entry["calls"] == 2
+    assert entry["cache_hits"] == 1
+    assert entry["prompt_tokens"] == tokens
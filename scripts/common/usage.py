@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from loguru import logger
+
+from .metrics import metrics
+
+# Approximate list prices in USD per 1M tokens: (prompt, completion)
+PRICES: Dict[str, Tuple[float, float]] = {
+    "openai:gpt-4o-mini": (0.15, 0.60),
+    "openai:gpt-4o": (2.50, 10.00),
+    "tongyi:qwen-turbo-latest": (0.04, 0.08),
+    "tongyi:qwen-plus": (0.11, 0.28),
+    "tongyi:qwen-max": (2.80, 8.40),
+    "deepseek:deepseek-chat": (0.14, 0.28),
+    "moonshot:moonshot-v1-8k": (1.70, 1.70),
+}
+
+# The price of the prompt tokens served from the prompt cache, per provider
+CACHED_PRICE_RATIO: Dict[str, float] = {
+    "openai": 0.5,
+    "deepseek": 0.1,
+    "tongyi": 0.4,
+}
+
+COUNTERS = [
+    "calls",
+    "cache_hits",
+    "coalesced",
+    "errors",
+    "retries",
+    "fallbacks",
+    "parse_failures",
+    "hedges",
+    "hedge_wins",
+    "prompt_tokens",
+    "cached_tokens",
+    "completion_tokens",
+]
+
+
+def get_cached_tokens(usage: dict) -> int:
+    """The prompt tokens served from the prompt cache of the provider, in the
+    raw usage of an OpenAI compatible response."""
+    details = usage.get("prompt_tokens_details") or {}
+    # deepseek reports the hits of its context cache separately
+    return details.get("cached_tokens") or usage.get("prompt_cache_hit_tokens") or 0
+
+
+def get_token_usage(response: LLMResult) -> Tuple[int, int, int]:
+    """Extract (prompt_tokens, completion_tokens, cached_tokens) from a response."""
+    prompt_tokens, completion_tokens, cached_tokens = 0, 0, 0
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is None:
+                continue
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+                details = usage.get("input_token_details") or {}
+                cached_tokens += details.get("cache_read", 0)
+                continue
+            # tongyi puts the usage into the response metadata
+            usage = message.response_metadata.get("token_usage") or {}
+            prompt_tokens += usage.get("input_tokens", usage.get("prompt_tokens", 0))
+            completion_tokens += usage.get(
+                "output_tokens", usage.get("completion_tokens", 0)
+            )
+            cached_tokens += get_cached_tokens(usage)
+    if response.llm_output:
+        usage = response.llm_output.get("token_usage") or {}
+        if not prompt_tokens and not completion_tokens:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        if not cached_tokens:
+            cached_tokens = get_cached_tokens(usage)
+    return prompt_tokens, completion_tokens, cached_tokens
+
+
+class UsageTracker(BaseCallbackHandler):
+    """Records tokens, latency, cache hits, retries and fallbacks of LLM calls.
+
+    The Agent passes this handler with the invocation config, together with
+    metadata such as `lang`, `jar` and `stage`; every chat model in the chain is
+    tagged with its `model` name, so each call can be attributed to a
+    (lang, jar, model) entry.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.runs: Dict[UUID, Tuple[float, dict]] = {}
+        self.entries: Dict[Tuple[str, str, str], dict] = {}
+
+    def get_entry(self, metadata: Optional[dict]) -> dict:
+        metadata = metadata or {}
+        key = (
+            metadata.get("lang", ""),
+            metadata.get("jar", ""),
+            metadata.get("model", ""),
+        )
+        if key not in self.entries:
+            self.entries[key] = {
+                "lang": key[0],
+                "jar": key[1],
+                "model": key[2],
+                "stage": metadata.get("stage", ""),
+                **{counter: 0 for counter in COUNTERS},
+                "latency": 0.0,
+                "latency_max": 0.0,
+            }
+        return self.entries[key]
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        with self.lock:
+            self.runs[run_id] = (time.perf_counter(), dict(metadata or {}))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self.lock:
+            if run_id not in self.runs:
+                return
+            start, metadata = self.runs.pop(run_id)
+            latency = time.perf_counter() - start
+            entry = self.get_entry(metadata)
+            entry["calls"] += 1
+            # responses served by the llm cache come without `llm_output`
+            if not response.llm_output:
+                entry["cache_hits"] += 1
+                metrics.inc("llm_calls", model=entry["model"], status="cache_hit")
+                return
+            metrics.inc("llm_calls", model=entry["model"], status="ok")
+            metrics.observe("llm_latency_seconds", latency, model=entry["model"])
+            prompt_tokens, completion_tokens, cached_tokens = get_token_usage(response)
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["cached_tokens"] += cached_tokens
+            entry["latency"] += latency
+            entry["latency_max"] = max(entry["latency_max"], latency)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self.lock:
+            if run_id not in self.runs:
+                return
+            start, metadata = self.runs.pop(run_id)
+            entry = self.get_entry(metadata)
+            entry["calls"] += 1
+            entry["errors"] += 1
+            metrics.inc("llm_calls", model=entry["model"], status="error")
+            entry["latency"] += time.perf_counter() - start
+
+    def record(self, metadata: Optional[dict], counter: str, value: int = 1):
+        with self.lock:
+            self.get_entry(metadata)[counter] += value
+
+    def merge(self, report: dict):
+        """Adds the entries of a saved report, e.g. of another shard."""
+        with self.lock:
+            for row in report.get("by_jar", []):
+                entry = self.get_entry(row)
+                for counter in COUNTERS + ["latency"]:
+                    entry[counter] += row.get(counter, 0)
+                entry["latency_max"] = max(entry["latency_max"], row["latency_max"])
+
+    @staticmethod
+    def get_cost(entry: dict) -> float:
+        price_prompt, price_completion = PRICES.get(entry["model"], (0.0, 0.0))
+        price_cached = price_prompt * CACHED_PRICE_RATIO.get(
+            entry["model"].split(":", 1)[0], 1.0
+        )
+        cached_tokens = entry.get("cached_tokens", 0)
+        return (
+            (entry["prompt_tokens"] - cached_tokens) * price_prompt
+            + cached_tokens * price_cached
+            + entry["completion_tokens"] * price_completion
+        ) / 1_000_000
+
+    def aggregate(self, *fields: str) -> List[dict]:
+        """Aggregate the entries by the given fields, e.g. ("lang",) or ("model",)."""
+        results = {}
+        with self.lock:
+            entries = list(self.entries.values())
+        for entry in entries:
+            key = tuple(entry[field] for field in fields)
+            if key not in results:
+                results[key] = {
+                    **{field: entry[field] for field in fields},
+                    **{counter: 0 for counter in COUNTERS},
+                    "latency": 0.0,
+                    "latency_max": 0.0,
+                    "cost": 0.0,
+                }
+            result = results[key]
+            for counter in COUNTERS + ["latency"]:
+                result[counter] += entry[counter]
+            result["latency_max"] = max(result["latency_max"], entry["latency_max"])
+            result["cost"] += self.get_cost(entry)
+        return sorted(results.values(), key=lambda r: r["cost"], reverse=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "prices": PRICES,
+            "total": (self.aggregate() or [{}])[0],
+            "by_model": self.aggregate("model"),
+            "by_lang": self.aggregate("lang"),
+            "by_jar": self.aggregate("lang", "jar", "model"),
+        }
+
+    def save(self, filename: str):
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        logger.debug(f"LLM usage report: {filename}")
+
+
+usage_tracker = UsageTracker()
@@ -1,21 +1,30 @@
 # ruff: noqa: F401
-from .crawler import Crawler
-from .extractor import Extractor
-from .gushiwen import GuShiCrawler, MingJuCrawler, ShiWenCrawler
-from .wikiquote import (
-    DailyDeWikiQuoteCrawler,
-    DailyEnWikiQuoteCrawler,
-    DailyEsWikiQuoteCrawler,
-    DailyFrWikiQuoteCrawler,
-    DailyJaWikiQuoteCrawler,
-    DailyRuWikiQuoteCrawler,
-    DeWikiQuoteCrawler,
-    EnWikiQuoteCrawler,
-    EsWikiQuoteCrawler,
-    FrWikiQuoteCrawler,
-    JaWikiQuoteCrawler,
-    RuWikiQuoteCrawler,
-    WikiQuoteCrawler,
-    ZhWikiQuoteCrawler,
+from common.registry import attach
+
+from .extractor import extractors
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    {
+        "Crawler": ".crawler",
+        "Extractor": ".extractor",
+        "GuShiCrawler": ".gushiwen",
+        "MingJuCrawler": ".gushiwen",
+        "ShiWenCrawler": ".gushiwen",
+        "DailyDeWikiQuoteCrawler": ".wikiquote",
+        "DailyEnWikiQuoteCrawler": ".wikiquote",
+        "DailyEsWikiQuoteCrawler": ".wikiquote",
+        "DailyFrWikiQuoteCrawler": ".wikiquote",
+        "DailyJaWikiQuoteCrawler": ".wikiquote",
+        "DailyRuWikiQuoteCrawler": ".wikiquote",
+        "DeWikiQuoteCrawler": ".wikiquote",
+        "EnWikiQuoteCrawler": ".wikiquote",
+        "EsWikiQuoteCrawler": ".wikiquote",
+        "FrWikiQuoteCrawler": ".wikiquote",
+        "JaWikiQuoteCrawler": ".wikiquote",
+        "RuWikiQuoteCrawler": ".wikiquote",
+        "WikiQuoteCrawler": ".wikiquote",
+        "ZhWikiQuoteCrawler": ".wikiquote",
+        "XinhuaCrawler": ".xinhua",
+    },
 )
-from .xinhua import XinhuaCrawler
@@ -6,6 +6,8 @@ from urllib.parse import urljoin
 
 from bs4 import BeautifulSoup
 from common import Cookie, CookieJar
+from common.metrics import metrics
+from common.singleflight import get_single_flight
 from loguru import logger
 from pydantic import BaseModel, Field
 from requests_cache import AnyResponse, CachedSession
@@ -29,17 +31,29 @@ class Crawler(BaseModel):
     )
 
     def get_response(self, url) -> AnyResponse:
-        """获取页面 Response 对象"""
+        """获取页面 Response 对象，并发的相同请求只发送一次"""
+        response, _ = get_single_flight("crawler", copy_result=False).do(
+            (url, tuple(sorted(self.headers.items()))),
+            lambda: self.fetch_response(url),
+        )
+        return response
+
+    def fetch_response(self, url) -> AnyResponse:
         global session
+        cached = False
         try:
             # 对于已经缓存的请求，不再延迟；对于新请求，随机延迟一段时间
-            if not session.cache.contains(url=url):
+            cached = session.cache.contains(url=url)
+            if not cached:
                 time.sleep(random.uniform(self.interval / 3, self.interval))
-            response = session.get(url, headers=self.headers)
+            with metrics.timer("http_request", cached=cached):
+                response = session.get(url, headers=self.headers)
             response.raise_for_status()
+            metrics.inc("http_requests", cached=cached, status="ok")
             response.encoding = "utf-8"
             return response
         except Exception as e:
+            metrics.inc("http_requests", cached=cached, status="error")
             logger.error(f"Crawler.get_response(): Error fetching {url}: {str(e)}")
             self.remove_link_from_cache(url)
             return None
@@ -81,6 +95,14 @@ class Crawler(BaseModel):
             return urljoin(self.base_url, link)
         return None
 
+    def record_item(self, parsed: bool):
+        """记录解析结果，用于进度报告"""
+        metrics.inc(
+            "crawled_items",
+            crawler=type(self).__name__,
+            status="ok" if parsed else "failed",
+        )
+
     def parse_item(self, element) -> Cookie:
         raise NotImplementedError
 
@@ -90,29 +112,6 @@ class Crawler(BaseModel):
     def crawl(self, jar: CookieJar) -> List[Cookie]:
         raise NotImplementedError
 
-    @staticmethod
-    def extract(jar: CookieJar) -> List[Cookie]:
-        parts = jar.extractor.split(".")
-        match parts[0], parts[1]:
-            case "crawler", "gushiwen":
-                from .gushiwen import GushiwenCrawler
-
-                return GushiwenCrawler.extract(jar)
-            case "crawler", "xinhua":
-                from .xinhua import XinhuaCrawler
-
-                return XinhuaCrawler.extract(jar)
-            case "crawler", "wikiquote":
-                from .wikiquote import WikiQuoteCrawler
-
-                return WikiQuoteCrawler.extract(jar)
-            case "crawler", "fortune_mod":
-                from .fortune_mod import ForturnModCrawler
-
-                return ForturnModCrawler.extract(jar)
-            case _:
-                raise NotImplementedError
-
     @staticmethod
     def init_cache(cache_dir: str = None):
         global session
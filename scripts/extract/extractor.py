@@ -1,17 +1,23 @@
 from typing import List
 
 from common import Cookie, CookieJar
+from common.registry import Registry
 from pydantic import BaseModel
 
-from .crawler import Crawler
+# the extractors by prefix, imported when a jar uses them: the crawlers import
+# BeautifulSoup and requests_cache, the daily wikiquote crawlers an LLM agent
+extractors = Registry(
+    "extractor",
+    {
+        "crawler.fortune_mod": "extract.fortune_mod:ForturnModCrawler",
+        "crawler.gushiwen": "extract.gushiwen:GushiwenCrawler",
+        "crawler.wikiquote": "extract.wikiquote:WikiQuoteCrawler",
+        "crawler.xinhua": "extract.xinhua:XinhuaCrawler",
+    },
+)
 
 
 class Extractor(BaseModel):
     @staticmethod
     def extract(jar: CookieJar) -> List[Cookie]:
-        parts = jar.extractor.split(".")
-        match parts[0]:
-            case "crawler":
-                return Crawler.extract(jar)
-            case _:
-                raise NotImplementedError
+        return extractors.get(jar.extractor).extract(jar)
@@ -29,12 +29,12 @@ class MingJuCrawler(Crawler):
                 cookie = self.parse_item(element)
                 if not cookie:
                     logger.warning(f"无法解析名句 {element}")
-                    print("?", end="", flush=True)
+                    self.record_item(False)
                     continue
                 else:
                     cookie.source = jar.name
                     cookies.append(cookie)
-                    print(".", end="", flush=True)
+                    self.record_item(True)
             # print()
             # 获取下一页链接
             next_page = body.find("a", class_="amore")
@@ -105,12 +105,12 @@ class GuShiCrawler(Crawler):
             if not cookie:
                 logger.warning(f"无法解析诗词 {link}")
                 self.remove_link_from_cache(link)
-                print("?", end="", flush=True)
+                self.record_item(False)
             else:
                 cookie.link = link
                 cookie.source = jar.name
                 cookies.append(cookie)
-                print(".", end="", flush=True)
+                self.record_item(True)
         #     if len(cookies) % 50 == 0:
         #         print()
         # print()
@@ -177,13 +177,13 @@ class ShiWenCrawler(GuShiCrawler):
             if not cookie:
                 logger.warning(f"无法解析诗词 {link}")
                 self.remove_link_from_cache(link)
-                print("?", end="", flush=True)
+                self.record_item(False)
                 # continue
             else:
                 cookie.link = link
                 cookie.source = jar.name
                 cookies.append(cookie)
-                print(".", end="", flush=True)
+                self.record_item(True)
         #     if len(cookies) % 50 == 0:
         #         print()
         # print()
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+from common.metrics import metrics
+from extract import crawler
+
+
+class FakeCache:
+    def __init__(self, cached: bool):
+        self.cached = cached
+        self.deleted = []
+
+    def contains(self, url):
+        return self.cached
+
+    def delete(self, urls):
+        self.deleted += urls
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} Error")
+
+
+@pytest.mark.parametrize("cached", [True, False])
+def test_get_response_counts_errors_once(monkeypatch, cached):
+    cache = FakeCache(cached)
+    session = SimpleNamespace(cache=cache, get=lambda url, headers: FakeResponse(404))
+    monkeypatch.setattr(crawler, "session", session)
+    before = {
+        status: metrics.value("http_requests", cached=cached, status=status)
+        for status in ("ok", "error")
+    }
+
+    assert crawler.Crawler(interval=0).fetch_response("https://x/404") is None
+    assert metrics.value("http_requests", cached=cached, status="ok") == before["ok"]
+    assert (
+        metrics.value("http_requests", cached=cached, status="error")
+        == before["error"] + 1
+    )
+    assert cache.deleted == ["https://x/404"]
+
+    session.get = lambda url, headers: FakeResponse(200)
+    assert crawler.Crawler(interval=0).fetch_response("https://x/200") is not None
+    assert (
+        metrics.value("http_requests", cached=cached, status="ok") == before["ok"] + 1
+    )
@@ -235,7 +235,13 @@ class WikiQuoteCrawler(Crawler):
     def process_content_by_llm(
         self, cookies: List[Cookie], jar: CookieJar
     ) -> List[Cookie]:
-        agent = Agent(prompt=self.prompt, base_model=jar.model_name, cls=Quote)
+        agent = Agent(
+            prompt=self.prompt,
+            base_model=jar.model_name,
+            fallback_model=jar.model_name_fallback,
+            cls=Quote,
+            metadata={"lang": jar.lang, "jar": jar.name, "stage": "wikiquote"},
+        )
         cookies_with_source = [cookie for cookie in cookies if cookie.source]
         cookies_without_source = [cookie for cookie in cookies if not cookie.source]
         if len(cookies_without_source) == 0:
@@ -2,3 +2,5 @@
 from .cookiedb import CookieDB
 from .jsonl import Jsonl
 from .loader import Loader
+from .manifest import Manifest
+from .shard import ShardReport
@@ -0,0 +1,47 @@
+import json
+from typing import Any, Iterable, Iterator, Union
+
+from common import Cookie
+from common.record import CookieRecord
+
+try:
+    # several times faster than the json module, which is the fallback
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(line: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def dumps(value: Any) -> bytes:
+    """Compact UTF-8 JSON, as pydantic's `model_dump_json`."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode(item: Union[Cookie, CookieRecord]) -> bytes:
+    """The JSONL line of the cookie, the same bytes for a `Cookie` and its
+    `CookieRecord`."""
+    if isinstance(item, CookieRecord):
+        return dumps(item.to_dict()) + b"\n"
+    return item.model_dump_json().encode("utf-8") + b"\n"
+
+
+def iter_lines(filename: str) -> Iterator[bytes]:
+    """The records of a JSONL file, without the empty lines and comments."""
+    with open(filename, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(b"//"):
+                yield line
+
+
+def write_lines(filename: str, items: Iterable[Union[Cookie, CookieRecord]]):
+    # a large buffer, the lines are written in bulk
+    with open(filename, "wb", buffering=1 << 20) as f:
+        f.writelines(encode(item) for item in items)
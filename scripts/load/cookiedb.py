@@ -1,13 +1,13 @@
 import os
-import subprocess
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from common import Cookie
 from loguru import logger
 from pydantic import Field
 
 from .loader import Loader
+from .strfile import write_dat
 
 
 class CookieDB(Loader):
@@ -35,25 +35,20 @@ class CookieDB(Loader):
             results.append(Cookie(content=section, source=self.name))
         return results
 
-    def save_dat(self):
+    def save_dat(self, data: Optional[bytes] = None):
+        """Writes the `.dat` index of the file for `fortune`, as `strfile`."""
         cookie_file = Path(self.get_filename())
-        cookie_dat_file = cookie_file.with_suffix(".dat")
-
-        if cookie_file.exists() and cookie_file.is_file():
-            logger.debug(f"strfile {cookie_file}")
-            if cookie_dat_file.exists() and cookie_dat_file.is_file():
-                cookie_dat_file.unlink()
-            subprocess.run(["strfile", cookie_file])
-            if not cookie_dat_file.exists() or not cookie_dat_file.is_file():
-                raise FileNotFoundError(f"strfile failed to create {cookie_dat_file}")
-        else:
+        if data is None and not cookie_file.is_file():
             raise FileNotFoundError(f"Cookie file {cookie_file} not found")
+        logger.debug(f"strfile {cookie_file}")
+        write_dat(str(cookie_file), data)
 
     def save(self, data: List[Cookie]):
         filename = self.get_filename()
         Path.mkdir(Path(filename).parent, parents=True, exist_ok=True)
-        with open(filename, "w", encoding="utf-8") as f:
-            for item in data:
-                f.write(f"{item}\n%\n")
+        content = "".join(f"{item}\n%\n" for item in data).encode("utf-8")
+        with open(filename, "wb") as f:
+            f.write(content)
         if self.dat_file:
-            self.save_dat()
+            # indexed from the content in memory, without reading it back
+            self.save_dat(content)
@@ -1,29 +1,34 @@
 import os
-from typing import List
+from typing import Iterator, List, Union
 
 from common import Cookie
+from common.record import CookieRecord, LazyRecord
 
+from .codec import iter_lines, loads, write_lines
 from .loader import Loader
 
 
 class Jsonl(Loader):
-    def load(self) -> List[Cookie]:
-        results = []
-        filename = self.get_filename() + ".jsonl"
+    def iter(self) -> Iterator[Cookie]:
+        """Yields the cookies one by one, without loading the whole file."""
+        for line in iter_lines(self.get_filename() + ".jsonl"):
+            yield Cookie.model_validate_json(line)
+
+    def iter_records(self) -> Iterator[CookieRecord]:
+        """Yields the cookies as compact records, parsed without pydantic."""
+        for line in iter_lines(self.get_filename() + ".jsonl"):
+            yield CookieRecord.from_dict(loads(line))
 
-        with open(filename, "r", encoding="utf-8") as f:
-            for line in f:
-                # ignore empty lines and comments
-                line = line.strip()
-                if not line or line.startswith("//"):
-                    continue
-                results.append(Cookie.model_validate_json(line))
-        return results
+    def iter_lazy(self) -> Iterator[LazyRecord]:
+        """Yields the decoded cookies, built into records only on demand."""
+        for line in iter_lines(self.get_filename() + ".jsonl"):
+            yield LazyRecord(loads(line))
+
+    def load(self) -> List[Cookie]:
+        return list(self.iter())
 
-    def save(self, data: List[Cookie]):
+    def save(self, data: List[Union[Cookie, CookieRecord]]):
         # make sure the directory exists
         filename = self.get_filename() + ".jsonl"
         os.makedirs(os.path.dirname(filename), exist_ok=True)
-        with open(filename, "w", encoding="utf-8") as f:
-            for item in data:
-                f.write(item.model_dump_json() + "\n")
+        write_lines(filename, data)
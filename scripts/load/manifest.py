@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from common import Cookie
+from loguru import logger
+from pydantic import BaseModel, Field
+
+
+def hash_json(data) -> str:
+    text = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def hash_files(filenames: Iterable[str]) -> str:
+    h = hashlib.sha256()
+    for filename in sorted(filenames):
+        h.update(Path(filename).name.encode("utf-8"))
+        if os.path.exists(filename):
+            with open(filename, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def get_histogram(cookies: List[Cookie]) -> List[int]:
+    """The number of cookies by overall score, in 11 bins from 0 to 10."""
+    histogram = [0] * 11
+    for cookie in cookies:
+        if cookie.score:
+            histogram[min(10, max(0, int(cookie.score.overall)))] += 1
+    return histogram
+
+
+def hash_cookies(cookies: List[Cookie]) -> str:
+    h = hashlib.sha256()
+    for cookie in cookies:
+        h.update(cookie.model_dump_json().encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()[:16]
+
+
+class Manifest(BaseModel):
+    """The record of the last build of a jar, stored next to its outputs in
+    `manifests/<lang>/<name>.json`.
+
+    The fingerprint is made of the hashes of the inputs of the build, e.g. the
+    jar definition, the crawled content, the transformer configuration and the
+    code, so a jar is only rebuilt if one of them changed.
+    """
+
+    lang: str = Field(default="", description="The language of the jar.")
+    name: str = Field(default="", description="The name of the jar.")
+    fingerprint: Dict[str, str] = Field(
+        default={}, description="The hashes of the inputs, by component."
+    )
+    crawled: int = Field(default=0, description="The number of crawled cookies.")
+    scored: int = Field(default=0, description="The number of scored cookies.")
+    tier2: int = Field(default=0, description="The number of saved cookies.")
+    tier1: int = Field(default=0, description="The number of tier1 cookies.")
+    sizes: Dict[str, int] = Field(
+        default={}, description="The size in bytes of the output files, by output."
+    )
+    histogram: List[int] = Field(
+        default=[],
+        description="The number of scored cookies by overall score, in 11 bins from 0 to 10.",
+    )
+    duration: float = Field(
+        default=0, description="The wall time of the build in seconds, by sharding."
+    )
+    crawled_at: float = Field(default=0, description="The time of the crawl.")
+    updated_at: float = Field(default=0, description="The time of the build.")
+
+    @staticmethod
+    def get_filename(base_dir: str, lang: str, name: str = "") -> Path:
+        """The manifest of the jar, or of the tier1 of the language if no name."""
+        if not name:
+            return Path(base_dir) / "manifests" / f"{lang}.json"
+        return Path(base_dir) / "manifests" / lang / f"{name}.json"
+
+    @staticmethod
+    def load(base_dir: str, lang: str, name: str = "") -> Optional["Manifest"]:
+        filename = Manifest.get_filename(base_dir, lang, name)
+        if not filename.exists():
+            return None
+        try:
+            return Manifest.model_validate_json(filename.read_text(encoding="utf-8"))
+        except ValueError as e:
+            logger.warning(f"Manifest: ignoring invalid {filename}: {e}")
+            return None
+
+    def save(self, base_dir: str):
+        self.updated_at = time.time()
+        filename = Manifest.get_filename(base_dir, self.lang, self.name)
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text(self.model_dump_json(indent=2), encoding="utf-8")
+
+    def set_size(self, output: str, filename: str):
+        if os.path.exists(filename):
+            self.sizes[output] = os.path.getsize(filename)
+
+    def matches(self, fingerprint: Dict[str, str], components: Iterable[str]) -> bool:
+        return all(
+            self.fingerprint.get(component) == fingerprint.get(component)
+            for component in components
+        )
@@ -0,0 +1,163 @@
+import heapq
+import shutil
+import statistics
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from common import CookieJar
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from .manifest import Manifest
+
+# The outputs of a jar built by a shard, copied by the merge.
+JAR_OUTPUTS = [
+    "manifests/{lang}/{name}.json",
+    "raw/crawled/{lang}/{name}.jsonl",
+    "raw/processed/{lang}/{name}.jsonl",
+    "raw/scored/{lang}/{name}.jsonl",
+    "raw/scoring/{lang}/{name}.jsonl",
+    "tier2/{lang}/{name}",
+    "tier2/{lang}/{name}.dat",
+]
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """Parses `i/n`, with `i` from 1 to `n`."""
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected 'i/n', e.g. '1/4'")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{shard}', expected 1 <= i <= n")
+    return index, count
+
+
+def get_jar_costs(jars: List[CookieJar], base_dir: str) -> Dict[Tuple[str, str], float]:
+    """The cost of the jars, from the duration of their last build.
+
+    The jars built before the durations were recorded are estimated from the
+    number of crawled cookies, the new jars get the median cost.
+    """
+    manifests = {
+        (jar.lang, jar.name): Manifest.load(base_dir, jar.lang, jar.name)
+        for jar in jars
+    }
+    rates = [
+        m.duration / m.crawled
+        for m in manifests.values()
+        if m and m.duration and m.crawled
+    ]
+    rate = statistics.median(rates) if rates else 0.0
+    costs = {}
+    for key, manifest in manifests.items():
+        if manifest and manifest.duration:
+            costs[key] = manifest.duration
+        elif manifest and manifest.crawled and rate:
+            costs[key] = manifest.crawled * rate
+        elif manifest and manifest.crawled:
+            costs[key] = float(manifest.crawled)
+    default = statistics.median(costs.values()) if costs else 1.0
+    return {key: costs.get(key, default) for key in manifests}
+
+
+def assign_shards(
+    jars: List[CookieJar], costs: Dict[Tuple[str, str], float], count: int
+) -> List[List[CookieJar]]:
+    """Splits the jars into `count` shards of about the same cost, with the
+    longest processing time first rule: the most costly jar goes to the least
+    loaded shard.
+
+    The assignment only depends on the jars and their costs, so every machine
+    computes the same shards from the same manifests. The jars of a shard keep
+    the order of the tasks.
+    """
+    order = {(jar.lang, jar.name): i for i, jar in enumerate(jars)}
+    ranked = sorted(
+        jars,
+        key=lambda jar: (-costs[(jar.lang, jar.name)], order[(jar.lang, jar.name)]),
+    )
+    # (load, index) of the shards
+    loads = [(0.0, i) for i in range(count)]
+    shards: List[List[CookieJar]] = [[] for _ in range(count)]
+    for jar in ranked:
+        load, i = heapq.heappop(loads)
+        shards[i].append(jar)
+        heapq.heappush(loads, (load + costs[(jar.lang, jar.name)], i))
+    return [
+        sorted(shard, key=lambda jar: order[(jar.lang, jar.name)]) for shard in shards
+    ]
+
+
+def select_shard(
+    jars: List[CookieJar], base_dir: str, index: int, count: int
+) -> List[CookieJar]:
+    costs = get_jar_costs(jars, base_dir)
+    shards = assign_shards(jars, costs, count)
+    for i, shard in enumerate(shards, 1):
+        cost = sum(costs[(jar.lang, jar.name)] for jar in shard)
+        logger.debug(f"Shard {i}/{count}: {len(shard)} jars, cost {cost:.0f}s")
+    return shards[index - 1]
+
+
+class ShardReport(BaseModel):
+    """What a shard built, with its metrics and LLM usage, stored in
+    `reports/shards/<i>.json` for the merge."""
+
+    shard: int = Field(default=1, description="The index of the shard, from 1.")
+    shards: int = Field(default=1, description="The number of shards.")
+    jars: List[str] = Field(
+        default=[], description="The jars of the shard, as lang/name."
+    )
+    metrics: dict = Field(default={}, description="The snapshot of the metrics.")
+    usage: dict = Field(default={}, description="The LLM usage report.")
+
+    @staticmethod
+    def get_dir(base_dir: str) -> Path:
+        return Path(base_dir) / "reports" / "shards"
+
+    def save(self, base_dir: str):
+        filename = ShardReport.get_dir(base_dir) / f"{self.shard}.json"
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text(self.model_dump_json(), encoding="utf-8")
+
+    @staticmethod
+    def load_all(base_dir: str) -> List["ShardReport"]:
+        return [
+            ShardReport.model_validate_json(filename.read_text(encoding="utf-8"))
+            for filename in sorted(ShardReport.get_dir(base_dir).glob("*.json"))
+        ]
+
+
+def merge_shard_dirs(shard_dirs: List[str], base_dir: str) -> List[ShardReport]:
+    """Copies the outputs of the shards, e.g. the artifacts of CI runners, into
+    `base_dir`. Only the jars listed in the shard reports are copied, so the
+    stale outputs of the other jars in a shard directory are ignored.
+
+    Returns the reports found in the shard directories, to merge: those of
+    former runs left in `base_dir` are not."""
+    target = Path(base_dir).resolve()
+    merged = []
+    for shard_dir in shard_dirs:
+        source = Path(shard_dir).resolve()
+        reports = ShardReport.load_all(str(source))
+        merged += reports
+        if source == target:
+            continue
+        filenames = []
+        for report in reports:
+            filenames.append(ShardReport.get_dir(str(source)) / f"{report.shard}.json")
+            for jar in report.jars:
+                lang, name = jar.split("/", 1)
+                for output in JAR_OUTPUTS:
+                    filenames.append(source / output.format(lang=lang, name=name))
+        copied = 0
+        for filename in filenames:
+            if not filename.exists():
+                continue
+            destination = target / filename.relative_to(source)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(filename, destination)
+            copied += 1
+        logger.info(f"Merge: {copied} files from {source}")
+    return merged
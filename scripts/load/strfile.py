@@ -0,0 +1,170 @@
+"""Writes the `.dat` index of fortune files, as `strfile` of fortune-mod.
+
+The index is a header of big-endian uint32s (version, number of strings,
+longest and shortest length, flags) followed by the delimiter and 3 pad bytes,
+then the big-endian uint32 offsets of the strings, and the offset of the end
+of the last one.
+
+Run it directly to index the files of whole trees in parallel, e.g.
+`python scripts/load/strfile.py cookies/tier1 cookies/tier2`: it only uses the
+standard library.
+"""
+
+import argparse
+import io
+import os
+import random
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+VERSION = 2
+
+# the flags of the header
+RANDOM = 0x1
+ORDERED = 0x2
+ROTATED = 0x4
+COMMENTS = 0x8
+
+HEADER = struct.Struct(">5Ic3x")
+OFFSET = struct.Struct(">I")
+
+
+class Header(NamedTuple):
+    version: int
+    numstr: int
+    longlen: int
+    shortlen: int
+    flags: int
+    delim: bytes
+
+
+def get_strings(data: bytes, delim: bytes = b"%") -> Tuple[List[int], List[int]]:
+    """The offsets and lengths of the strings of a fortune file, as strfile
+    reads them: a string ends at a line with only the delimiter, and its
+    length includes its last newline. Empty strings are skipped.
+
+    The offsets have one more item, the end of the last string (after its
+    delimiter line).
+    """
+    end_line = delim + b"\n"
+    offsets, lengths = [0], []
+    last = pos = 0
+    for line in io.BytesIO(data):
+        pos += len(line)
+        if line == end_line:
+            length = pos - last - len(line)
+            last = pos
+            if length:
+                offsets.append(pos)
+                lengths.append(length)
+    if pos > last:
+        # the last string without a delimiter
+        offsets.append(pos)
+        lengths.append(pos - last)
+    return offsets, lengths
+
+
+def get_order_key(data: bytes, ignore_case: bool):
+    def key(string: Tuple[int, int]) -> bytes:
+        offset, length = string
+        text = data[offset : offset + length]
+        # strfile -o skips the leading punctuation and spaces
+        start = 0
+        while start < len(text) and not text[start : start + 1].isalnum():
+            start += 1
+        text = text[start:]
+        return text.lower() if ignore_case else text
+
+    return key
+
+
+def build_index(
+    data: bytes,
+    delim: bytes = b"%",
+    ordered: bool = False,
+    ignore_case: bool = False,
+    randomized: bool = False,
+    seed: Optional[int] = None,
+) -> bytes:
+    """The `.dat` index of the fortune file `data`, like `strfile` with the
+    options `-o`, `-i` and `-r`."""
+    offsets, lengths = get_strings(data, delim)
+    strings = list(zip(offsets, lengths))
+    flags = 0
+    if ordered:
+        strings.sort(key=get_order_key(data, ignore_case))
+        flags |= ORDERED
+    if randomized:
+        random.Random(seed).shuffle(strings)
+        flags |= RANDOM
+    header = HEADER.pack(
+        VERSION,
+        len(lengths),
+        max(lengths, default=0),
+        min(lengths, default=0),
+        flags,
+        delim,
+    )
+    return header + b"".join(
+        OFFSET.pack(offset) for offset in [*(s[0] for s in strings), offsets[-1]]
+    )
+
+
+def get_dat_filename(filename: str) -> str:
+    return f"{filename}.dat"
+
+
+def write_dat(filename: str, data: Optional[bytes] = None, **options) -> str:
+    """Writes the index of the fortune file, from its content if given."""
+    if data is None:
+        data = Path(filename).read_bytes()
+    dat_filename = get_dat_filename(filename)
+    Path(dat_filename).write_bytes(build_index(data, **options))
+    return dat_filename
+
+
+def read_dat(filename: str) -> Tuple[Header, List[int]]:
+    """The header and the offsets of a `.dat` index."""
+    data = Path(filename).read_bytes()
+    header = Header(*HEADER.unpack_from(data))
+    offsets = [
+        OFFSET.unpack_from(data, HEADER.size + i * OFFSET.size)[0]
+        for i in range(header.numstr + 1)
+    ]
+    return header, offsets
+
+
+def find_fortune_files(roots: Iterable[str]) -> List[str]:
+    """The fortune files of the trees, i.e. all the files but the indexes and
+    the READMEs."""
+    return sorted(
+        str(path)
+        for root in roots
+        for path in Path(root).rglob("*")
+        if path.is_file() and path.suffix not in (".dat", ".md")
+    )
+
+
+def write_dats(filenames: List[str], max_workers: Optional[int] = None) -> List[str]:
+    """Writes the indexes of the fortune files in parallel processes."""
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(write_dat, filenames, chunksize=8))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Writes the strfile .dat index of the fortune files."
+    )
+    parser.add_argument("paths", nargs="+", help="Fortune files or directories.")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="Worker processes.")
+    args = parser.parse_args()
+    filenames = [path for path in args.paths if os.path.isfile(path)]
+    filenames += find_fortune_files(path for path in args.paths if os.path.isdir(path))
+    for dat_filename in write_dats(filenames, args.jobs or None):
+        print(dat_filename)
+
+
+if __name__ == "__main__":
+    main()
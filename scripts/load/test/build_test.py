@@ -0,0 +1,299 @@
+import hashlib
+import time
+from pathlib import Path
+
+import main
+import pytest
+from common import Agent, Cookie, CookieJar, Score
+from common.batch import LocalBatchBackend
+from common.record import ScoreRecord, to_records
+from langchain.globals import set_llm_cache
+from load import Jsonl, Manifest
+from load.strfile import read_dat
+from transform import Scorer
+
+
+def make_state(base_dir: str) -> main.JarState:
+    jar = CookieJar(lang="en", name="twain", extractor="crawler.wikiquote.en")
+    return main.create_jar_state(jar, base_dir)
+
+
+def test_load_jar_writes_the_indexes(tmp_path):
+    state = make_state(str(tmp_path))
+    state.cookies = to_records(
+        [
+            Cookie(content=f"quote {i}", score=Score(overall=7 + i / 10))
+            for i in range(3)
+        ]
+    )
+    main.load_jar(state, str(tmp_path))
+    header, offsets = read_dat(str(tmp_path / "tier2" / "en" / "twain.dat"))
+    assert header.numstr == 3
+    assert offsets[-1] == (tmp_path / "tier2" / "en" / "twain").stat().st_size
+
+    main.process_tier1_lang("en", [state.jar], str(tmp_path))
+    header, _ = read_dat(str(tmp_path / "tier1" / "en.dat"))
+    assert header.numstr == 3
+
+
+def test_get_code_fingerprint_hashes_the_extractor_module(monkeypatch):
+    hashed = []
+    monkeypatch.setattr(main, "hash_files", lambda files: hashed.append(list(files)))
+    main.get_code_fingerprint.cache_clear()
+    try:
+        main.get_code_fingerprint("crawler.wikiquote.en")
+        main.get_code_fingerprint("crawler.gushiwen")
+        main.get_code_fingerprint("crawler.unknown.en")
+    finally:
+        main.get_code_fingerprint.cache_clear()
+    assert [Path(files[-1]).name for files in hashed] == [
+        "wikiquote.py",
+        "gushiwen.py",
+        "unknown.py",
+    ]
+
+
+def test_get_fingerprint(tmp_path):
+    state = make_state(str(tmp_path))
+    fingerprint = main.get_fingerprint(state)
+    assert set(fingerprint) == {"jar", "extract_code", "config", "code"}
+    assert main.get_fingerprint(make_state(str(tmp_path))) == fingerprint
+
+    # the runtime fields don't change the outputs
+    state.transformers["score"][0].batch_size = 10
+    assert main.get_fingerprint(state) == fingerprint
+
+    state.transformers["transform"][1].top = 10
+    changed = main.get_fingerprint(state)
+    assert changed["config"] != fingerprint["config"]
+    assert changed["jar"] == fingerprint["jar"]
+
+    jar = state.jar.model_copy(update={"extractor": "crawler.gushiwen"})
+    changed = main.get_fingerprint(main.create_jar_state(jar, str(tmp_path)))
+    assert changed["jar"] != fingerprint["jar"]
+    assert changed["extract_code"] != fingerprint["extract_code"]
+    assert changed["code"] == fingerprint["code"]
+
+
+def test_manifest_matches():
+    manifest = Manifest(fingerprint={"jar": "a", "config": "b", "content": "c"})
+    assert manifest.matches({"jar": "a", "config": "b"}, ("jar", "config"))
+    assert manifest.matches({"jar": "a", "config": "x"}, ("jar",))
+    assert not manifest.matches({"jar": "a", "config": "x"}, ("jar", "config"))
+    # a component missing on one side only doesn't match
+    assert not manifest.matches({"jar": "a", "code": "d"}, ("jar", "code"))
+    assert Manifest().matches({}, ("jar", "code"))
+
+
+def test_is_up_to_date(tmp_path):
+    base_dir = str(tmp_path)
+    state = make_state(base_dir)
+    assert state.manifest is None
+    assert not main.is_up_to_date(state, base_dir)
+
+    Manifest(lang="en", name="twain", fingerprint=state.fingerprint).save(base_dir)
+    state = make_state(base_dir)
+    # the outputs are missing
+    assert not main.is_up_to_date(state, base_dir)
+
+    state.cookies = to_records([Cookie(content="quote", score=Score(overall=8))])
+    main.load_jar(state, base_dir)
+    assert main.is_up_to_date(make_state(base_dir), base_dir)
+
+    state = make_state(base_dir)
+    state.transformers["transform"][1].top = 10
+    state.fingerprint = main.get_fingerprint(state)
+    assert not main.is_up_to_date(state, base_dir)
+
+    (tmp_path / "tier2" / "en" / "twain").unlink()
+    assert not main.is_up_to_date(make_state(base_dir), base_dir)
+
+
+def test_load_jar_removes_the_scoring_checkpoint(tmp_path):
+    state = make_state(str(tmp_path))
+    checkpoint_file = Path(state.transformers["score"][0].checkpoint_file)
+    checkpoint_file.parent.mkdir(parents=True)
+    checkpoint_file.write_text("")
+    state.cookies = to_records([Cookie(content="quote", score=Score(overall=8))])
+    main.load_jar(state, str(tmp_path))
+    assert (tmp_path / "raw" / "processed" / "en" / "twain.jsonl").exists()
+    assert not checkpoint_file.exists()
+
+
+def test_process_tier2_in_batch_mode(tmp_path, monkeypatch):
+    def extract(jar):
+        # distinct enough not to be deduplicated
+        return [
+            Cookie(content=hashlib.sha256(f"{jar.name} {i}".encode()).hexdigest())
+            for i in range(12)
+        ]
+
+    submitted = []
+    submit = LocalBatchBackend.submit
+
+    def count_submit(self, request_file):
+        submitted.append(request_file)
+        return submit(self, request_file)
+
+    monkeypatch.setattr(main.Extractor, "extract", staticmethod(extract))
+    monkeypatch.setattr(LocalBatchBackend, "submit", count_submit)
+    jars = [
+        CookieJar(
+            lang="en",
+            name=name,
+            extractor="crawler.wikiquote.en",
+            model_name="mock:batch?cache=0",
+            model_name_fallback="mock:batch-fallback?cache=0",
+        )
+        for name in ("batch-a", "batch-b")
+    ]
+    batch_dir = str(tmp_path / "batches")
+    Agent.init_cache(str(tmp_path))
+    try:
+        stats = main.process_tier2(
+            jars, str(tmp_path), batch_backend="local", batch_dir=batch_dir
+        )
+        score_stats = next(row for row in stats if row["stage"] == "score")
+        assert score_stats["processed"] == 2
+        assert score_stats["deferred"] >= 2
+        assert len(submitted) == 2
+
+        def load_processed(jar):
+            location = str(tmp_path / "raw" / "processed" / "en")
+            return Jsonl(name=jar.name, location=location).load()
+
+        outputs = {}
+        for jar in jars:
+            processed = outputs[jar.name] = load_processed(jar)
+            # the scores of the batch are those of the interactive calls
+            expected = Scorer(
+                model_name=jar.model_name, model_name_fallback=jar.model_name_fallback
+            ).score(extract(jar))
+            expected = {cookie.content: cookie.score for cookie in expected}
+            assert processed
+            for cookie in processed:
+                assert cookie.score == expected[cookie.content]
+                assert cookie.score.overall >= 6.5
+            assert len(processed) == sum(
+                score.overall >= 6.5 for score in expected.values()
+            )
+
+        # the batch responses were cached: nothing is submitted again
+        main.process_tier2(
+            jars, str(tmp_path), batch_backend="local", batch_dir=batch_dir, force=True
+        )
+        assert len(submitted) == 2
+        for jar in jars:
+            assert load_processed(jar) == outputs[jar.name]
+    finally:
+        set_llm_cache(None)
+
+
+SHARED_QUOTE = "The only way to do great work is to love what you do."
+
+
+def build_dedup_jars(
+    monkeypatch, base_dir: Path, slow: str = "", force=False, link: str = ""
+):
+    """Builds two jars sharing a quote, `slow` being crawled last and `link`
+    being the link of the second one, adding a quote to it, and returns the
+    processed contents by jar."""
+
+    def score(state):
+        for cookie in state.cookies:
+            cookie.score = ScoreRecord.from_score(Score(overall=9))
+        return state
+
+    def extract(jar):
+        if jar.name == slow:
+            time.sleep(0.2)
+        cookies = [
+            Cookie(content=SHARED_QUOTE),
+            Cookie(content=f"{jar.name} own quote"),
+        ]
+        if jar.link:
+            cookies.append(Cookie(content=f"{jar.name} new quote"))
+        return cookies
+
+    monkeypatch.setattr(main, "score_jar", score)
+    monkeypatch.setattr(main.Extractor, "extract", staticmethod(extract))
+    jars = [
+        CookieJar(lang="en", name="first", extractor="crawler.wikiquote.en"),
+        CookieJar(
+            lang="en", name="second", extractor="crawler.wikiquote.en", link=link
+        ),
+    ]
+    main.process_tier2(jars, str(base_dir), force=force)
+    return {
+        jar.name: [
+            cookie.content
+            for cookie in Jsonl(
+                name=jar.name, location=str(base_dir / "raw" / "processed" / "en")
+            ).load()
+        ]
+        for jar in jars
+    }
+
+
+def test_process_tier2_dedup_winner_is_the_first_jar(tmp_path, monkeypatch):
+    # whichever jar is crawled first, the jar first in the tasks keeps the copy
+    for slow in ("first", "second"):
+        kept = build_dedup_jars(monkeypatch, tmp_path / slow, slow)
+        assert sorted(kept["first"]) == sorted([SHARED_QUOTE, "first own quote"])
+        assert kept["second"] == ["second own quote"]
+
+
+def test_process_tier2_twice_in_one_process(tmp_path, monkeypatch):
+    kept = build_dedup_jars(monkeypatch, tmp_path)
+    # the claims of the first build don't drop the cookies of the second one
+    assert build_dedup_jars(monkeypatch, tmp_path, force=True) == kept
+    assert kept["second"] == ["second own quote"]
+
+
+def test_process_tier2_seeds_the_dedup_index_with_the_skipped_jars(
+    tmp_path, monkeypatch
+):
+    kept = build_dedup_jars(monkeypatch, tmp_path)
+    first = tmp_path / "raw" / "processed" / "en" / "first.jsonl"
+    mtime = first.stat().st_mtime_ns
+    # only the second jar is rebuilt, it still drops the quote of the first one
+    rebuilt = build_dedup_jars(monkeypatch, tmp_path, link="https://example.com")
+    assert rebuilt["first"] == kept["first"]
+    assert sorted(rebuilt["second"]) == ["second new quote", "second own quote"]
+    assert first.stat().st_mtime_ns == mtime
+
+
+def test_run_jar_job_retry_keeps_the_cookies(tmp_path, monkeypatch):
+    def score(state):
+        for cookie in state.cookies:
+            cookie.score = ScoreRecord.from_score(Score(overall=9))
+        return state
+
+    attempts = []
+    load_jar = main.load_jar
+
+    def flaky_load(state, base_dir):
+        attempts.append(state.jar.name)
+        if len(attempts) == 1:
+            raise RuntimeError("disk full")
+        return load_jar(state, base_dir)
+
+    monkeypatch.setattr(main, "score_jar", score)
+    monkeypatch.setattr(main, "load_jar", flaky_load)
+    monkeypatch.setattr(
+        main.Extractor,
+        "extract",
+        staticmethod(lambda jar: [Cookie(content=SHARED_QUOTE)]),
+    )
+    jar = CookieJar(lang="en", name="first", extractor="crawler.wikiquote.en")
+    payload = {
+        "jar": jar.model_dump(),
+        "base_dir": str(tmp_path),
+        "batch_backend": "",
+        "scorer_options": {},
+        "force": False,
+    }
+    # the retry in the same worker doesn't see the claims of the failed attempt
+    with pytest.raises(RuntimeError):
+        main.run_jar_job(payload)
+    assert main.run_jar_job(payload) == {"crawled": 1, "tier2": 1}
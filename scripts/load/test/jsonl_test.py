@@ -0,0 +1,66 @@
+import importlib
+import sys
+
+from common import Cookie, Score
+from common.model import ScoreEntry
+from common.record import to_cookies, to_records
+from load import Jsonl, codec
+
+
+def make_cookies():
+    return [
+        Cookie(
+            title="Notebook",
+            author="Mark Twain",
+            content="The secret of getting ahead is getting started. «ça»",
+            source="wikiquote",
+            link="https://en.wikiquote.org/wiki/Mark_Twain",
+            score=Score(
+                explaination="meaning",
+                popularity=ScoreEntry(score=7, explanation="popular"),
+                quality=ScoreEntry(score=6.5, explanation="good"),
+                clarity=ScoreEntry(score=8, explanation="clear"),
+                overall=7.25,
+            ),
+        ),
+        Cookie(content="不积跬步，无以至千里", author="荀子"),
+    ]
+
+
+def test_jsonl_codec(tmp_path, monkeypatch):
+    cookies = make_cookies()
+    expected = "".join(cookie.model_dump_json() + "\n" for cookie in cookies)
+
+    # the same lines for the cookies and their records, with or without orjson
+    jsonl = Jsonl(name="jar", location=str(tmp_path))
+    for orjson in (codec.orjson, None):
+        monkeypatch.setattr(codec, "orjson", orjson)
+        for items in (cookies, to_records(cookies)):
+            jsonl.save(items)
+            assert (tmp_path / "jar.jsonl").read_text(encoding="utf-8") == expected
+
+    with open(tmp_path / "jar.jsonl", "a", encoding="utf-8") as f:
+        f.write("\n// a comment\n")
+    assert jsonl.load() == cookies
+    assert to_cookies(jsonl.iter_records()) == cookies
+    lazy = list(jsonl.iter_lazy())
+    assert [record.overall for record in lazy] == [7.25, 0.0]
+    assert to_cookies(record.to_record() for record in lazy) == cookies
+
+
+def test_jsonl_codec_without_orjson(tmp_path, monkeypatch):
+    cookies = make_cookies()
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    try:
+        importlib.reload(codec)
+        assert codec.orjson is None
+        jsonl = Jsonl(name="jar", location=str(tmp_path))
+        jsonl.save(to_records(cookies))
+        assert (tmp_path / "jar.jsonl").read_text(encoding="utf-8") == "".join(
+            cookie.model_dump_json() + "\n" for cookie in cookies
+        )
+        assert to_cookies(jsonl.iter_records()) == cookies
+    finally:
+        monkeypatch.undo()
+        importlib.reload(codec)
+    assert codec.orjson is not None
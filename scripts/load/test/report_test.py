@@ -0,0 +1,88 @@
+import report
+from load import Manifest
+
+
+def write_lines(path, count: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(f'{{"content": "{i}"}}\n' for i in range(count)))
+
+
+def test_load_stats(tmp_path, capsys):
+    base_dir = str(tmp_path)
+    Manifest(lang="en", tier1=3, sizes={"tier1": 100}).save(base_dir)
+    Manifest(
+        lang="en",
+        name="a",
+        crawled=10,
+        tier2=4,
+        sizes={"tier2": 50},
+        histogram=[0] * 7 + [2, 2, 0, 0],
+    ).save(base_dir)
+    # a jar built before the manifests
+    write_lines(tmp_path / "raw" / "crawled" / "en" / "b.jsonl", 6)
+    write_lines(tmp_path / "raw" / "processed" / "en" / "b.jsonl", 4)
+    # a language without manifests at all
+    write_lines(tmp_path / "raw" / "crawled" / "zh" / "c.jsonl", 4)
+    write_lines(tmp_path / "raw" / "processed" / "zh" / "c.jsonl", 2)
+    (tmp_path / "tier1").mkdir()
+    (tmp_path / "tier1" / "zh").write_text("a\n%\nb\n%\n")
+
+    stats = report.load_stats([("en", "a"), ("en", "b"), ("zh", "c")], base_dir)
+    assert stats["en"] == {
+        "lang": "en",
+        "crawled": 16,
+        "tier1": 3,
+        "tier2": 8,
+        "bytes": 150,
+        "histogram": [0] * 7 + [2, 2, 0, 0],
+        "jars": [
+            {"name": "a", "crawled": 10, "tier2": 4},
+            {"name": "b", "crawled": 6, "tier2": 4},
+        ],
+    }
+    assert stats["zh"]["crawled"] == 4
+    assert stats["zh"]["tier2"] == 2
+    assert stats["zh"]["tier1"] == 2
+    assert stats["zh"]["bytes"] == 0
+
+    report.show_stats(stats)
+    output = capsys.readouterr().out
+    assert "| en   |    2 |     16  |      8 (50.0%)  |     3 (37.5%)  |" in output
+    assert "| zh   |    1 |      4  |      2 (50.0%)  |     2 (100.0%)  |" in output
+    assert "| Total jars    |      3  |" in output
+    assert "| Total crawled |     20  |" in output
+
+
+def test_fill_skipped_stats(tmp_path, capsys):
+    base_dir = str(tmp_path)
+    Manifest(lang="en", tier1=3).save(base_dir)
+    Manifest(lang="en", name="a", crawled=10, tier2=4).save(base_dir)
+    # en was up to date, only the tier1 of zh was built in the run
+    snapshot = {
+        "jar_cookies": {
+            "values": [
+                {"labels": {"lang": lang, "jar": jar, "kind": kind}, "value": value}
+                for lang, jar, kind, value in [
+                    ("en", "a", "crawled", 0),
+                    ("en", "a", "tier2", 0),
+                    ("zh", "c", "crawled", 4),
+                    ("zh", "c", "tier2", 2),
+                ]
+            ]
+        },
+        "tier1_cookies": {"values": [{"labels": {"lang": "zh"}, "value": 2}]},
+    }
+    stats = report.get_stats(snapshot)
+    report.show_stats(stats)
+    assert "| en   |    1 |      0  |      0 ( 0.0%)  |     0 ( 0.0%)  |" in (
+        capsys.readouterr().out
+    )
+
+    stats = report.fill_skipped_stats(
+        stats, snapshot, [("en", "a"), ("zh", "c")], base_dir
+    )
+    counts = {
+        lang: [stats[lang][kind] for kind in ("crawled", "tier2", "tier1")]
+        for lang in stats
+    }
+    assert counts == {"en": [10, 4, 3], "zh": [4, 2, 2]}
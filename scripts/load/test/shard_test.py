@@ -0,0 +1,50 @@
+from common import CookieJar
+from load import Manifest, ShardReport
+from load.shard import assign_shards, get_jar_costs, merge_shard_dirs, parse_shard
+
+
+def test_assign_shards_balances_the_costs():
+    jars = [CookieJar(lang="en", name=f"j{i}") for i in range(7)]
+    costs = {("en", "j0"): 9.0, ("en", "j1"): 7.0, ("en", "j2"): 6.0}
+    costs.update({("en", f"j{i}"): 2.0 for i in range(3, 7)})
+
+    shards = assign_shards(jars, costs, 3)
+    assert [[jar.name for jar in shard] for shard in shards] == [
+        ["j0", "j6"],
+        ["j1", "j4"],
+        ["j2", "j3", "j5"],
+    ]
+    assert assign_shards(jars, costs, 3) == shards
+    assert sorted(jar.name for shard in shards for jar in shard) == sorted(
+        jar.name for jar in jars
+    )
+
+
+def test_get_jar_costs(tmp_path):
+    jars = [CookieJar(lang="en", name=name) for name in ("a", "b", "c")]
+    Manifest(lang="en", name="a", crawled=100, duration=50).save(str(tmp_path))
+    Manifest(lang="en", name="b", crawled=40).save(str(tmp_path))
+
+    costs = get_jar_costs(jars, str(tmp_path))
+    assert costs == {("en", "a"): 50, ("en", "b"): 20, ("en", "c"): 35}
+
+
+def test_merge_shard_dirs_copies_the_built_jars(tmp_path):
+    shard_dir, base_dir = tmp_path / "shard", tmp_path / "base"
+    Manifest(lang="en", name="a", tier2=3).save(str(shard_dir))
+    Manifest(lang="en", name="stale", tier2=1).save(str(shard_dir))
+    (shard_dir / "tier2" / "en").mkdir(parents=True)
+    (shard_dir / "tier2" / "en" / "a").write_text("a\n%\n")
+    ShardReport(shard=2, shards=2, jars=["en/a"]).save(str(shard_dir))
+    # the report of a former run with 3 shards
+    ShardReport(shard=3, shards=3, jars=["en/old"]).save(str(base_dir))
+
+    reports = merge_shard_dirs([str(shard_dir)], str(base_dir))
+    assert [report.jars for report in reports] == [["en/a"]]
+    assert Manifest.load(str(base_dir), "en", "a").tier2 == 3
+    assert Manifest.load(str(base_dir), "en", "stale") is None
+    assert (base_dir / "tier2" / "en" / "a").read_text() == "a\n%\n"
+    assert [report.shard for report in ShardReport.load_all(str(base_dir))] == [2, 3]
+    # the shards wrote into the base directory
+    assert len(merge_shard_dirs([str(base_dir)], str(base_dir))) == 2
+    assert parse_shard("2/2") == (2, 2)
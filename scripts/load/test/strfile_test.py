@@ -0,0 +1,40 @@
+from common import Cookie
+from load import CookieDB
+from load.strfile import ORDERED, RANDOM, build_index, read_dat, write_dats
+
+
+def test_strfile_index(tmp_path):
+    # an empty string and a last string without a delimiter, as strfile reads them
+    data = "Bonjour\n%\n%\n  apple pie\n%\nZèbre\nrayé\n%\nlast".encode("utf-8")
+    filename = tmp_path / "fr"
+    filename.write_bytes(data)
+    write_dats([str(filename)], max_workers=1)
+
+    header, offsets = read_dat(f"{filename}.dat")
+    assert header.version == 2 and header.delim == b"%" and header.flags == 0
+    assert header.numstr == 4
+    # the empty string is skipped, so the offset before it is kept
+    assert offsets == [0, 10, 26, 41, 45]
+    assert (header.longlen, header.shortlen) == (len("Zèbre\nrayé\n".encode()), 4)
+
+    (tmp_path / "ordered.dat").write_bytes(
+        build_index(data, ordered=True, ignore_case=True)
+    )
+    header, offsets = read_dat(str(tmp_path / "ordered.dat"))
+    assert header.flags == ORDERED
+    assert offsets == [10, 0, 41, 26, 45]
+
+    (tmp_path / "random.dat").write_bytes(build_index(data, randomized=True, seed=1))
+    header, offsets = read_dat(str(tmp_path / "random.dat"))
+    assert header.flags == RANDOM
+    assert sorted(offsets[:-1]) == [0, 10, 26, 41] and offsets[-1] == 45
+
+
+def test_cookie_db_writes_the_index(tmp_path):
+    cookies = [Cookie(content="不积跬步，无以至千里"), Cookie(content="Carpe diem")]
+    db = CookieDB(name="zh_CN", location=str(tmp_path), dat_file=True)
+    db.save(cookies)
+    header, offsets = read_dat(str(tmp_path / "zh_CN.dat"))
+    assert header.numstr == 2
+    assert offsets[-1] == (tmp_path / "zh_CN").stat().st_size
+    assert [cookie.content for cookie in db.load()] == [c.content for c in cookies]
@@ -1,87 +1,476 @@
 import argparse
+import json
 import os
+import threading
+import time
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+from functools import lru_cache, partial
+from operator import attrgetter
 from pathlib import Path
-
-from common import Agent, CookieJar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from common import CookieJar
+from common.batch import BATCH_STATUS_IN_PROGRESS
+from common.jobqueue import STATUS_DONE, JobQueue, Worker
+from common.metrics import ProgressReporter, metrics
+from common.profiler import profiler
+from common.record import CookieRecord, LazyRecord, to_records
+from common.scheduler import Deferred, Scheduler, Sequencer, Stage, run_deferred
 from dotenv import load_dotenv
-from extract import Crawler, Extractor
-from load import CookieDB, Jsonl
+from extract import Extractor, extractors
+from load import CookieDB, Jsonl, Manifest, ShardReport
+from load.manifest import get_histogram, hash_cookies, hash_files, hash_json
+from load.shard import merge_shard_dirs, parse_shard, select_shard
 from loguru import logger
+from pydantic import BaseModel, ConfigDict
+from report import (
+    fill_skipped_stats,
+    get_stats,
+    load_jar_names,
+    load_stats,
+    show_metrics,
+    show_pool,
+    show_scores,
+    show_single_flight,
+    show_stages,
+    show_stats,
+    show_usage,
+)
 from transform import (
-    ChineseConverter,
-    FilterByLength,
+    CookieBatch,
+    DedupIndex,
+    Deduplicator,
     FilterByRank,
-    FilterByScore,
-    Scorer,
+    PreScorer,
+    train_prescorer,
+    transformers,
 )
 
-stats = {}
+# The worker threads of the stages: crawling is network bound, scoring is bound
+# by the LLM quota, the other stages are CPU bound.
+STAGE_WORKERS = {
+    "extract": 5,
+    "prefilter": 2,
+    "score": 5,
+    "transform": 2,
+    "load": 2,
+}
+
+# The delay in seconds before a jar waiting for the jars before it in the
+# tasks tries the prefilter again.
+PREFILTER_WAIT = 0.05
+
+# The transformer fields not changing the outputs, ignored by the fingerprint.
+RUNTIME_FIELDS = {
+    "index",
+    "converter",
+    "batch_size",
+    "mode",
+    "batch_backend",
+    "batch_dir",
+    "checkpoint_file",
+    "scored_file",
+    "metadata",
+    "hedge",
+}
+
+
+class JarState(BaseModel):
+    """A jar passing through the stages of `process_tier2`, its cookies as
+    compact records between the extraction and the load."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    jar: CookieJar
+    transformers: Dict[str, List[Any]] = {}
+    cookies: List[CookieRecord] = []
+    crawled: int = 0
+    crawled_at: float = 0
+    scored: int = 0
+    histogram: List[int] = []
+    fingerprint: Dict[str, str] = {}
+    manifest: Optional[Manifest] = None
+    # the `BatchJob` of a scorer in batch mode, until it is collected
+    batch: Any = None
+    # an up-to-date jar, only claiming its crawled cookies in the dedup index
+    # of the run, as its build did
+    seed: bool = False
+    changed: bool = False
+    duration: float = 0
+
+
+def get_transformers(
+    jar: CookieJar,
+    base_dir: str = "data",
+    batch_backend: str = "",
+    dedup_index: Optional[DedupIndex] = None,
+    **scorer_options,
+) -> Dict[str, List[Any]]:
+    """The transformers of the jar, by stage. The jar is deduplicated against
+    the jars sharing `dedup_index`, or only within itself."""
+    batch_size = 50
+    # model_name = "tongyi:qwen-turbo-latest"
+    get = transformers.get
+    stages = {
+        "prefilter": [
+            get("FilterByLength")(min_length=5, max_length=500),
+            get("Deduplicator")(lang=jar.lang, jar=jar.name, index=dedup_index),
+            get("PreScorer")(
+                model_file=os.path.join(base_dir, "models", "prescorer.json")
+            ),
+        ],
+        "score": [
+            get("Scorer")(
+                model_name=jar.model_name,
+                model_name_fallback=jar.model_name_fallback,
+                batch_size=batch_size,
+                mode="batch" if batch_backend else "interactive",
+                batch_backend=batch_backend or "local",
+                checkpoint_file=os.path.join(
+                    base_dir, "raw", "scoring", jar.lang, f"{jar.name}.jsonl"
+                ),
+                scored_file=os.path.join(
+                    base_dir, "raw", "scored", jar.lang, f"{jar.name}.jsonl"
+                ),
+                metadata={"lang": jar.lang, "jar": jar.name},
+                **scorer_options,
+            )
+        ],
+        "transform": [
+            get("FilterByScore")(score=6.5),
+            get("FilterByRank")(top=jar.limit),
+        ],
+    }
+    if jar.lang.startswith("zh"):
+        stages["transform"].append(get("ChineseConverter")(lang=jar.lang))
+    return stages
+
+
+@lru_cache
+def get_code_fingerprint(extractor: str = "") -> str:
+    """The hash of the code of the extractor, or of the transformers and
+    loaders if `extractor` is empty."""
+    scripts_dir = Path(__file__).parent
+    if extractor:
+        # e.g. `crawler.wikiquote.en` is in `extract/wikiquote.py`
+        if extractor in extractors:
+            module = extractors.get_path(extractor).split(":")[0].split(".")[1]
+        else:
+            module = extractor.split(".")[1] if "." in extractor else extractor
+        files = ["crawler.py", "extractor.py", f"{module}.py"]
+        return hash_files(str(scripts_dir / "extract" / file) for file in files)
+    files = [str(file) for file in (scripts_dir / "transform").glob("*.py")]
+    files += [str(scripts_dir / "load" / file) for file in ("cookiedb.py", "jsonl.py")]
+    files += [
+        str(scripts_dir / "common" / file)
+        for file in ("agent.py", "model.py", "output.py")
+    ]
+    return hash_files(files)
+
+
+def get_fingerprint(state: JarState) -> Dict[str, str]:
+    """The fingerprint of the build of the jar, but the crawled content."""
+    config = {}
+    for stage, stage_transformers in state.transformers.items():
+        config[stage] = []
+        for transformer in stage_transformers:
+            data = transformer.model_dump(exclude=RUNTIME_FIELDS)
+            data["class"] = type(transformer).__name__
+            if isinstance(transformer, PreScorer):
+                data["model_file"] = hash_files([transformer.model_file])
+            config[stage].append(data)
+    return {
+        "jar": hash_json(state.jar.model_dump()),
+        "extract_code": get_code_fingerprint(state.jar.extractor),
+        "config": hash_json(config),
+        "code": get_code_fingerprint(),
+    }
+
 
+def record_stats(jar: CookieJar, crawled: int, tier2: int):
+    metrics.inc("jar_cookies", crawled, lang=jar.lang, jar=jar.name, kind="crawled")
+    metrics.inc("jar_cookies", tier2, lang=jar.lang, jar=jar.name, kind="tier2")
 
-def process_jar(jar, base_dir: str = "data"):
-    global stats
-    try:
-        # Extract
+
+def extract_jar(state: JarState, base_dir: str = "data") -> Optional[JarState]:
+    jar = state.jar
+    location = os.path.join(base_dir, "raw", "crawled", jar.lang)
+    s = Jsonl(name=jar.name, location=location)
+    if state.seed:
+        if not os.path.exists(s.get_filename() + ".jsonl"):
+            logger.warning(
+                f"Not seeding [{jar.lang}] '{jar.name}': no crawled cookies."
+            )
+            return None
+        state.cookies = list(s.iter_records())
+        return state
+
+    with profiler.section(jar.extractor):
         cookies = Extractor.extract(jar)
-        location = os.path.join(base_dir, "raw", "crawled", jar.lang)
-        s = Jsonl(name=jar.name, location=location)
-        s.save(cookies)
-
-        stats_crawled = len(cookies)
-
-        # Transform
-        batch_size = 50
-        # model_name = "tongyi:qwen-turbo-latest"
-        transformers = [
-            FilterByLength(min_length=5, max_length=500),
-            Scorer(model_name=jar.model_name, batch_size=batch_size),
-            FilterByScore(score=6.5),
-            FilterByRank(top=jar.limit),
-        ]
-        if jar.lang.startswith("zh"):
-            transformers.append(ChineseConverter(lang=jar.lang))
-
-        for transformer in transformers:
-            cookies = transformer.transform(cookies)
-        location = os.path.join(base_dir, "raw", "processed", jar.lang)
-        s = Jsonl(name=jar.name, location=location)
-        s.save(cookies)
+    state.crawled = len(cookies)
+    state.crawled_at = time.time()
+    state.fingerprint["content"] = hash_cookies(cookies)
+
+    # the same content built by the same transformers, e.g. only the crawler
+    # was refactored: keep the outputs
+    manifest = state.manifest
+    if manifest and manifest.matches(state.fingerprint, ("content", "config", "code")):
+        logger.info(f"Unchanged: [{jar.lang}] '{jar.name}': same crawled content.")
+        manifest.fingerprint = state.fingerprint
+        manifest.save(base_dir)
+        record_stats(jar, manifest.crawled, manifest.tier2)
+        state.seed = True
+        state.cookies = to_records(cookies)
+        return state
+
+    s.save(cookies)
+    state.cookies = to_records(cookies)
+    return state
+
+
+def prefilter_jar(state: JarState) -> Optional[JarState]:
+    # the cookies are streamed through the transformers, and only buffered by
+    # the blocking ones
+    stream = iter(state.cookies)
+    for transformer in state.transformers["prefilter"]:
+        stream = profiler.stream(transformer.stream(stream), type(transformer).__name__)
+        if state.seed and isinstance(transformer, Deduplicator):
+            # the claims are made, the outputs are kept
+            for _ in stream:
+                pass
+            return None
+    state.cookies = list(stream)
+    return state
+
+
+def score_jar(state: JarState) -> Any:
+    """Scores the cookies. A scorer in batch mode submits them and the jar is
+    deferred to poll the batch again later, the worker is free in between."""
+    for transformer in state.transformers["score"]:
+        with profiler.section(type(transformer).__name__):
+            if getattr(transformer, "mode", "") != "batch":
+                state.cookies = transformer.transform(state.cookies)
+                continue
+            if state.batch is None:
+                state.batch = transformer.submit_batch(state.cookies)
+            status = transformer.poll_batch(state.batch)
+            if status == BATCH_STATUS_IN_PROGRESS:
+                return Deferred(state, state.batch.poll_interval)
+            state.cookies = transformer.collect_batch(
+                state.cookies, state.batch, status
+            )
+            state.batch = None
+    state.scored = len(state.cookies)
+    state.histogram = get_histogram(state.cookies)
+    return state
+
+
+def transform_jar(state: JarState) -> JarState:
+    batch = CookieBatch.from_cookies(
+        state.cookies, lang=state.jar.lang, jar=state.jar.name
+    )
+    for transformer in state.transformers["transform"]:
+        with profiler.section(type(transformer).__name__):
+            batch = transformer.transform_batch(batch)
+    state.cookies = batch.cookies
+    return state
+
+
+def load_jar(state: JarState, base_dir: str = "data") -> JarState:
+    jar, cookies = state.jar, state.cookies
+    location = os.path.join(base_dir, "raw", "processed", jar.lang)
+    processed = Jsonl(name=jar.name, location=location)
+    processed.save(cookies)
+
+    # tier2
+    location = os.path.join(base_dir, "tier2", jar.lang)
+    tier2 = CookieDB(name=jar.name, location=location, dat_file=True)
+    tier2.save(cookies)
+    logger.info(
+        f"Completed: [{jar.lang}] '{jar.name}': {state.crawled} cookies retrieved => {len(cookies)} cookies saved."
+    )
 
-        # Load
-        # tier2
-        location = os.path.join(base_dir, "tier2", jar.lang)
-        s = CookieDB(name=jar.name, location=location, dat_file=False)
-        s.save(cookies)
-        logger.info(
-            f"Completed: [{jar.lang}] '{jar.name}': {stats_crawled} cookies retrieved => {len(cookies)} cookies saved."
+    manifest = Manifest(
+        lang=jar.lang,
+        name=jar.name,
+        fingerprint=state.fingerprint,
+        crawled=state.crawled,
+        scored=state.scored,
+        tier2=len(cookies),
+        histogram=state.histogram,
+        duration=state.duration,
+        crawled_at=state.crawled_at,
+    )
+    crawled_file = os.path.join(base_dir, "raw", "crawled", jar.lang, jar.name)
+    manifest.set_size("crawled", crawled_file + ".jsonl")
+    manifest.set_size("processed", processed.get_filename() + ".jsonl")
+    manifest.set_size("tier2", tier2.get_filename())
+    manifest.save(base_dir)
+    for stage_transformers in state.transformers.values():
+        for transformer in stage_transformers:
+            transformer.finalize()
+    state.changed = True
+    record_stats(jar, state.crawled, len(cookies))
+    return state
+
+
+def run_stage(stage: str, fn: Callable[[JarState], Any]) -> Callable[[JarState], Any]:
+    """Runs the stage of a jar, timed for the sharding and under the profiler
+    if `--profile`."""
+
+    def run(state: JarState):
+        jar = state.jar
+        start = time.perf_counter()
+        try:
+            with profiler.profile(
+                f"{jar.lang}/{jar.name}.{stage}", stage, jar.lang, jar.name
+            ):
+                return fn(state)
+        finally:
+            state.duration += time.perf_counter() - start
+
+    return run
+
+
+def create_jar_state(
+    jar: CookieJar,
+    base_dir: str = "data",
+    batch_backend: str = "",
+    dedup_index: Optional[DedupIndex] = None,
+    **scorer_options,
+) -> JarState:
+    state = JarState(
+        jar=jar,
+        transformers=get_transformers(
+            jar, base_dir, batch_backend, dedup_index, **scorer_options
+        ),
+    )
+    state.fingerprint = get_fingerprint(state)
+    state.manifest = Manifest.load(base_dir, jar.lang, jar.name)
+    return state
+
+
+def is_up_to_date(state: JarState, base_dir: str = "data") -> bool:
+    """Whether the jar was built with the same fingerprint, and its outputs
+    are still there."""
+    jar = state.jar
+    return (
+        state.manifest is not None
+        and state.manifest.matches(
+            state.fingerprint, ("jar", "extract_code", "config", "code")
         )
+        and (Path(base_dir) / "tier2" / jar.lang / jar.name).exists()
+        and (
+            Path(base_dir) / "raw" / "processed" / jar.lang / f"{jar.name}.jsonl"
+        ).exists()
+    )
 
-        if jar.lang not in stats:
-            stats[jar.lang] = {
-                "lang": jar.lang,
-                "crawled": 0,
-                "tier1": 0,
-                "tier2": 0,
-                "jars": [],
-            }
-
-        stats[jar.lang]["crawled"] += stats_crawled
-        stats[jar.lang]["tier2"] += len(cookies)
-        stats[jar.lang]["jars"].append(
-            {
-                "name": jar.name,
-                "crawled": stats_crawled,
-                "tier2": len(cookies),
-            }
-        )
 
+def build_jar(state: JarState, base_dir: str = "data"):
+    """Runs all the stages for a single jar, raises if one fails."""
+    state = run_stage("extract", partial(extract_jar, base_dir=base_dir))(state)
+    if state is None:
+        return
+    state = run_stage("prefilter", prefilter_jar)(state)
+    if state is None:
+        return
+    state = run_deferred(run_stage("score", score_jar), state)
+    state = run_stage("transform", transform_jar)(state)
+    run_stage("load", partial(load_jar, base_dir=base_dir))(state)
+
+
+def process_jar(jar, base_dir: str = "data", batch_backend: str = "", **scorer_options):
+    """Runs all the stages for a single jar."""
+    try:
+        build_jar(
+            create_jar_state(jar, base_dir, batch_backend, **scorer_options), base_dir
+        )
     except Exception as e:
         logger.error(f"Failed processing [{jar.lang}] '{jar.name}' failed: {e}")
         logger.exception(e)
 
 
+def run_jar_job(payload: dict) -> dict:
+    """Builds the jar of a job leased from the queue, see `--worker`. A failure
+    is raised, so the job is retried.
+
+    Each job has its own dedup index: a retry doesn't see the claims of the
+    failed attempt, and the tier2 of the jar doesn't depend on which worker
+    built which jars before. The cross-jar duplicates are only dropped from
+    the tier1, which is built once all the jobs are done."""
+    jar = CookieJar.model_validate(payload["jar"])
+    base_dir = payload["base_dir"]
+    state = create_jar_state(
+        jar,
+        base_dir,
+        payload["batch_backend"],
+        DedupIndex(),
+        **payload["scorer_options"],
+    )
+    if payload["force"] or not is_up_to_date(state, base_dir):
+        build_jar(state, base_dir)
+    manifest = Manifest.load(base_dir, jar.lang, jar.name)
+    if manifest is None:
+        raise RuntimeError(f"[{jar.lang}] '{jar.name}' has no manifest after its build")
+    return {"crawled": manifest.crawled, "tier2": manifest.tier2}
+
+
+def get_job_key(jar: CookieJar) -> str:
+    return f"jar:{jar.lang}/{jar.name}"
+
+
+def run_queue(
+    jars: list,
+    base_dir: str,
+    queue_file: str,
+    batch_backend: str = "",
+    force: bool = False,
+    **scorer_options,
+):
+    """Enqueues the jars into the job queue, and waits for the workers, see
+    `--queue`. The workers can be started before or after, on any machine
+    sharing `base_dir` and the queue file."""
+    queue = JobQueue(queue_file)
+    for jar in jars:
+        queue.put(
+            "jar",
+            get_job_key(jar),
+            {
+                "jar": jar.model_dump(),
+                "base_dir": str(Path(base_dir).resolve()),
+                "batch_backend": batch_backend,
+                "force": force,
+                "scorer_options": scorer_options,
+            },
+        )
+    keys = [get_job_key(jar) for jar in jars]
+    logger.info(f"Queue: {len(keys)} jars in {queue_file}, waiting for the workers")
+    queue.wait(keys, on_poll=lambda left: logger.debug(f"Queue: {left} jars left"))
+    for jar in jars:
+        job = queue.get(get_job_key(jar))
+        if job.status == STATUS_DONE:
+            record_stats(jar, job.result["crawled"], job.result["tier2"])
+        else:
+            logger.error(
+                f"Failed processing [{jar.lang}] '{jar.name}' after {job.attempts} attempts: {job.error}"
+            )
+
+
+def run_worker(queue_file: str, base_dir: str):
+    """Runs the jobs of the queue until it is drained, see `--worker`."""
+    worker = Worker(JobQueue(queue_file), {"jar": run_jar_job})
+    worker.run()
+    from common import usage_tracker
+
+    # the reports of each worker, the driver only sees the results of the jobs
+    reports_dir = (
+        Path(base_dir) / "reports" / "workers" / worker.owner.replace(":", "-")
+    )
+    usage_tracker.save(str(reports_dir / "usage.json"))
+    metrics.save(str(reports_dir / "metrics.json"))
+
+
 def load_jars(task_file: str):
     jars = []
     with open(task_file, "r") as f:
@@ -96,136 +485,178 @@ def load_jars(task_file: str):
     return jars
 
 
-def process_tier2(jars: list, base_dir: str):
-    process_jar_with_output_path = partial(process_jar, base_dir=base_dir)
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        executor.map(process_jar_with_output_path, jars)
-
+def process_tier2(
+    jars: list,
+    base_dir: str,
+    batch_backend: str = "",
+    on_lang_done: Optional[Callable[[str], None]] = None,
+    force: bool = False,
+    **scorer_options,
+) -> List[dict]:
+    """Runs the jars through the stages, each stage with its own workers, so
+    the crawling of a jar overlaps with the scoring of another. The jars built
+    with the same fingerprint are skipped, unless `force`.
+    `on_lang_done(lang)` is called once all the jars of a language are done,
+    if any of them changed or the tier1 of the language is missing.
+    Returns the stats of the stages.
+
+    The jars of a language share the index of the deduplication of the run, so
+    they are prefiltered in the order of the tasks: the copy kept by a jar
+    doesn't depend on which jar was crawled first. If a jar of the language is
+    built, its up-to-date jars claim their crawled cookies in the index too,
+    so the build keeps the copies a full build would keep.
+    """
+    pending = Counter(jar.lang for jar in jars)
+    dedup_indexes: Dict[str, DedupIndex] = {}
+    changed = set()
+    lock = threading.Lock()
+    sequencer = Sequencer()
+
+    def prefilter(state: JarState):
+        lang = state.jar.lang
+        if not sequencer.is_next(lang, id(state)):
+            return Deferred(state, PREFILTER_WAIT)
+        try:
+            return prefilter_jar(state)
+        finally:
+            sequencer.done(lang, id(state))
+
+    def on_exit(state: JarState):
+        lang = state.jar.lang
+        sequencer.done(lang, id(state))
+        with lock:
+            pending[lang] -= 1
+            if state.changed:
+                changed.add(lang)
+            done = pending[lang] == 0
+        tier1_file = Path(base_dir) / "tier1" / lang
+        if (
+            done
+            and on_lang_done
+            and (force or lang in changed or not tier1_file.exists())
+        ):
+            on_lang_done(lang)
+
+    stage_fns = {
+        "extract": partial(extract_jar, base_dir=base_dir),
+        "prefilter": prefilter,
+        "score": score_jar,
+        "transform": transform_jar,
+        "load": partial(load_jar, base_dir=base_dir),
+    }
+    stages = [
+        Stage(name, run_stage(name, fn), workers=STAGE_WORKERS[name])
+        for name, fn in stage_fns.items()
+    ]
+    scheduler = Scheduler(stages, on_exit=on_exit)
+    scheduler.start()
+    try:
+        states = []
+        built = set()
+        for jar in jars:
+            dedup_index = dedup_indexes.setdefault(jar.lang, DedupIndex())
+            state = create_jar_state(
+                jar, base_dir, batch_backend, dedup_index, **scorer_options
+            )
+            if force:
+                state.manifest = None
+            elif is_up_to_date(state, base_dir):
+                logger.debug(f"Up to date: [{jar.lang}] '{jar.name}'")
+                record_stats(jar, state.manifest.crawled, state.manifest.tier2)
+                state.seed = True
+            if not state.seed:
+                built.add(jar.lang)
+            states.append(state)
+        for state in states:
+            if state.seed and state.jar.lang not in built:
+                on_exit(state)
+                continue
+            sequencer.add(state.jar.lang, id(state))
+            scheduler.submit(state)
+    finally:
+        scheduler.join()
+    return scheduler.get_stats()
 
-def process_tier1(jars: list, base_dir: str):
-    global stats
-    cookies = {}
 
-    # Extract
+def iter_processed(lang: str, jars: list, base_dir: str) -> Iterator[LazyRecord]:
+    """Yields the processed cookies of the language, jar by jar, lazily."""
     for jar in jars:
-        if jar.lang not in cookies:
-            cookies[jar.lang] = []
+        if jar.lang != lang:
+            continue
         location = Path(base_dir) / "raw" / "processed" / jar.lang
         s = Jsonl(name=jar.name, location=str(location))
         try:
-            cookies[jar.lang].extend(s.load())
+            yield from s.iter_lazy()
         except Exception as e:
             logger.error(f"Failed to load {jar.name} for {jar.lang}: {e}")
 
-    # Transform
-    transformers = [
-        FilterByRank(top=500),
-    ]
-    # Load
-    for lang, lang_cookies in cookies.items():
-        for transformer in transformers:
-            lang_cookies = transformer.transform(lang_cookies)
-        location = Path(base_dir) / "tier1"
-        s = CookieDB(name=lang, location=str(location), dat_file=False)
-        s.save(lang_cookies)
-        if lang in stats:
-            stats[lang]["tier1"] = len(lang_cookies)
-
 
-def load_stats(jars: list, base_dir: str) -> dict:
-    statistics = {}
-    for jar in jars:
-        if jar.lang not in statistics:
-            statistics[jar.lang] = {
-                "lang": jar.lang,
-                "crawled": 0,
-                "tier1": 500,
-                "tier2": 0,
-                "jars": [],
-            }
-        # crawled
-        location = Path(base_dir) / "raw" / "crawled" / jar.lang
-        s = Jsonl(name=jar.name, location=str(location))
-        statistics[jar.lang]["crawled"] += len(s.load())
-        # tier2
-        location = Path(base_dir) / "raw" / "processed" / jar.lang
-        s = Jsonl(name=jar.name, location=str(location))
-        statistics[jar.lang]["tier2"] += len(s.load())
-        # tier1
-        statistics[jar.lang]["jars"].append(
-            {
-                "name": jar.name,
-                "crawled": statistics[jar.lang]["crawled"],
-                "tier2": statistics[jar.lang]["tier2"],
-            }
+def select_tier1(
+    lang: str, jars: list, base_dir: str, top: int = 500
+) -> List[CookieRecord]:
+    """The `top` cookies of the language by overall score, without near
+    duplicates; on ties, the cookie of the jar listed first in the tasks wins.
+
+    Only a heap of candidates is held in memory: the top `2 * top` cookies are
+    deduplicated, and the candidates are widened only if too many of them were
+    duplicates.
+    """
+    size = 2 * top
+    while True:
+        # only the candidates are built into records
+        candidates = FilterByRank(top=size).select(
+            iter_processed(lang, jars, base_dir), key=attrgetter("overall")
         )
-    return statistics
-
-
-def show_stats():
-    global stats
-    print()
-    print("## Statistics")
-    print()
+        cookies = Deduplicator().transform([lazy.to_record() for lazy in candidates])
+        if len(cookies) >= top or len(candidates) < size:
+            return FilterByRank(top=top).select(cookies)
+        size *= 2
 
-    if len(stats) == 0:
-        print("No stats available.")
-        return
 
-    num_jars = 0
-    num_crawled = 0
-    num_tier1 = 0
-    num_tier2 = 0
-
-    print("### Details")
-    print()
-    print("| lang | jars | crawled |      tier2      |     tier1      |")
-    print("|------|------|---------|-----------------|----------------|")
-    for lang, lang_stats in stats.items():
-        num_jars += len(lang_stats["jars"])
-        num_crawled += lang_stats["crawled"]
-        num_tier1 += lang_stats["tier1"]
-        num_tier2 += lang_stats["tier2"]
-        # print(f"lang: [{lang}],\t jars: {len(lang_stats['jars'])},\t crawled: {lang_stats['crawled']:5},\t tier2: {lang_stats['tier2']:5} [{lang_stats['tier2']/lang_stats['crawled']*100:.1f}%],\t tier1: {lang_stats['tier1']:4}")
-        print(
-            f"| {lang:4} | {len(lang_stats['jars']):4} | {lang_stats['crawled']:6}  | {lang_stats['tier2']:6} ({lang_stats['tier2']/lang_stats['crawled']*100:4.1f}%)  | {lang_stats['tier1']:5} ({lang_stats['tier1']/lang_stats['tier2']*100:4.1f}%)  |"
-        )
+def process_tier1_lang(lang: str, jars: list, base_dir: str):
+    try:
+        lang_cookies = select_tier1(lang, jars, base_dir)
 
-    print()
-    print("### Summary")
-    print()
-    # print(f"Total langs:\t {len(stats):5}\t[{', '.join(stats.keys())}]")
-    # print(f"Total jars:\t {num_jars:5}")
-    # print(f"Total crawled:\t {num_crawled:5}")
-    # print(f"Total tier2:\t {num_tier2:5}\t[{num_tier2/num_crawled*100:.1f}%]")
-    # print(f"Total tier1:\t {num_tier1:5}")
-
-    flags_by_langs = {
-        "de": "🇩🇪",
-        "en": "🇺🇸",
-        "es": "🇪🇸",
-        "fr": "🇫🇷",
-        "it": "🇮🇹",
-        "ja": "🇯🇵",
-        "ko": "🇰🇷",
-        "ru": "🇷🇺",
-        "zh": "🇨🇳",
-    }
+        # Load
+        location = Path(base_dir) / "tier1"
+        s = CookieDB(name=lang, location=str(location), dat_file=True)
+        s.save(lang_cookies)
+        manifest = Manifest(lang=lang, tier1=len(lang_cookies))
+        manifest.set_size("tier1", s.get_filename())
+        manifest.save(base_dir)
+        metrics.set("tier1_cookies", len(lang_cookies), lang=lang)
+        logger.info(f"Completed: tier1 [{lang}]: {len(lang_cookies)} cookies saved.")
+    except Exception as e:
+        logger.error(f"Failed processing tier1 [{lang}]: {e}")
+        logger.exception(e)
 
-    flags = "".join([flags_by_langs[lang] for lang in stats.keys()])
 
-    print(f"|    title      |  count  |           notes          |")
-    print("|---------------|---------|--------------------------|")
-    print(f"| Total langs   | {len(stats):6}  | {flags} |")
-    print(f"| Total jars    | {num_jars:6}  |                          |")
-    print(f"| Total crawled | {num_crawled:6}  |                          |")
-    print(
-        f"| Total tier2   | {num_tier2:6}  |         ({num_tier2/num_crawled*100:4.1f}%)          |"
-    )
-    print(
-        f"| Total tier1   | {num_tier1:6}  |         ({num_tier1/num_tier2*100:4.1f}%)          |"
-    )
-    print()
+def process_tier1(jars: list, base_dir: str):
+    langs = list(dict.fromkeys(jar.lang for jar in jars))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        for lang in langs:
+            executor.submit(process_tier1_lang, lang, jars, base_dir)
+
+
+def merge_shards(jars: list, base_dir: str, shard_dirs: List[str]):
+    """Gathers the outputs of the shards into `base_dir`, with their metrics
+    and LLM usage, then builds the tier1 of all the languages. Without
+    `shard_dirs`, the shards wrote into `base_dir` itself."""
+    from common import usage_tracker
+
+    reports = merge_shard_dirs(shard_dirs or [base_dir], base_dir)
+    built = set()
+    for report in reports:
+        metrics.merge(report.metrics)
+        usage_tracker.merge(report.usage)
+        built.update(report.jars)
+    counts = {report.shards for report in reports}
+    if len(counts) > 1:
+        logger.warning(f"Merge: reports of different shardings {sorted(counts)}")
+    for jar in jars:
+        if f"{jar.lang}/{jar.name}" not in built:
+            logger.warning(f"Merge: [{jar.lang}] '{jar.name}' not built by any shard.")
+    process_tier1(jars, base_dir)
 
 
 def main():
@@ -251,24 +682,220 @@ def main():
         default=False,
         help="Show stats",
     )
+    parser.add_argument(
+        "--train-prescorer",
+        action="store_true",
+        default=False,
+        help="Train the local pre-scorer from the cookies with an LLM score of the last builds.",
+    )
+    parser.add_argument(
+        "--prescorer-recall",
+        type=float,
+        default=0.98,
+        help="The recall of accepted cookies the pre-scorer threshold should keep.",
+    )
+    parser.add_argument(
+        "--batch-backend",
+        type=str,
+        default="",
+        choices=["", "local", "openai"],
+        help="Score the cookies through batch request files with the given backend instead of interactive calls.",
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="",
+        help="Override the language model of all jars, e.g. 'mock:bench?latency=lognormal:-1,0.5' for offline benchmarks.",
+    )
+    parser.add_argument(
+        "--fallback-model",
+        type=str,
+        default="",
+        help="Override the fallback language model of all jars.",
+    )
+    parser.add_argument(
+        "--hedge",
+        type=str,
+        default="",
+        choices=["", "fallback", "base"],
+        help="Hedge the scoring calls slower than the p95 latency with the fallback model or another base model call.",
+    )
+    parser.add_argument(
+        "--structured-output",
+        action="store_true",
+        default=False,
+        help="Use the native structured output (JSON schema or JSON mode) of the model providers.",
+    )
+    parser.add_argument(
+        "--prompt-layout",
+        type=str,
+        default="default",
+        choices=["default", "prefix_cache"],
+        help="'prefix_cache' keeps the prompt prefix byte-identical for the prompt caching of the providers. The scorer prompt has no variables, so it gives the same messages as 'default', and keeps the LLM cache.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="Profile the stages of each jar into <output_path>/profiles: cProfile files, sampled collapsed stacks and a top-N report.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=str,
+        default="",
+        help="Only build the shard 'i/n' of the jars, balanced by the duration of their last build, without the tier1. See --merge.",
+    )
+    parser.add_argument(
+        "--merge",
+        type=str,
+        nargs="*",
+        default=None,
+        metavar="SHARD_DIR",
+        help="Gather the outputs of the shards from the given directories into output_path, then build the tier1 and the reports.",
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        default="",
+        metavar="QUEUE_FILE",
+        help="Enqueue the jars into the SQLite job queue, wait for the --worker processes, then build the tier1. Each jar is only deduplicated within itself, the duplicates across jars are only dropped from the tier1.",
+    )
+    parser.add_argument(
+        "--worker",
+        type=str,
+        default="",
+        metavar="QUEUE_FILE",
+        help="Build the jars of the SQLite job queue until it is drained, start as many as needed, on any machine sharing the file system.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        default=False,
+        help="Rebuild all the jars, even if their fingerprint didn't change. The up-to-date jars are skipped without crawling, so a change of their upstream content is only picked up with --force.",
+    )
     args = parser.parse_args()
 
+    if args.train_prescorer:
+        train_prescorer(
+            args.output_path,
+            model_file=str(Path(args.output_path) / "models" / "prescorer.json"),
+            report_file=str(Path(args.output_path) / "reports" / "prescorer.json"),
+            target_recall=args.prescorer_recall,
+        )
+        return
+
     if args.stats:
-        global stats
+        report = load_stats(load_jar_names(args.task_file), args.output_path)
+        show_stats(report)
+        show_scores(report)
+        usage_file = Path(args.output_path) / "reports" / "usage.json"
+        if usage_file.exists():
+            show_usage(json.loads(usage_file.read_text(encoding="utf-8")))
+        return
+
+    if args.merge is not None:
+        # no crawling nor LLM calls
+        from common import usage_tracker
+
         jars = load_jars(args.task_file)
-        stats = load_stats(jars, args.output_path)
-        show_stats()
+        reports_dir = Path(args.output_path) / "reports"
+        merge_shards(jars, args.output_path, args.merge)
+        usage_tracker.save(str(reports_dir / "usage.json"))
+        metrics.save(
+            str(reports_dir / "metrics.json"), str(reports_dir / "metrics.prom")
+        )
+        show_stats(get_stats(metrics.snapshot()))
+        show_usage(usage_tracker.to_dict())
         return
 
+    # the LLM and crawler stacks, slow to import, are only needed from here
+    from common import Agent, pool_stats, single_flight_stats, usage_tracker
+    from extract import Crawler
+
     # setup cache
     cache_dir = Path(".cache").resolve()
     Agent.init_cache(cache_dir)
     Crawler.init_cache(cache_dir)
 
+    if args.worker:
+        run_worker(args.worker, args.output_path)
+        return
+
     jars = load_jars(args.task_file)
-    process_tier2(jars, args.output_path)
-    process_tier1(jars, args.output_path)
-    show_stats()
+    for jar in jars:
+        jar.model_name = args.model or jar.model_name
+        jar.model_name_fallback = args.fallback_model or jar.model_name_fallback
+    reports_dir = Path(args.output_path) / "reports"
+    if args.queue:
+        run_queue(
+            jars,
+            args.output_path,
+            args.queue,
+            batch_backend=args.batch_backend,
+            force=args.force,
+            hedge=args.hedge,
+            structured_output=args.structured_output,
+            prompt_layout=args.prompt_layout,
+        )
+        process_tier1(jars, args.output_path)
+        metrics.save(
+            str(reports_dir / "metrics.json"), str(reports_dir / "metrics.prom")
+        )
+        show_stats(get_stats(metrics.snapshot()))
+        return
+    if args.shard:
+        shard, shards = parse_shard(args.shard)
+        jars = select_shard(jars, args.output_path, shard, shards)
+        logger.info(f"Shard {shard}/{shards}: {len(jars)} jars")
+    if args.profile:
+        profiler.enable(str(Path(args.output_path) / "profiles"))
+    progress = ProgressReporter(metrics)
+    progress.start()
+    # the tier1 of a language is built as soon as all its jars are done
+    with ThreadPoolExecutor(max_workers=4) as tier1_executor:
+        stage_stats = process_tier2(
+            jars,
+            args.output_path,
+            batch_backend=args.batch_backend,
+            # the tier1 needs the jars of all the shards
+            on_lang_done=None
+            if args.shard
+            else partial(
+                tier1_executor.submit,
+                process_tier1_lang,
+                jars=jars,
+                base_dir=args.output_path,
+            ),
+            force=args.force,
+            hedge=args.hedge,
+            structured_output=args.structured_output,
+            prompt_layout=args.prompt_layout,
+        )
+    progress.stop()
+    profiler.disable()
+    profiler.save()
+    usage_tracker.save(str(reports_dir / "usage.json"))
+    metrics.save(str(reports_dir / "metrics.json"), str(reports_dir / "metrics.prom"))
+    if args.shard:
+        ShardReport(
+            shard=shard,
+            shards=shards,
+            jars=[f"{jar.lang}/{jar.name}" for jar in jars],
+            metrics=metrics.snapshot(),
+            usage=usage_tracker.to_dict(),
+        ).save(args.output_path)
+    snapshot = metrics.snapshot()
+    stats = get_stats(snapshot)
+    if not args.shard:
+        # the tier1 of a shard is built by --merge
+        jar_names = [(jar.lang, jar.name) for jar in jars]
+        stats = fill_skipped_stats(stats, snapshot, jar_names, args.output_path)
+    show_stats(stats)
+    show_usage(usage_tracker.to_dict())
+    show_pool(pool_stats())
+    show_single_flight(single_flight_stats())
+    show_stages(stage_stats)
+    show_metrics(snapshot)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,393 @@
+"""The reports of the builds, printed by `main.py` after a run.
+
+Run it directly for the stats of the data tree, e.g. `python report.py tasks.jsonl
+cookies`: it only reads the manifests written by the builds, and counts the
+lines of the outputs without a manifest, so it doesn't import the pipeline.
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import List, Optional
+
+
+def load_manifest(base_dir: str, lang: str, name: str = "") -> Optional[dict]:
+    """The manifest as a dict, see `load.Manifest`."""
+    if name:
+        filename = Path(base_dir) / "manifests" / lang / f"{name}.json"
+    else:
+        filename = Path(base_dir) / "manifests" / f"{lang}.json"
+    try:
+        return json.loads(filename.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def count_lines(filename: str) -> int:
+    """The number of records of a JSONL file, without parsing them."""
+    if not os.path.exists(filename):
+        return 0
+    count = 0
+    with open(filename, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(b"//"):
+                count += 1
+    return count
+
+
+def count_cookies(filename: str) -> int:
+    """The number of cookies of a fortune file, i.e. the `%` separators."""
+    if not os.path.exists(filename):
+        return 0
+    with open(filename, "rb") as f:
+        return f.read().count(b"\n%\n")
+
+
+def load_jar_names(task_file: str) -> List[tuple]:
+    """The (lang, name) of the jars in the task file."""
+    jars = []
+    with open(task_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("//"):
+                # ignore empty lines and comments
+                continue
+            jar = json.loads(line)
+            if jar.get("name"):
+                jars.append((jar.get("lang", ""), jar["name"]))
+    return jars
+
+
+def load_stats(jars: List[tuple], base_dir: str) -> dict:
+    """The stats of the jars from their manifests, or from the line counts of
+    their outputs if they have no manifest."""
+    statistics = {}
+    for lang, name in jars:
+        if lang not in statistics:
+            manifest = load_manifest(base_dir, lang)
+            statistics[lang] = {
+                "lang": lang,
+                "crawled": 0,
+                "tier1": manifest["tier1"]
+                if manifest
+                else count_cookies(str(Path(base_dir) / "tier1" / lang)),
+                "tier2": 0,
+                "bytes": manifest.get("sizes", {}).get("tier1", 0) if manifest else 0,
+                "histogram": [0] * 11,
+                "jars": [],
+            }
+        lang_stats = statistics[lang]
+        manifest = load_manifest(base_dir, lang, name)
+        if manifest:
+            crawled, tier2 = manifest["crawled"], manifest["tier2"]
+            lang_stats["bytes"] += manifest.get("sizes", {}).get("tier2", 0)
+            for i, count in enumerate(manifest.get("histogram", [])):
+                lang_stats["histogram"][i] += count
+        else:
+            location = Path(base_dir) / "raw"
+            crawled = count_lines(str(location / "crawled" / lang / f"{name}.jsonl"))
+            tier2 = count_lines(str(location / "processed" / lang / f"{name}.jsonl"))
+        lang_stats["crawled"] += crawled
+        lang_stats["tier2"] += tier2
+        lang_stats["jars"].append({"name": name, "crawled": crawled, "tier2": tier2})
+    return statistics
+
+
+def get_metric(snapshot: dict, name: str) -> List[tuple]:
+    """The (labels, value) of a metric of a `common.metrics` snapshot."""
+    metric = snapshot.get(name) or {"values": []}
+    return [(item["labels"], item["value"]) for item in metric["values"]]
+
+
+def get_stats(snapshot: dict) -> dict:
+    """The stats of the jars of a run, from the snapshot of its metrics."""
+    statistics = {}
+    jars = {}
+    for labels, value in get_metric(snapshot, "jar_cookies"):
+        lang = labels["lang"]
+        if lang not in statistics:
+            statistics[lang] = {
+                "lang": lang,
+                "crawled": 0,
+                "tier1": 0,
+                "tier2": 0,
+                "jars": [],
+            }
+        statistics[lang][labels["kind"]] += int(value)
+        if (lang, labels["jar"]) not in jars:
+            jar = {"name": labels["jar"], "crawled": 0, "tier2": 0}
+            jars[(lang, labels["jar"])] = jar
+            statistics[lang]["jars"].append(jar)
+        jars[(lang, labels["jar"])][labels["kind"]] += int(value)
+    for labels, value in get_metric(snapshot, "tier1_cookies"):
+        if labels["lang"] in statistics:
+            statistics[labels["lang"]]["tier1"] = int(value)
+    return statistics
+
+
+def fill_skipped_stats(
+    stats: dict, snapshot: dict, jars: List[tuple], base_dir: str
+) -> dict:
+    """Fills the stats of the languages of a run whose tier1 wasn't built, e.g.
+    all their jars were up to date, from their manifests."""
+    built = {labels["lang"] for labels, _ in get_metric(snapshot, "tier1_cookies")}
+    skipped = [(lang, name) for lang, name in jars if lang not in built]
+    stats.update(load_stats(skipped, base_dir))
+    return stats
+
+
+def get_percent(part: int, total: int) -> float:
+    return part / total * 100 if total else 0.0
+
+
+def get_quantile(buckets: List[float], value: dict, q: float) -> float:
+    """The upper bound of the histogram bucket holding the quantile `q`."""
+    rank = q * value["count"]
+    seen = 0
+    for bound, count in zip(buckets, value["buckets"]):
+        seen += count
+        if seen >= rank:
+            return bound
+    return buckets[-1]
+
+
+def show_stats(stats: dict):
+    print()
+    print("## Statistics")
+    print()
+
+    if len(stats) == 0:
+        print("No stats available.")
+        return
+
+    num_jars = 0
+    num_crawled = 0
+    num_tier1 = 0
+    num_tier2 = 0
+
+    print("### Details")
+    print()
+    print("| lang | jars | crawled |      tier2      |     tier1      |")
+    print("|------|------|---------|-----------------|----------------|")
+    for lang, lang_stats in stats.items():
+        num_jars += len(lang_stats["jars"])
+        num_crawled += lang_stats["crawled"]
+        num_tier1 += lang_stats["tier1"]
+        num_tier2 += lang_stats["tier2"]
+        # print(f"lang: [{lang}],\t jars: {len(lang_stats['jars'])},\t crawled: {lang_stats['crawled']:5},\t tier2: {lang_stats['tier2']:5} [{lang_stats['tier2']/lang_stats['crawled']*100:.1f}%],\t tier1: {lang_stats['tier1']:4}")
+        print(
+            f"| {lang:4} | {len(lang_stats['jars']):4} | {lang_stats['crawled']:6}  | {lang_stats['tier2']:6} ({get_percent(lang_stats['tier2'], lang_stats['crawled']):4.1f}%)  | {lang_stats['tier1']:5} ({get_percent(lang_stats['tier1'], lang_stats['tier2']):4.1f}%)  |"
+        )
+
+    print()
+    print("### Summary")
+    print()
+    # print(f"Total langs:\t {len(stats):5}\t[{', '.join(stats.keys())}]")
+    # print(f"Total jars:\t {num_jars:5}")
+    # print(f"Total crawled:\t {num_crawled:5}")
+    # print(f"Total tier2:\t {num_tier2:5}\t[{num_tier2/num_crawled*100:.1f}%]")
+    # print(f"Total tier1:\t {num_tier1:5}")
+
+    flags_by_langs = {
+        "de": "🇩🇪",
+        "en": "🇺🇸",
+        "es": "🇪🇸",
+        "fr": "🇫🇷",
+        "it": "🇮🇹",
+        "ja": "🇯🇵",
+        "ko": "🇰🇷",
+        "ru": "🇷🇺",
+        "zh": "🇨🇳",
+    }
+
+    flags = "".join([flags_by_langs[lang] for lang in stats.keys()])
+
+    print(f"|    title      |  count  |           notes          |")
+    print("|---------------|---------|--------------------------|")
+    print(f"| Total langs   | {len(stats):6}  | {flags} |")
+    print(f"| Total jars    | {num_jars:6}  |                          |")
+    print(f"| Total crawled | {num_crawled:6}  |                          |")
+    print(
+        f"| Total tier2   | {num_tier2:6}  |         ({get_percent(num_tier2, num_crawled):4.1f}%)          |"
+    )
+    print(
+        f"| Total tier1   | {num_tier1:6}  |         ({get_percent(num_tier1, num_tier2):4.1f}%)          |"
+    )
+    print()
+
+
+def show_usage(report: dict, top: int = 10):
+    if not report or not report.get("by_model"):
+        return
+
+    print("### LLM Usage")
+    print()
+    print(
+        "| model                          |  calls  | cache hits | retries | fallbacks | parse failures | hedges (won) | prompt tokens | cached tokens | completion tokens | latency (s) |  cost ($) |"
+    )
+    print(
+        "|--------------------------------|---------|------------|---------|-----------|----------------|--------------|---------------|---------------|-------------------|-------------|-----------|"
+    )
+    for row in report["by_model"]:
+        hedges = f"{row.get('hedges', 0)} ({row.get('hedge_wins', 0)})"
+        print(
+            f"| {row['model']:30} | {row['calls']:6}  | {row['cache_hits']:9}  | {row['retries']:6}  | {row['fallbacks']:8}  | {row['parse_failures']:13}  | {hedges:>11}  | {row['prompt_tokens']:12}  | {row.get('cached_tokens', 0):12}  | {row['completion_tokens']:16}  | {row['latency']:10.1f}  | {row['cost']:8.3f}  |"
+        )
+    print()
+
+    print(f"### Top {top} jars by cost")
+    print()
+    print(
+        "| lang | jar                            | model                          |  calls  | latency (s) |  cost ($) |"
+    )
+    print(
+        "|------|--------------------------------|--------------------------------|---------|-------------|-----------|"
+    )
+    for row in report["by_jar"][:top]:
+        print(
+            f"| {row['lang']:4} | {row['jar']:30} | {row['model']:30} | {row['calls']:6}  | {row['latency']:10.1f}  | {row['cost']:8.3f}  |"
+        )
+    print()
+
+
+def show_pool(report: dict):
+    if not report or not report.get("models"):
+        return
+
+    print("### Model Pool")
+    print()
+    print(
+        f"Models: {report['models_created']} created, {report['models_reused']} reused; "
+        f"chains: {report['chains_created']} created, {report['chains_reused']} reused."
+    )
+    print()
+    print("| model                          | in-flight peak |")
+    print("|--------------------------------|----------------|")
+    for model, peak in report["in_flight_peak"].items():
+        print(f"| {model:30} | {peak:13}  |")
+    print()
+    print("| endpoint                       | connections |")
+    print("|--------------------------------|-------------|")
+    for endpoint, connections in report["http_connections"].items():
+        print(
+            f"| {endpoint:30} | {connections:4} / {report['http_max_connections']:4} |"
+        )
+    print()
+
+
+def show_single_flight(report: dict):
+    if not report:
+        return
+
+    print("### Coalesced Calls")
+    print()
+    print("| name       |  calls  | coalesced |")
+    print("|------------|---------|-----------|")
+    for name, counters in report.items():
+        print(f"| {name:10} | {counters['calls']:6}  | {counters['coalesced']:8}  |")
+    print()
+
+
+def show_stages(report: List[dict]):
+    if not report:
+        return
+
+    print("### Stages")
+    print()
+    print(
+        "| stage      | workers | processed | dropped | failed | busy (s) | cpu (s) | items/s | queue peak |"
+    )
+    print(
+        "|------------|---------|-----------|---------|--------|----------|---------|---------|------------|"
+    )
+    for row in report:
+        rate = row["processed"] / row["elapsed"] if row.get("elapsed") else 0
+        print(
+            f"| {row['stage']:10} | {row['workers']:6}  | {row['processed']:8}  | {row['dropped']:6}  | {row['failed']:5}  | {row['busy']:7.1f}  | {row.get('cpu', 0):6.1f}  | {rate:6.2f}  | {row['queue_peak']:9}  |"
+        )
+    print()
+
+
+def show_metrics(snapshot: dict):
+    http = {}
+    for labels, value in get_metric(snapshot, "http_requests"):
+        key = "cached" if labels["cached"] == "True" else labels["status"]
+        http[key] = http.get(key, 0) + int(value)
+    total = sum(http.values())
+    if total:
+        print("### HTTP")
+        print()
+        print("| requests | cached | errors | hit ratio |")
+        print("|----------|--------|--------|-----------|")
+        print(
+            f"| {total:8} | {http.get('cached', 0):6} | {http.get('error', 0):6} | {http.get('cached', 0) / total * 100:8.1f}% |"
+        )
+        print()
+
+    latency = snapshot.get("llm_latency_seconds")
+    if latency and latency["values"]:
+        buckets = latency["buckets"]
+        print("### LLM latency")
+        print()
+        print(
+            "| model                          | calls | mean (s) | p50 (s) | p95 (s) |"
+        )
+        print(
+            "|--------------------------------|-------|----------|---------|---------|"
+        )
+        for labels, value in get_metric(snapshot, "llm_latency_seconds"):
+            mean = value["sum"] / value["count"] if value["count"] else 0
+            print(
+                f"| {labels['model']:30} | {value['count']:5} | {mean:8.2f} | {get_quantile(buckets, value, 0.5):7} | {get_quantile(buckets, value, 0.95):7} |"
+            )
+        print()
+
+
+def show_scores(stats: dict):
+    if not any(sum(lang_stats.get("histogram", [])) for lang_stats in stats.values()):
+        return
+
+    print("### Scores")
+    print()
+    print("| lang | " + " | ".join(f"{i:5}" for i in range(11)) + " |   size (KB) |")
+    print("|------|" + "|".join(["-------"] * 11) + "|-------------|")
+    for lang, lang_stats in stats.items():
+        histogram = lang_stats.get("histogram") or [0] * 11
+        print(
+            f"| {lang:4} | "
+            + " | ".join(f"{count:5}" for count in histogram)
+            + f" | {lang_stats.get('bytes', 0) / 1024:10.1f}  |"
+        )
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "task_file",
+        type=str,
+        nargs="?",
+        help="Path to the task file.",
+        default="tasks.jsonl",
+    )
+    parser.add_argument(
+        "output_path",
+        type=str,
+        nargs="?",
+        default="cookies",
+        help="Path to the output cookie file.",
+    )
+    args = parser.parse_args()
+
+    stats = load_stats(load_jar_names(args.task_file), args.output_path)
+    show_stats(stats)
+    show_scores(stats)
+    usage_file = Path(args.output_path) / "reports" / "usage.json"
+    if usage_file.exists():
+        show_usage(json.loads(usage_file.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,38 @@
-# ruff: noqa: F401
-from .filter import FilterByLength, FilterByRank, FilterByScore, Sorter
-from .opencc import ChineseConverter
-from .scorer import Scorer
-from .transformer import Transformer
+from common.registry import Registry, attach
+
+# the transformers by class name, imported when first used: e.g. the scorer
+# imports the langchain stack, the Chinese converter OpenCC
+transformers = Registry(
+    "transformer",
+    {
+        "ChineseConverter": "transform.opencc:ChineseConverter",
+        "Deduplicator": "transform.dedup:Deduplicator",
+        "FilterByLength": "transform.filter:FilterByLength",
+        "FilterByRank": "transform.filter:FilterByRank",
+        "FilterByScore": "transform.filter:FilterByScore",
+        "PreScorer": "transform.prescorer:PreScorer",
+        "Scorer": "transform.scorer:Scorer",
+        "Sorter": "transform.filter:Sorter",
+    },
+)
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    {
+        "CookieBatch": ".columnar",
+        "DedupIndex": ".dedup",
+        "Deduplicator": ".dedup",
+        "FilterByLength": ".filter",
+        "FilterByRank": ".filter",
+        "FilterByScore": ".filter",
+        "Sorter": ".filter",
+        "ChineseConverter": ".opencc",
+        "PreScorer": ".prescorer",
+        "PreScorerModel": ".prescorer",
+        "train_prescorer": ".prescorer",
+        "Scorer": ".scorer",
+        "Transformer": ".transformer",
+        "chunked": ".transformer",
+        "pipe": ".transformer",
+    },
+)
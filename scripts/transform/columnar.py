@@ -0,0 +1,200 @@
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+from common import Score
+from common.model import ScoreEntry
+from common.record import DIMENSIONS
+
+WEIGHTS = np.array(
+    [Score.__private_attributes__["_weights"].default[dim] for dim in DIMENSIONS]
+)
+
+
+def get_codes(values: List[str], names: List[str]) -> np.ndarray:
+    """The index of each value in `names`, which is extended with the new
+    values."""
+    index = {name: i for i, name in enumerate(names)}
+    for value in values:
+        if value not in index:
+            index[value] = len(names)
+            names.append(value)
+    return np.array([index[value] for value in values], dtype=np.int32)
+
+
+def get_dimension(score, dim: str) -> float:
+    # a `ScoreEntry` in a `Score`, a float in a `ScoreRecord`
+    value = getattr(score, dim)
+    return value.score if isinstance(value, ScoreEntry) else value
+
+
+class CookieBatch:
+    """A columnar view of cookies, for the transformers to filter and rank
+    them with NumPy instead of a Python loop per cookie.
+
+    The rows (`Cookie` or `CookieRecord`) are kept in `cookies`, with the
+    columns at the same positions:
+    - `lengths`: the length of the content,
+    - `overall`: the overall score, NaN if not scored,
+    - `scores`: the score of each of `DIMENSIONS`, one row per cookie,
+    - `lang` and `jar`: codes into the `langs` and `jars` names.
+
+    The columns are computed once; the transformers return a new batch with
+    the rows and columns selected by a mask or an index.
+    """
+
+    def __init__(
+        self,
+        cookies: list,
+        lengths: np.ndarray,
+        overall: np.ndarray,
+        scores: np.ndarray,
+        lang: np.ndarray,
+        jar: np.ndarray,
+        langs: List[str],
+        jars: List[str],
+    ):
+        self.cookies = cookies
+        self.lengths = lengths
+        self.overall = overall
+        self.scores = scores
+        self.lang = lang
+        self.jar = jar
+        self.langs = langs
+        self.jars = jars
+
+    @staticmethod
+    def from_cookies(
+        cookies: Iterable,
+        lang: str = "",
+        jar: str = "",
+        langs: Optional[Sequence[str]] = None,
+        jars: Optional[Sequence[str]] = None,
+    ) -> "CookieBatch":
+        """The batch of the cookies, of the same `lang` and `jar`, or of the
+        `langs` and `jars` given per cookie."""
+        cookies = list(cookies)
+        count = len(cookies)
+        overall = np.full(count, np.nan)
+        scores = np.full((count, len(DIMENSIONS)), np.nan)
+        for i, cookie in enumerate(cookies):
+            score = cookie.score
+            if score is None:
+                continue
+            overall[i] = score.overall
+            scores[i] = [get_dimension(score, dim) for dim in DIMENSIONS]
+        lang_names: List[str] = []
+        jar_names: List[str] = []
+        return CookieBatch(
+            cookies,
+            np.fromiter(
+                (len(cookie.content) for cookie in cookies), dtype=np.int64, count=count
+            ),
+            overall,
+            scores,
+            get_codes(list(langs) if langs is not None else [lang] * count, lang_names),
+            get_codes(list(jars) if jars is not None else [jar] * count, jar_names),
+            lang_names,
+            jar_names,
+        )
+
+    @staticmethod
+    def concat(batches: Sequence["CookieBatch"]) -> "CookieBatch":
+        langs: List[str] = []
+        jars: List[str] = []
+        lang_codes, jar_codes = [], []
+        for batch in batches:
+            lang_codes.append(get_codes(batch.langs, langs)[batch.lang])
+            jar_codes.append(get_codes(batch.jars, jars)[batch.jar])
+        return CookieBatch(
+            [cookie for batch in batches for cookie in batch.cookies],
+            np.concatenate([batch.lengths for batch in batches]),
+            np.concatenate([batch.overall for batch in batches]),
+            np.concatenate([batch.scores for batch in batches]),
+            np.concatenate(lang_codes).astype(np.int32),
+            np.concatenate(jar_codes).astype(np.int32),
+            langs,
+            jars,
+        )
+
+    def __len__(self) -> int:
+        return len(self.cookies)
+
+    def take(self, index: np.ndarray) -> "CookieBatch":
+        """The rows selected by a boolean mask, or by their positions."""
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        return CookieBatch(
+            [self.cookies[i] for i in index],
+            self.lengths[index],
+            self.overall[index],
+            self.scores[index],
+            self.lang[index],
+            self.jar[index],
+            self.langs,
+            self.jars,
+        )
+
+    def select_rows(self, rows: list) -> "CookieBatch":
+        """The batch of the rows returned by a row-wise transformer, which
+        may have changed their content.
+
+        The rows of the batch keep their lang and jar. The new rows, e.g.
+        copies made by the transformer, take the lang and jar of the batch,
+        which must then have a single one of each.
+        """
+        positions = {id(cookie): i for i, cookie in enumerate(self.cookies)}
+        if all(id(row) in positions for row in rows):
+            index = np.array([positions[id(row)] for row in rows], dtype=np.int64)
+            return CookieBatch.from_cookies(
+                rows,
+                langs=[self.langs[code] for code in self.lang[index]],
+                jars=[self.jars[code] for code in self.jar[index]],
+            )
+        langs = {self.langs[code] for code in np.unique(self.lang)}
+        jars = {self.jars[code] for code in np.unique(self.jar)}
+        if len(langs) > 1 or len(jars) > 1:
+            raise ValueError(
+                "CookieBatch: new rows in a batch of several langs or jars"
+            )
+        return CookieBatch.from_cookies(
+            rows,
+            lang=langs.pop() if langs else "",
+            jar=jars.pop() if jars else "",
+        )
+
+    def rank_key(self) -> np.ndarray:
+        """The overall score, 0 if not scored, as in `rank_key`."""
+        return np.nan_to_num(self.overall, nan=0.0)
+
+    def top_k(self, k: int) -> np.ndarray:
+        """The positions of the top `k` rows by overall score, in descending
+        order, the earlier row first on ties: the same as a stable sort cut at
+        `k`, without sorting all the rows."""
+        key = self.rank_key()
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k >= len(key):
+            return np.argsort(-key, kind="stable")
+        kth = key[np.argpartition(-key, k - 1)[k - 1]]
+        above = np.flatnonzero(key > kth)
+        ties = np.flatnonzero(key == kth)[: k - len(above)]
+        index = np.sort(np.concatenate([above, ties]))
+        return index[np.argsort(-key[index], kind="stable")]
+
+    def weighted_score(self, weights: np.ndarray = WEIGHTS) -> np.ndarray:
+        """`Score.weighted_score` of every row, as a matrix-vector product;
+        NaN if not scored."""
+        return self.scores @ weights
+
+    def update_overall(self, weights: np.ndarray = WEIGHTS):
+        """`Score.update_overall` of every scored row."""
+        self.overall = self.weighted_score(weights)
+        for cookie, overall in zip(self.cookies, self.overall.tolist()):
+            if cookie.score is not None:
+                cookie.score.overall = overall
+
+    def get_lang(self, i: int) -> str:
+        return self.langs[self.lang[i]]
+
+    def get_jar(self, i: int) -> str:
+        return self.jars[self.jar[i]]
@@ -0,0 +1,165 @@
+import hashlib
+import random
+import threading
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from common import Cookie
+from pydantic import Field
+
+from .transformer import Transformer
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def normalize(text: str) -> str:
+    """Normalize the text for comparison: NFKC, case folding, and dropping all
+    whitespace, punctuation and symbols."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(
+        c for c in text if unicodedata.category(c)[0] not in ("P", "Z", "S", "C")
+    )
+
+
+def attribution(cookie: Cookie) -> Tuple[int, int]:
+    """The better attributed copy has more of author/title/source/link filled in."""
+    filled = sum(
+        1
+        for field in (cookie.author, cookie.title, cookie.source, cookie.link)
+        if field
+    )
+    return filled, len(cookie.author) + len(cookie.title) + len(cookie.source)
+
+
+class DedupIndex:
+    """Exact and MinHash/LSH near-duplicate index, shareable between threads.
+
+    Every cluster of duplicates is owned by one jar, and remembers the
+    attribution of the copy that jar kept.
+    """
+
+    def __init__(self, num_perm: int = 32, bands: int = 8, threshold: float = 0.8):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = random.Random(num_perm)
+        self.permutations = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self.lock = threading.Lock()
+        self.exact: Dict[str, int] = {}
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], List[int]] = {}
+        self.clusters: List[dict] = []
+
+    def signature(self, shingles: set) -> Tuple[int, ...]:
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+        return tuple(
+            min((a * h + b) % MERSENNE_PRIME for h in hashes)
+            for a, b in self.permutations
+        )
+
+    def similarity(self, sig1: Tuple[int, ...], sig2: Tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(sig1, sig2) if x == y) / self.num_perm
+
+    def band_keys(
+        self, signature: Tuple[int, ...]
+    ) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, signature[band * self.rows : (band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def find(self, key: str, signature: Tuple[int, ...]) -> Optional[int]:
+        if key in self.exact:
+            return self.exact[key]
+        for band_key in self.band_keys(signature):
+            for cluster_id in self.buckets.get(band_key, []):
+                cluster = self.clusters[cluster_id]
+                if self.similarity(signature, cluster["signature"]) >= self.threshold:
+                    return cluster_id
+        return None
+
+    def claim(
+        self,
+        key: str,
+        signature: Tuple[int, ...],
+        owner: str,
+        score: Tuple[int, int],
+    ) -> bool:
+        """Returns True if the copy should be kept by `owner`."""
+        with self.lock:
+            cluster_id = self.find(key, signature)
+            if cluster_id is None:
+                cluster_id = len(self.clusters)
+                self.clusters.append(
+                    {"signature": signature, "owner": owner, "score": score}
+                )
+                for band_key in self.band_keys(signature):
+                    self.buckets.setdefault(band_key, []).append(cluster_id)
+                self.exact[key] = cluster_id
+                return True
+
+            self.exact.setdefault(key, cluster_id)
+            cluster = self.clusters[cluster_id]
+            if cluster["owner"] == owner or cluster["score"] >= score:
+                return False
+            # a better attributed copy from another jar, keep it as well
+            cluster["owner"] = owner
+            cluster["score"] = score
+            return True
+
+
+class Deduplicator(Transformer):
+    lang: str = Field(default="", description="The language of the cookies.")
+    jar: str = Field(default="", description="The name of the jar owning the cookies.")
+    threshold: float = Field(
+        default=0.8, description="The estimated Jaccard similarity of near-duplicates."
+    )
+    num_perm: int = Field(default=32, description="The number of MinHash permutations.")
+    bands: int = Field(default=8, description="The number of LSH bands.")
+    shingle_size: int = Field(
+        default=4, description="The size of the character shingles."
+    )
+    index: Any = Field(
+        default=None,
+        description="The `DedupIndex` shared with other jars, e.g. the jars of a language in a build. If empty, only deduplicate within the given cookies.",
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.index is None:
+            self.index = DedupIndex(
+                num_perm=self.num_perm, bands=self.bands, threshold=self.threshold
+            )
+
+    def shingles(self, text: str) -> set:
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {
+            text[i : i + self.shingle_size]
+            for i in range(len(text) - self.shingle_size + 1)
+        }
+
+    def transform(self, cookies: List[Cookie]) -> List[Cookie]:
+        # claim the best attributed copies first
+        candidates = sorted(
+            range(len(cookies)),
+            key=lambda i: attribution(cookies[i]),
+            reverse=True,
+        )
+        kept = set()
+        for i in candidates:
+            text = normalize(cookies[i].content)
+            if not text:
+                kept.add(i)
+                continue
+            key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+            signature = self.index.signature(self.shingles(text))
+            if self.index.claim(key, signature, self.jar, attribution(cookies[i])):
+                kept.add(i)
+        return [cookie for i, cookie in enumerate(cookies) if i in kept]
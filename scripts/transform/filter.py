@@ -1,9 +1,12 @@
+import heapq
 from numbers import Number
-from typing import List
+from typing import Any, Callable, ClassVar, Iterable, Iterator, List
 
+import numpy as np
 from common import Cookie
 from pydantic import Field
 
+from .columnar import CookieBatch
 from .transformer import Transformer
 
 
@@ -13,12 +16,22 @@ class FilterByLength(Transformer):
         default=10000, description="The maximum length of the content."
     )
 
-    def transform(self, cookies: List[Cookie]) -> List[Cookie]:
-        return [
+    blocking: ClassVar[bool] = False
+
+    def stream(self, cookies: Iterable[Cookie]) -> Iterator[Cookie]:
+        return (
             cookie
             for cookie in cookies
             if self.min_length <= len(cookie.content) <= self.max_length
-        ]
+        )
+
+    def transform(self, cookies: List[Cookie]) -> List[Cookie]:
+        return list(self.stream(cookies))
+
+    def transform_batch(self, batch: CookieBatch) -> CookieBatch:
+        return batch.take(
+            (self.min_length <= batch.lengths) & (batch.lengths <= self.max_length)
+        )
 
 
 class FilterByScore(Transformer):
@@ -26,32 +39,59 @@ class FilterByScore(Transformer):
         default=5.0, description="The overall score threshold of the content."
     )
 
+    blocking: ClassVar[bool] = False
+
+    def stream(self, cookies: Iterable[Cookie]) -> Iterator[Cookie]:
+        return (cookie for cookie in cookies if self.score <= cookie.score.overall)
+
     def transform(self, cookies: List[Cookie]) -> List[Cookie]:
-        return [cookie for cookie in cookies if self.score <= cookie.score.overall]
+        return list(self.stream(cookies))
+
+    def transform_batch(self, batch: CookieBatch) -> CookieBatch:
+        # NaN, the cookies without a score, compares False
+        return batch.take(self.score <= batch.overall)
+
+
+def rank_key(cookie: Cookie) -> float:
+    return (
+        cookie.score.overall
+        if cookie.score and isinstance(cookie.score.overall, Number)
+        else 0
+    )
 
 
 class FilterByRank(Transformer):
     top: int = Field(default=100, description="Only keep the top ranked cookies.")
 
+    def select(
+        self, cookies: Iterable[Cookie], key: Callable[[Any], float] = rank_key
+    ) -> List[Cookie]:
+        """The top cookies by overall score, the earlier cookie first on ties.
+
+        The cookies are consumed lazily into a heap of `top` items, so the
+        memory doesn't grow with the input. The result is the same as a stable
+        sort in descending order cut at `top`. `key` reads the score of other
+        items, e.g. of the `LazyRecord`s of a JSONL file.
+        """
+        return heapq.nlargest(self.top, cookies, key=key)
+
+    def stream(self, cookies: Iterable[Cookie]) -> Iterator[Cookie]:
+        # blocking, but only holds a heap of `top` cookies
+        return iter(self.select(cookies))
+
     def transform(self, cookies: List[Cookie]) -> List[Cookie]:
-        # sort cookies by overall score
-        cookies.sort(
-            key=lambda cookie: cookie.score.overall
-            if cookie.score and isinstance(cookie.score.overall, Number)
-            else 0,
-            reverse=True,
-        )
-        return cookies[: self.top]
+        return self.select(cookies)
+
+    def transform_batch(self, batch: CookieBatch) -> CookieBatch:
+        return batch.take(batch.top_k(self.top))
 
 
 class Sorter(Transformer):
     reversed: bool = Field(default=True, description="Sort in reversed order.")
 
     def transform(self, cookies: List[Cookie]) -> List[Cookie]:
-        cookies.sort(
-            key=lambda cookie: cookie.score.overall
-            if cookie.score and isinstance(cookie.score.overall, Number)
-            else 0,
-            reverse=self.reversed,
-        )
-        return cookies
+        return sorted(cookies, key=rank_key, reverse=self.reversed)
+
+    def transform_batch(self, batch: CookieBatch) -> CookieBatch:
+        key = batch.rank_key()
+        return batch.take(np.argsort(-key if self.reversed else key, kind="stable"))
@@ -1,4 +1,4 @@
-from typing import Any, List
+from typing import Any, ClassVar, Iterable, Iterator, List
 
 from common import Cookie
 from opencc import OpenCC
@@ -12,6 +12,8 @@ class ChineseConverter(Transformer):
     config: str = Field(default="", description="The configuration for OpenCC.")
     converter: Any = None
 
+    blocking: ClassVar[bool] = False
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         if not self.config:
@@ -31,11 +33,14 @@ class ChineseConverter(Transformer):
     def convert(self, text):
         return self.converter.convert(text)
 
-    def transform(self, cookies: List[Cookie]) -> List[Cookie]:
+    def stream(self, cookies: Iterable[Cookie]) -> Iterator[Cookie]:
+        # the cookies are converted in place
         for cookie in cookies:
             cookie.content = self.convert(cookie.content)
             cookie.source = self.convert(cookie.source)
             cookie.title = self.convert(cookie.title)
             cookie.author = self.convert(cookie.author)
+            yield cookie
 
-        return cookies
+    def transform(self, cookies: List[Cookie]) -> List[Cookie]:
+        return list(self.stream(cookies))
@@ -0,0 +1,223 @@
+import json
+import math
+import random
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import ClassVar, Dict, Iterator, List, Optional, Tuple
+
+from common import Cookie
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from .transformer import Transformer
+
+
+class PreScorerModel(BaseModel):
+    """Logistic regression over hashed character n-grams, predicting whether the
+    LLM would score a cookie high enough to survive `FilterByScore`."""
+
+    n_features: int = Field(default=1 << 20, description="The hashing space size.")
+    ngram_range: Tuple[int, int] = Field(
+        default=(1, 3), description="The range of the character n-gram sizes."
+    )
+    weights: Dict[int, float] = Field(default={}, description="The sparse weights.")
+    bias: float = Field(default=0.0, description="The bias term.")
+    threshold: float = Field(
+        default=0.0, description="Drop the cookies with probability below it."
+    )
+
+    def features(self, cookie: Cookie) -> Dict[int, float]:
+        text = cookie.content.casefold()
+        counts: Dict[int, float] = {}
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i : i + n].encode("utf-8")) % self.n_features
+                counts[h] = counts.get(h, 0.0) + 1.0
+        norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+        features = {h: v / norm for h, v in counts.items()}
+        # meta features live in the reserved slots at the end of the space
+        meta = [
+            math.log1p(len(text)) / 10,
+            1.0 if cookie.author else 0.0,
+            1.0 if cookie.title else 0.0,
+            1.0 if cookie.source else 0.0,
+        ]
+        for i, value in enumerate(meta):
+            features[self.n_features + i] = value
+        return features
+
+    def decision(self, features: Dict[int, float]) -> float:
+        weights = self.weights
+        return self.bias + sum(weights.get(h, 0.0) * v for h, v in features.items())
+
+    def predict(self, cookie: Cookie) -> float:
+        z = self.decision(self.features(cookie))
+        return 1 / (1 + math.exp(-max(min(z, 30), -30)))
+
+    def fit(
+        self,
+        samples: List[Tuple[Cookie, int]],
+        epochs: int = 3,
+        learning_rate: float = 0.5,
+        l2: float = 1e-6,
+        seed: int = 42,
+    ):
+        positives = sum(label for _, label in samples) or 1
+        negatives = (len(samples) - positives) or 1
+        # balance the classes
+        class_weights = {
+            1: len(samples) / (2 * positives),
+            0: len(samples) / (2 * negatives),
+        }
+        data = [(self.features(cookie), label) for cookie, label in samples]
+        rng = random.Random(seed)
+        weights = dict(self.weights)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch)
+            for features, label in data:
+                z = self.bias + sum(
+                    weights.get(h, 0.0) * v for h, v in features.items()
+                )
+                p = 1 / (1 + math.exp(-max(min(z, 30), -30)))
+                g = (p - label) * class_weights[label] * rate
+                for h, v in features.items():
+                    w = weights.get(h, 0.0)
+                    weights[h] = w - g * v - rate * l2 * w
+                self.bias -= g
+        self.weights = {h: w for h, w in weights.items() if abs(w) > 1e-6}
+
+    def save(self, filename: str):
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(self.model_dump_json())
+
+    @staticmethod
+    def load(filename: str) -> "PreScorerModel":
+        with open(filename, "r", encoding="utf-8") as f:
+            return PreScorerModel.model_validate_json(f.read())
+
+
+@lru_cache(maxsize=8)
+def load_prescorer_model(filename: str) -> Optional[PreScorerModel]:
+    if not Path(filename).exists():
+        logger.warning(f"PreScorer: model {filename} not found, skipping pre-scoring.")
+        return None
+    return PreScorerModel.load(filename)
+
+
+def evaluate(
+    model: PreScorerModel,
+    samples: List[Tuple[Cookie, int]],
+    thresholds: Optional[List[float]] = None,
+) -> List[dict]:
+    """Precision/recall of the cookies passed on to the LLM, for every threshold."""
+    if thresholds is None:
+        thresholds = [i / 100 for i in range(0, 100, 5)]
+    predictions = [(model.predict(cookie), label) for cookie, label in samples]
+    positives = sum(label for _, label in predictions)
+    rows = []
+    for threshold in thresholds:
+        passed = [label for p, label in predictions if p >= threshold]
+        true_positives = sum(passed)
+        rows.append(
+            {
+                "threshold": threshold,
+                "passed": len(passed),
+                "dropped": len(predictions) - len(passed),
+                "precision": true_positives / len(passed) if passed else 0.0,
+                "recall": true_positives / positives if positives else 1.0,
+            }
+        )
+    return rows
+
+
+def load_training_samples(
+    base_dir: str, min_score: float = 6.5
+) -> Iterator[Tuple[Cookie, int]]:
+    """Labels the cookies with an LLM score, saved by the scorer of each jar: 1
+    if the score is at least `min_score`, otherwise 0. The cookies dropped
+    before the scoring, e.g. by the pre-scorer itself or the deduplication,
+    are not labelled."""
+    from load import Jsonl
+
+    scored_dir = Path(base_dir) / "raw" / "scored"
+    for scored_file in sorted(scored_dir.glob("*/*.jsonl")):
+        scored = Jsonl(name=scored_file.stem, location=str(scored_file.parent))
+        for cookie in scored.iter():
+            yield cookie, 1 if cookie.score.overall >= min_score else 0
+
+
+def train_prescorer(
+    base_dir: str,
+    model_file: str,
+    report_file: str,
+    target_recall: float = 0.98,
+    min_score: float = 6.5,
+    epochs: int = 3,
+) -> PreScorerModel:
+    samples = list(load_training_samples(base_dir, min_score=min_score))
+    if not samples:
+        raise ValueError(f"PreScorer: no training samples found in {base_dir}")
+    # deterministic 80/20 split by content
+    train, test = [], []
+    for cookie, label in samples:
+        bucket = zlib.crc32(cookie.content.encode("utf-8")) % 5
+        (test if bucket == 0 else train).append((cookie, label))
+    logger.info(
+        f"PreScorer: training on {len(train)} cookies, evaluating on {len(test)} cookies"
+    )
+
+    model = PreScorerModel()
+    model.fit(train, epochs=epochs)
+    rows = evaluate(model, test)
+    # the highest threshold still keeping the target recall
+    candidates = [row for row in rows if row["recall"] >= target_recall]
+    chosen = (
+        max(candidates, key=lambda row: row["threshold"]) if candidates else rows[0]
+    )
+    model.threshold = chosen["threshold"]
+    model.save(model_file)
+
+    report = {
+        "train": len(train),
+        "test": len(test),
+        "positives": sum(label for _, label in samples),
+        "target_recall": target_recall,
+        "min_score": min_score,
+        "chosen": chosen,
+        "thresholds": rows,
+    }
+    Path(report_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.info(
+        f"PreScorer: threshold {chosen['threshold']:.2f} => recall {chosen['recall']:.3f}, precision {chosen['precision']:.3f}, dropped {chosen['dropped']}/{len(test)}"
+    )
+    return model
+
+
+class PreScorer(Transformer):
+    model_file: str = Field(
+        default="", description="The model file trained by `train_prescorer`."
+    )
+    threshold: Optional[float] = Field(
+        default=None,
+        description="Override the threshold chosen at training time; higher drops more cookies.",
+    )
+
+    # each cookie is predicted on its own, a chunk at a time
+    blocking: ClassVar[bool] = False
+
+    def transform(self, cookies: List[Cookie]) -> List[Cookie]:
+        model = load_prescorer_model(self.model_file) if self.model_file else None
+        if not model:
+            return cookies
+        threshold = model.threshold if self.threshold is None else self.threshold
+        results = [cookie for cookie in cookies if model.predict(cookie) >= threshold]
+        logger.debug(
+            f"PreScorer: {len(cookies) - len(results)} / {len(cookies)} cookies rejected"
+        )
+        return results
@@ -1,6 +1,12 @@
-from typing import List
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, List, Optional, TextIO
 
-from common import Agent, Cookie, Score
+from common import Agent, BatchJob, Cookie, Score, get_batch_backend
+from common.batch import BATCH_STATUS_COMPLETED, BatchBackend
+from common.record import CookieRecord, ScoreRecord, to_cookie
+from loguru import logger
 from pydantic import Field
 
 from .transformer import Transformer
@@ -22,25 +28,217 @@ class Scorer(Transformer):
     batch_size: int = Field(
         default=10, description="The batch size for processing the content."
     )
+    mode: str = Field(
+        default="interactive",
+        description="'interactive' invokes the model directly, 'batch' submits request files through `batch_backend`.",
+    )
+    batch_backend: str = Field(
+        default="local", description="The batch backend, e.g. 'local' or 'openai'."
+    )
+    batch_dir: str = Field(
+        default=".cache/batches",
+        description="The directory for the batch request and result files.",
+    )
+    metadata: dict = Field(
+        default={},
+        description="The metadata passed to the agent for usage accounting, e.g. 'lang' and 'jar'.",
+    )
+    structured_output: bool = Field(
+        default=False,
+        description="Use the native structured output of the provider, see `Agent.structured_output`.",
+    )
+    prompt_layout: str = Field(
+        default="default",
+        description="The prompt layout, 'prefix_cache' for the prompt caching of the providers, see `Agent.prompt_layout`. The scorer prompt has no variables, so its messages, and the keys of the LLM cache, are the same in both layouts.",
+    )
+    hedge: str = Field(
+        default="",
+        description="Hedge the slow calls with 'fallback' model or another 'base' model call, see `Agent.hedge`.",
+    )
+    checkpoint_file: str = Field(
+        default="",
+        description="If set, scored cookies are appended to this JSONL file as they complete, and reused when the scoring is restarted after an interruption.",
+    )
+    scored_file: str = Field(
+        default="",
+        description="If set, the cookies of the checkpoint, i.e. those with an LLM score, are saved to this JSONL file once the outputs are, e.g. to train the pre-scorer.",
+    )
 
-    def score(self, cookies: List[Cookie]) -> List[Cookie]:
-        agent = Agent(
+    def get_agent(self) -> Agent:
+        return Agent(
             prompt=self.prompt,
             base_model=self.model_name,
             fallback_model=self.model_name_fallback,
             cls=Cookie,
             batch_size=self.batch_size,
+            metadata={"stage": "scorer", **self.metadata},
+            structured_output=self.structured_output,
+            prompt_layout=self.prompt_layout,
+            hedge=self.hedge,
         )
 
-        results = agent.process([cookie.model_dump_json() for cookie in cookies])
+    def get_content(self, cookie: Cookie) -> str:
+        return to_cookie(cookie).model_dump_json()
+
+    @staticmethod
+    def assign_score(cookie: Cookie, score: Score):
+        if isinstance(cookie, CookieRecord):
+            cookie.score = ScoreRecord.from_score(score)
+        else:
+            cookie.score = score
+
+    def set_score(self, cookie: Cookie, result) -> Cookie:
+        if isinstance(result, Cookie) and result.score:
+            result.score.update_overall()
+            self.assign_score(cookie, result.score)
+        else:
+            self.assign_score(cookie, Score())
+        return cookie
+
+    def get_checkpoint_stamp(self) -> str:
+        """The hash of the agent settings the scores depend on, e.g. the models
+        and the prompt, written first in the checkpoint."""
+        key = repr(self.get_agent().get_chain_key())
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def iter_checkpoint(self) -> Iterator[Cookie]:
+        """The scored cookies of the checkpoint; a checkpoint of other settings
+        is removed."""
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return
+        with open(self.checkpoint_file, "r", encoding="utf-8") as f:
+            try:
+                stamp = json.loads(f.readline())["stamp"]
+            except (ValueError, KeyError, TypeError):
+                stamp = None
+            if stamp == self.get_checkpoint_stamp():
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        cookie = Cookie.model_validate_json(line)
+                    except ValueError:
+                        # the last line might be incomplete after an interruption
+                        continue
+                    if cookie.score:
+                        yield cookie
+                return
+        logger.info(
+            f"Scorer: {self.checkpoint_file} scored with other settings, removed"
+        )
+        os.remove(self.checkpoint_file)
 
-        for i, result in enumerate(results):
-            if result and result.score:
-                result.score.update_overall()
-                cookies[i].score = result.score
+    def load_checkpoint(self) -> Dict[str, Score]:
+        return {cookie.content: cookie.score for cookie in self.iter_checkpoint()}
+
+    def open_checkpoint(self) -> Optional[TextIO]:
+        """The checkpoint opened for appending, stamped if new, if any."""
+        if not self.checkpoint_file:
+            return None
+        os.makedirs(os.path.dirname(self.checkpoint_file) or ".", exist_ok=True)
+        f = open(self.checkpoint_file, "a", encoding="utf-8")
+        if not f.tell():
+            f.write(json.dumps({"stamp": self.get_checkpoint_stamp()}) + "\n")
+        return f
+
+    @staticmethod
+    def write_checkpoint(f: Optional[TextIO], cookie: Cookie, result):
+        # only the cookies with an LLM score
+        if f and isinstance(result, Cookie) and result.score:
+            f.write(to_cookie(cookie).model_dump_json() + "\n")
+            f.flush()
+
+    def score_stream(self, cookies: List[Cookie]) -> Iterator[Cookie]:
+        """Yields the scored cookies in completion order."""
+        scores = self.load_checkpoint()
+        pending = []
+        for cookie in cookies:
+            if cookie.content in scores:
+                self.assign_score(cookie, scores[cookie.content])
+                yield cookie
             else:
-                cookies[i].score = Score()
+                pending.append(cookie)
+        if scores:
+            logger.debug(
+                f"Scorer: {len(cookies) - len(pending)} / {len(cookies)} cookies restored from {self.checkpoint_file}"
+            )
+
+        f = self.open_checkpoint()
+        try:
+            results = self.get_agent().process_stream(
+                self.get_content(cookie) for cookie in pending
+            )
+            for i, result in results:
+                cookie = self.set_score(pending[i], result)
+                self.write_checkpoint(f, cookie, result)
+                yield cookie
+        finally:
+            if f:
+                f.close()
+
+    def score(self, cookies: List[Cookie]) -> List[Cookie]:
+        if self.mode != "batch":
+            # the cookies are scored in place
+            for _ in self.score_stream(cookies):
+                pass
+            return cookies
+
+        job = self.submit_batch(cookies)
+        status = (
+            self.get_backend().wait(job.batch_id)
+            if job.batch_id
+            else BATCH_STATUS_COMPLETED
+        )
+        return self.collect_batch(cookies, job, status)
+
+    def get_backend(self) -> BatchBackend:
+        return get_batch_backend(
+            self.batch_backend, self.model_name, work_dir=self.batch_dir
+        )
+
+    def submit_batch(self, cookies: List[Cookie]) -> BatchJob:
+        """Submits the cookies to the batch backend, see `poll_batch`."""
+        contents = [self.get_content(cookie) for cookie in cookies]
+        return self.get_agent().submit_batch_file(contents, self.get_backend())
+
+    def poll_batch(self, job: BatchJob) -> str:
+        """The status of the batch, polled once: the caller decides how to
+        wait, e.g. the pipeline frees the worker between the polls."""
+        if not job.batch_id:
+            # all the responses were cached
+            return BATCH_STATUS_COMPLETED
+        return self.get_backend().poll(job.batch_id)
+
+    def collect_batch(
+        self, cookies: List[Cookie], job: BatchJob, status: str
+    ) -> List[Cookie]:
+        """Scores the cookies with the results of the batch, once done."""
+        results = self.get_agent().collect_batch_file(job, self.get_backend(), status)
+        f = self.open_checkpoint()
+        try:
+            for cookie, result in zip(cookies, results):
+                self.set_score(cookie, result)
+                self.write_checkpoint(f, cookie, result)
+        finally:
+            if f:
+                f.close()
         return cookies
 
     def transform(self, cookies: List[Cookie]) -> List[Cookie]:
         return self.score(cookies)
+
+    def finalize(self):
+        # the scores are in the processed JSONL now, the checkpoint is only
+        # needed until then
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return
+        if self.scored_file:
+            # the last score of a content, e.g. collected again by a retry
+            cookies = {cookie.content: cookie for cookie in self.iter_checkpoint()}
+            os.makedirs(os.path.dirname(self.scored_file) or ".", exist_ok=True)
+            with open(self.scored_file, "w", encoding="utf-8") as f:
+                for cookie in cookies.values():
+                    f.write(cookie.model_dump_json() + "\n")
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
@@ -0,0 +1,93 @@
+import random
+
+import numpy as np
+import pytest
+from common import Cookie, Score
+from common.model import ScoreEntry
+from common.record import to_records
+from transform import (
+    CookieBatch,
+    FilterByLength,
+    FilterByRank,
+    FilterByScore,
+    Sorter,
+)
+
+
+def make_cookies(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    cookies = []
+    for i in range(count):
+        score = Score(
+            **{
+                dim: ScoreEntry(score=rng.randint(0, 10))
+                for dim in ("popularity", "quality", "sentiment", "clarity")
+            }
+        )
+        score.update_overall()
+        cookies.append(Cookie(content="x" * rng.randint(1, 20) + str(i), score=score))
+    cookies.append(Cookie(content="not scored"))
+    return cookies
+
+
+def test_vectorized_transformers_match_the_row_transformers():
+    cookies = to_records(make_cookies(500))
+    for transformer in [
+        FilterByLength(min_length=5, max_length=15),
+        FilterByScore(score=6),
+        FilterByRank(top=50),
+        FilterByRank(top=1000),
+        Sorter(),
+        Sorter(reversed=False),
+    ]:
+        expected = transformer.transform(
+            [cookie for cookie in cookies if cookie.score]
+            if isinstance(transformer, FilterByScore)
+            else list(cookies)
+        )
+        batch = transformer.transform_batch(CookieBatch.from_cookies(cookies))
+        assert batch.cookies == expected, transformer
+        assert batch.lengths.tolist() == [len(cookie.content) for cookie in expected]
+
+
+def test_cookie_batch_columns():
+    en = CookieBatch.from_cookies(make_cookies(10, seed=1), lang="en", jar="a")
+    zh = CookieBatch.from_cookies(make_cookies(5, seed=2), lang="zh", jar="b")
+    batch = CookieBatch.concat([en, zh])
+    assert len(batch) == 17
+    assert [batch.get_lang(i) for i in (0, 10, 11)] == ["en", "en", "zh"]
+    assert [batch.get_jar(i) for i in (0, 16)] == ["a", "b"]
+
+    # weighted_score as a matrix-vector product
+    expected = [c.score.weighted_score() for c in batch.cookies if c.score]
+    weighted = batch.weighted_score()
+    assert np.allclose(weighted[~np.isnan(weighted)], expected)
+
+    # re-weighted, written back to the rows
+    batch.update_overall(np.array([1.0, 0, 0, 0]))
+    top = FilterByRank(top=3).transform_batch(batch)
+    assert [c.score.overall for c in top.cookies] == sorted(
+        (c.score.popularity.score for c in batch.cookies if c.score), reverse=True
+    )[:3]
+
+    # a row-wise transformer keeps the jar of each row
+    rows = Sorter(reversed=False).transform(list(batch.cookies))
+    rows = batch.select_rows(rows)
+    assert rows.get_jar(0) == "a" and rows.get_lang(0) == "en"
+
+
+def test_select_rows_with_new_rows():
+    cookies = make_cookies(5)
+    batch = CookieBatch.from_cookies(cookies, lang="zh", jar="a")
+    # e.g. converted copies of the rows
+    rows = [cookie.model_copy(update={"content": "new"}) for cookie in cookies[:3]]
+    selected = batch.select_rows(rows)
+    assert selected.cookies == rows
+    assert selected.lengths.tolist() == [3, 3, 3]
+    assert {selected.get_lang(i) for i in range(3)} == {"zh"}
+    assert {selected.get_jar(i) for i in range(3)} == {"a"}
+    # the lang and jar of a new row is ambiguous in a mixed batch
+    mixed = CookieBatch.concat([batch, CookieBatch.from_cookies(cookies, jar="b")])
+    with pytest.raises(ValueError):
+        mixed.select_rows(rows)
+    assert len(mixed.select_rows(mixed.cookies[:2])) == 2
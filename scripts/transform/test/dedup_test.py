@@ -0,0 +1,47 @@
+from common import Cookie
+from transform import DedupIndex, Deduplicator
+
+
+def test_dedup_exact_and_near_duplicates():
+    cookies = [
+        Cookie(content="The only way to do great work is to love what you do."),
+        Cookie(
+            content="The only way to do great work is to love what you do!",
+            author="Steve Jobs",
+        ),
+        Cookie(content="THE ONLY WAY TO DO GREAT WORK IS TO LOVE WHAT YOU DO"),
+        Cookie(content="The only way to do great work, is to love what you do ..."),
+        Cookie(content="The only way to do great work is to love what you doo."),
+        Cookie(content="Less is more."),
+    ]
+    results = Deduplicator().transform(cookies)
+    assert [cookie.content for cookie in results] == [
+        "The only way to do great work is to love what you do!",
+        "Less is more.",
+    ]
+
+
+def test_dedup_across_jars():
+    index = DedupIndex()
+    art = Deduplicator(jar="Art", index=index)
+    love = Deduplicator(jar="Love", index=index)
+
+    cookie = Cookie(content="Love conquers all.", source="Virgil")
+    assert art.transform([cookie]) == [cookie]
+    # the same quote with worse attribution is dropped
+    assert love.transform([Cookie(content="Love conquers all!")]) == []
+    # a better attributed copy is kept
+    cookie = Cookie(content="love conquers all", source="Virgil", title="Eclogues")
+    assert love.transform([cookie]) == [cookie]
+
+
+def test_dedup_keeps_distinct_cookies():
+    cookies = [
+        Cookie(content="Art is long, life is short."),
+        Cookie(content="Art is long and life is short."),
+        Cookie(content="Less is more."),
+        Cookie(content="Knowledge is power."),
+        Cookie(content="床前明月光，疑是地上霜。"),
+        Cookie(content="举头望明月，低头思故乡。"),
+    ]
+    assert Deduplicator().transform(cookies) == cookies
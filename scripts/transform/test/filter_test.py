@@ -0,0 +1,47 @@
+import random
+
+from common import Cookie, Score
+from transform import FilterByLength, FilterByRank, FilterByScore, pipe
+
+
+def test_filter_by_rank_is_a_stable_top_k():
+    rng = random.Random(0)
+    cookies = [
+        Cookie(content=f"cookie {i}", score=Score(overall=rng.randint(0, 5)))
+        for i in range(200)
+    ]
+    cookies.append(Cookie(content="not scored"))
+    expected = sorted(
+        cookies,
+        key=lambda cookie: cookie.score.overall if cookie.score else 0,
+        reverse=True,
+    )[:20]
+    assert FilterByRank(top=20).transform(cookies) == expected
+    # any iterable, consumed lazily
+    assert FilterByRank(top=20).select(iter(cookies)) == expected
+
+
+def test_streaming_transformers_are_lazy():
+    pulled = []
+
+    def source():
+        for i in range(10_000):
+            pulled.append(i)
+            yield Cookie(content="x" * (i % 10), score=Score(overall=i % 7))
+
+    transformers = [FilterByLength(min_length=3), FilterByScore(score=4)]
+    assert not any(transformer.blocking for transformer in transformers)
+    stream = pipe(transformers, source())
+    first = next(stream)
+    assert (len(first.content), first.score.overall) == (4, 4)
+    assert len(pulled) == 5
+
+    # a blocking transformer consumes its input, into a heap of `top` cookies
+    top = list(pipe(transformers + [FilterByRank(top=3)], source()))
+    assert len(pulled) == 5 + 10_000
+    assert [cookie.score.overall for cookie in top] == [6, 6, 6]
+    # the same result as the list-based transformers
+    cookies = list(source())
+    for transformer in transformers + [FilterByRank(top=3)]:
+        cookies = transformer.transform(cookies)
+    assert cookies == top
@@ -0,0 +1,130 @@
+import json
+import math
+import random
+
+from common import Cookie, Score
+from load import Jsonl
+from transform import PreScorer
+from transform.prescorer import (
+    PreScorerModel,
+    evaluate,
+    load_training_samples,
+    train_prescorer,
+)
+
+GOOD = ["wisdom", "courage", "patience", "kindness", "truth", "virtue"]
+BAD = ["click", "subscribe", "discount", "login", "cookie policy", "advert"]
+
+
+def make_cookies(rng: random.Random, words, count: int, prefix: str):
+    return [
+        Cookie(
+            content=f"{prefix} {i}: " + " ".join(rng.choices(words, k=6)),
+            author="someone" if words is GOOD else "",
+        )
+        for i in range(count)
+    ]
+
+
+def write_jar(base_dir: str, seed: int = 0):
+    """A jar of good and bad cookies, scored high and low by the LLM, but the
+    last bad ones, dropped before the scoring."""
+    rng = random.Random(seed)
+    good = make_cookies(rng, GOOD, 60, "good")
+    bad = make_cookies(rng, BAD, 60, "bad")
+    scored = [
+        cookie.model_copy(update={"score": Score(overall=8)}) for cookie in good
+    ] + [cookie.model_copy(update={"score": Score(overall=3)}) for cookie in bad[:50]]
+    rng.shuffle(scored)
+    Jsonl(name="jar", location=f"{base_dir}/raw/scored/en").save(scored)
+    return good, bad
+
+
+def test_features_are_hashed_and_normalized():
+    model = PreScorerModel(n_features=1 << 10)
+    cookie = Cookie(content="Hello World", author="someone")
+    features = model.features(cookie)
+    assert features == model.features(Cookie(content="hello world", author="x"))
+    ngrams = {h: v for h, v in features.items() if h < model.n_features}
+    assert math.isclose(sum(v * v for v in ngrams.values()), 1.0)
+    # the meta features are in the reserved slots after the hashing space
+    meta = [features[model.n_features + i] for i in range(4)]
+    assert meta == [math.log1p(len("hello world")) / 10, 1.0, 0.0, 0.0]
+    assert len(features) == len(ngrams) + 4
+
+
+def test_load_training_samples(tmp_path):
+    good, bad = write_jar(str(tmp_path))
+    samples = dict(
+        (cookie.content, label)
+        for cookie, label in load_training_samples(str(tmp_path), min_score=6.5)
+    )
+    assert all(samples[cookie.content] == 1 for cookie in good)
+    assert all(samples[cookie.content] == 0 for cookie in bad[:50])
+    # the cookies without an LLM score are not labelled
+    assert len(samples) == len(good) + 50
+
+
+class FixedModel(PreScorerModel):
+    probabilities: dict = {}
+
+    def predict(self, cookie: Cookie) -> float:
+        return self.probabilities[cookie.content]
+
+
+def test_evaluate():
+    model = FixedModel(probabilities={"a": 0.9, "b": 0.6, "c": 0.4, "d": 0.1})
+    samples = [
+        (Cookie(content="a"), 1),
+        (Cookie(content="b"), 0),
+        (Cookie(content="c"), 1),
+        (Cookie(content="d"), 0),
+    ]
+    rows = evaluate(model, samples, thresholds=[0.0, 0.5, 0.95])
+    assert rows == [
+        {"threshold": 0.0, "passed": 4, "dropped": 0, "precision": 0.5, "recall": 1.0},
+        {"threshold": 0.5, "passed": 2, "dropped": 2, "precision": 0.5, "recall": 0.5},
+        {"threshold": 0.95, "passed": 0, "dropped": 4, "precision": 0.0, "recall": 0.0},
+    ]
+
+
+def test_train_prescorer(tmp_path):
+    base_dir = str(tmp_path)
+    write_jar(base_dir)
+    model_file = str(tmp_path / "models" / "prescorer.json")
+    report_file = str(tmp_path / "models" / "report.json")
+    model = train_prescorer(base_dir, model_file, report_file, target_recall=0.98)
+    # deterministic
+    again = train_prescorer(
+        base_dir, str(tmp_path / "again.json"), report_file, target_recall=0.98
+    )
+    assert again.weights == model.weights
+    assert PreScorerModel.load(model_file) == model
+
+    report = json.loads((tmp_path / "models" / "report.json").read_text())
+    assert report["train"] + report["test"] == 110
+    assert report["positives"] == 60
+    # the highest threshold keeping the target recall
+    chosen = report["chosen"]
+    assert chosen["recall"] >= 0.98
+    assert model.threshold == chosen["threshold"]
+    assert all(
+        row["threshold"] <= chosen["threshold"]
+        for row in report["thresholds"]
+        if row["recall"] >= 0.98
+    )
+
+    # the unseen cookies are separated
+    rng = random.Random(1)
+    good = make_cookies(rng, GOOD, 20, "new good")
+    bad = make_cookies(rng, BAD, 20, "new bad")
+    kept = PreScorer(model_file=model_file).transform(good + bad)
+    assert all(cookie in kept for cookie in good)
+    assert len([cookie for cookie in kept if cookie in bad]) < len(bad) / 2
+
+
+def test_prescorer_skips_without_model(tmp_path):
+    cookies = [Cookie(content="content")]
+    missing = str(tmp_path / "missing.json")
+    assert PreScorer(model_file=missing).transform(cookies) == cookies
+    assert PreScorer().transform(cookies) == cookies
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+from common import Agent, Cookie, Score, usage_tracker
+from common.mock import MockChatModel
+from transform import Scorer
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """The contents sent to the mock models; those with 'slow' answer last."""
+    contents = []
+    simulate = MockChatModel.simulate
+
+    def patched(self, messages, json_mode=False):
+        content = messages[-1].content
+        contents.append(content)
+        _, result = simulate(self, messages, json_mode)
+        return (0.2 if "slow" in content else 0), result
+
+    monkeypatch.setattr(MockChatModel, "simulate", patched)
+    return contents
+
+
+def make_agent(batch_size: int) -> Agent:
+    return Agent(
+        prompt="Score the content.",
+        cls=Cookie,
+        base_model="mock:stream?cache=0",
+        fallback_model="mock:stream-fallback?cache=0",
+        batch_size=batch_size,
+    )
+
+
+CONTENTS = [Cookie(content=text).model_dump_json() for text in ("slow", "a", "b")]
+
+
+def check_results(results):
+    assert sorted(i for i, _ in results) == [0, 1, 2]
+    for i, result in results:
+        assert result.content == Cookie.model_validate_json(CONTENTS[i]).content
+
+
+def test_process_stream_yields_in_completion_order(sent):
+    results = list(make_agent(batch_size=3).process_stream(iter(CONTENTS)))
+    check_results(results)
+    assert results[-1][0] == 0
+
+    # one call in flight: the input order
+    results = list(make_agent(batch_size=1).process_stream(iter(CONTENTS)))
+    assert [i for i, _ in results] == [0, 1, 2]
+
+
+def test_aprocess_stream_yields_in_completion_order(sent):
+    async def collect(agent):
+        return [item async for item in agent.aprocess_stream(iter(CONTENTS))]
+
+    results = asyncio.run(collect(make_agent(batch_size=3)))
+    check_results(results)
+    assert results[-1][0] == 0
+
+    results = asyncio.run(collect(make_agent(batch_size=1)))
+    assert [i for i, _ in results] == [0, 1, 2]
+
+
+def test_aprocess_stream_coalesces_identical_calls(sent):
+    async def collect(agent):
+        return [item async for item in agent.aprocess_stream([CONTENTS[0]] * 3)]
+
+    results = asyncio.run(collect(make_agent(batch_size=3)))
+    # sent once, every caller gets its own copy of the result
+    assert sent == [CONTENTS[0]]
+    assert sorted(i for i, _ in results) == [0, 1, 2]
+    assert all(result.content == "slow" for _, result in results)
+    assert len({id(result) for _, result in results}) == 3
+
+
+def make_scorer(checkpoint_file: str, **options) -> Scorer:
+    return Scorer(
+        model_name="mock:scorer?cache=0",
+        model_name_fallback="mock:scorer-fallback?cache=0",
+        batch_size=1,
+        checkpoint_file=checkpoint_file,
+        **options,
+    )
+
+
+def test_scorer_resumes_from_checkpoint(sent, tmp_path):
+    checkpoint_file = tmp_path / "scoring" / "jar.jsonl"
+    cookies = [Cookie(content=f"quote {i}") for i in range(3)]
+
+    # interrupted after the first cookie
+    stream = make_scorer(str(checkpoint_file)).score_stream(cookies)
+    first = next(stream)
+    stream.close()
+    assert first.content == "quote 0"
+    # the stamp of the settings, then the scored cookie
+    assert len(checkpoint_file.read_text().splitlines()) == 2
+
+    sent.clear()
+    scored_file = tmp_path / "scored" / "jar.jsonl"
+    scorer = make_scorer(str(checkpoint_file), scored_file=str(scored_file))
+    restarted = [Cookie(content=f"quote {i}") for i in range(3)]
+    scored = scorer.score(restarted)
+    assert restarted[0].score == first.score
+    assert all(cookie.score and cookie.score.overall > 0 for cookie in scored)
+    # only the cookies missing from the checkpoint are sent again
+    assert [Cookie.model_validate_json(content).content for content in sent] == [
+        "quote 1",
+        "quote 2",
+    ]
+
+    # the checkpoint is kept until the outputs are saved
+    assert len(checkpoint_file.read_text().splitlines()) == 4
+    scorer.finalize()
+    assert not checkpoint_file.exists()
+    # the cookies with an LLM score are kept, e.g. for the pre-scorer
+    kept = [Cookie.model_validate_json(line) for line in scored_file.open()]
+    assert [cookie.score for cookie in kept] == [cookie.score for cookie in scored]
+
+
+def test_scorer_prefix_cache_layout():
+    options = {
+        "model_name": "mock:prefix?cache=0",
+        "model_name_fallback": "mock:prefix-fallback?cache=0",
+    }
+    scorer = Scorer(prompt_layout="prefix_cache", **options)
+    cookies = [Cookie(content=f"quote {i}", score=Score(overall=7)) for i in range(3)]
+    scored = scorer.score(cookies)
+    assert all(cookie.score.overall > 0 for cookie in scored)
+
+    agent = scorer.get_agent()
+    template = agent.get_prompt_template(agent.get_parser())
+    default = Scorer(**options).get_agent()
+    default_template = default.get_prompt_template(default.get_parser())
+    for cookie in cookies:
+        content = scorer.get_content(cookie)
+        messages = template.format_messages(content=content)
+        # the same prefix for every cookie
+        assert messages[0].content == agent.get_prefix(agent.get_parser())
+        # the same messages as the default layout, so the LLM cache is kept
+        assert content == Scorer(**options).get_content(cookie)
+        assert messages == default_template.format_messages(content=content)
+
+    entry = next(
+        e
+        for e in usage_tracker.aggregate("model")
+        if e["model"] == "mock:prefix?cache=0"
+    )
+    assert entry["cached_tokens"] > 0
+
+
+def test_scorer_ignores_checkpoint_of_other_settings(sent, tmp_path):
+    checkpoint_file = tmp_path / "scoring" / "jar.jsonl"
+    cookies = [Cookie(content=f"quote {i}") for i in range(2)]
+    make_scorer(str(checkpoint_file)).score(cookies)
+
+    sent.clear()
+    scorer = make_scorer(str(checkpoint_file), structured_output=True)
+    scorer.score([Cookie(content=f"quote {i}") for i in range(2)])
+    # all scored again, the checkpoint only holds the new scores
+    assert len(sent) == 2
+    assert len(scorer.load_checkpoint()) == 2
+    assert len(checkpoint_file.read_text().splitlines()) == 3
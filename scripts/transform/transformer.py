@@ -1,9 +1,56 @@
-from typing import List
+from itertools import islice
+from typing import ClassVar, Iterable, Iterator, List
 
 from common import Cookie
 from pydantic import BaseModel
 
+from .columnar import CookieBatch
+
+
+def chunked(cookies: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(cookies)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
 
 class Transformer(BaseModel):
+    """Transforms a list of cookies with `transform`, or a stream of cookies
+    with `stream`.
+
+    A blocking transformer needs all the cookies before it yields the first
+    one, e.g. to rank them, so its stream buffers the input. The others handle
+    each chunk of `chunk_size` cookies on its own, so the cookies flow through
+    them in bounded memory; the stateless ones stream cookie by cookie.
+    """
+
+    blocking: ClassVar[bool] = True
+    chunk_size: ClassVar[int] = 1000
+
     def transform(self, cookies: List[Cookie]) -> List[Cookie]:
         raise NotImplementedError
+
+    def stream(self, cookies: Iterable[Cookie]) -> Iterator[Cookie]:
+        if self.blocking:
+            yield from self.transform(list(cookies))
+            return
+        for chunk in chunked(cookies, self.chunk_size):
+            yield from self.transform(chunk)
+
+    def finalize(self):
+        """Called once the transformed cookies are saved, e.g. to remove the
+        files kept to resume an interrupted build."""
+
+    def transform_batch(self, batch: CookieBatch) -> CookieBatch:
+        """The vectorized `transform`; by default, `transform` of the rows."""
+        return batch.select_rows(self.transform(batch.cookies))
+
+
+def pipe(
+    transformers: List[Transformer], cookies: Iterable[Cookie]
+) -> Iterator[Cookie]:
+    """Chains the streams of the transformers; the cookies are only buffered
+    by the blocking ones."""
+    stream = iter(cookies)
+    for transformer in transformers:
+        stream = transformer.stream(stream)
+    return stream